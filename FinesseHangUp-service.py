@@ -6,6 +6,9 @@ import logging, datetime, time
 from pathlib import Path
 import datetime as datetime
 import random
+import ae_metrics
+
+METRICS_PORT = 9111
 
 
 
@@ -63,10 +66,24 @@ class finesse():
             logging.error("Failed to pull phone mac addresses from Database")
             return
 
+    def timed_request(self, session, step, method, url, **kwargs):
+        ''' session.request which records its latency and response code under step '''
+        started = time.time()
+        try:
+            response = session.request(method, url, **kwargs)
+        except:
+            ae_metrics.FINESSE_REQUESTS.inc(step=step, code='error')
+            raise
+        finally:
+            ae_metrics.FINESSE_REQUEST_LATENCY.observe(time.time() - started, step=step)
+        ae_metrics.FINESSE_REQUESTS.inc(step=step, code=str(response.status_code))
+        return response
+
     def update_user_state(self,user,agent_state):
         try:
             self.col_agents.find_one_and_update({"username": '{0}'.format(user)}, {
             "$set": {'agent_state': '{0}'.format(agent_state)}})
+            ae_metrics.AGENT_STATE_CHANGES.inc(state='{0}'.format(agent_state))
         except:
             logging.error("Failed to update {0} agent state".format(user))
         return
@@ -93,7 +110,7 @@ class finesse():
             sso_token_url_1 = '{0}:8445/desktop/sso/token?cc_username={1}&return_refresh_token=true'.format(
                 self.finnese_url, user)
             logging.debug("First Request to Finesse - URL = {0}".format(sso_token_url_1))
-            r1 = s.request("GET", "{0}".format(sso_token_url_1), verify=False)
+            r1 = self.timed_request(s, 'sso_token', "GET", "{0}".format(sso_token_url_1), verify=False)
             logging.debug("R1 response - code = {0}".format(r1.status_code))
             if r1.status_code == 200:
                 for h in r1.headers:
@@ -115,7 +132,7 @@ class finesse():
                 logging.debug("Second Request to SSO - URL = {0}".format(r1_sso_redirect_url))
                 logging.debug("Body = {0}".format(payload))
                 logging.debug('Headers = {0}'.format(headers))
-                r2 = s.request('POST', r1_sso_redirect_url, headers=headers, data=payload)
+                r2 = self.timed_request(s, 'sso_login', 'POST', r1_sso_redirect_url, headers=headers, data=payload)
                 logging.debug("R2 response - code = {0}".format(r2.status_code))
                 if r2.status_code == 200:
                     for h in r2.headers:
@@ -137,7 +154,7 @@ class finesse():
                     logging.debug("Third Request to SSO - URL = {0}".format(r2_sso_redirect_url))
                     logging.debug("Body = {0}".format(r3_payload))
                     logging.debug('Headers = {0}'.format(r3_headers))
-                    r3 = s.request("POST", "{0}".format(r2_sso_redirect_url), data=r3_payload,
+                    r3 = self.timed_request(s, 'saml_response', "POST", "{0}".format(r2_sso_redirect_url), data=r3_payload,
                                         headers=r3_headers,
                                         verify=False)
                     logging.debug("R3 response - code = {0}".format(r3.status_code))
@@ -155,7 +172,7 @@ class finesse():
                         r4_payload = {'uniqueId': r3uniqueId}
                         logging.debug("Fourth Request to SSO - URL = {0}".format(r4_relay_url))
                         logging.debug("Body = {0}".format(r4_payload))
-                        r4 = s.request("POST", '{0}'.format(r4_relay_url), data=r4_payload, verify=False)
+                        r4 = self.timed_request(s, 'token_relay', "POST", '{0}'.format(r4_relay_url), data=r4_payload, verify=False)
                         logging.debug("R4 response - code = {0}".format(r4.status_code))
                         if r4.status_code == 200:
                             for h in r4.headers:
@@ -211,11 +228,11 @@ class finesse():
             logging.debug("URL = {0}".format(url))
             logging.debug("Headers = {0}".format(headers))
             logging.debug("payload = {0}".format(login_payload))
-            r1 = s.request("PUT", "{0}".format(url), data=login_payload, headers=headers, verify=False)
+            r1 = self.timed_request(s, 'login', "PUT", "{0}".format(url), data=login_payload, headers=headers, verify=False)
             logging.debug("R1 response - code = {0}".format(r1.status_code))
             if r1.status_code == 202:
                 logging.debug('Agent {0} is logged in - lets go ready'.format(user_info['username']))
-                r2 = s.request("PUT", "{0}".format(url), data=ready_payload, headers=headers, verify=False)
+                r2 = self.timed_request(s, 'ready', "PUT", "{0}".format(url), data=ready_payload, headers=headers, verify=False)
                 logging.debug("R1 response - code = {0}".format(r2.status_code))
                 if r2.status_code == 202:
                     logging.debug("Agent is in the ready state")
@@ -247,11 +264,11 @@ class finesse():
             logging.debug("URL = {0}".format(url))
             logging.debug("Headers = {0}".format(headers))
             logging.debug("payload = {0}".format(notready_payload))
-            r1 = s.request("PUT", "{0}".format(url), data=notready_payload, headers=headers, verify=False)
+            r1 = self.timed_request(s, 'not_ready', "PUT", "{0}".format(url), data=notready_payload, headers=headers, verify=False)
             logging.debug("R1 response - code = {0}".format(r1.status_code))
             if r1.status_code == 202:
                 logging.debug('Agent {0} is now Not-Ready'.format(user_info['username']))
-                r2 = s.request("PUT", "{0}".format(url), data=logout_payload, headers=headers, verify=False)
+                r2 = self.timed_request(s, 'logout', "PUT", "{0}".format(url), data=logout_payload, headers=headers, verify=False)
                 logging.debug("R1 response - code = {0}".format(r2.status_code))
                 if r2.status_code == 202:
                     logging.debug("Agent is now Logged out")
@@ -304,7 +321,7 @@ class finesse():
                                'Content-Type': 'application/xml'}
                     logging.debug("URL = {0}".format(url))
                     logging.debug("Headers = {0}".format(headers))
-                    r1 = s.request("GET", "{0}".format(url), headers=headers ,verify=False)
+                    r1 = self.timed_request(s, 'dialogs', "GET", "{0}".format(url), headers=headers ,verify=False)
                     logging.debug("R1 response - code = {0}".format(r1.status_code))
                     if r1.status_code == 200 or r1.status_code == 202:
                         logging.debug("Received Ok, but we need to check for actual dialog")
@@ -333,7 +350,7 @@ class finesse():
                                     logging.debug("Current call exceeds {0} total allowed call time, time to drop it. {1} > {2}".format(call_length_timer,datetime.datetime.now(),drop_call_time))
                                     r2_payload = '<Dialog><targetMediaAddress>{0}</targetMediaAddress><requestedAction>DROP</requestedAction></Dialog>'.format(user_info['dn'])
                                     r2_url = "{0}:8445/finesse/api/Dialog/{1}".format(self.finnese_url,dialog_id)
-                                    r2 = s.request("PUT", '{0}'.format(r2_url), data=r2_payload, headers=headers, verify=False)
+                                    r2 = self.timed_request(s, 'drop_call', "PUT", '{0}'.format(r2_url), data=r2_payload, headers=headers, verify=False)
                                     if r2.status_code == 200 or r2.status_code == 202:
                                         logging.debug("Confirmed Drop Call")
                                         # Clear the call in DB only after received Drop call success
@@ -392,6 +409,10 @@ class finesse():
 
 #######
 if __name__ == "__main__":
+        try:
+            ae_metrics.start_http_server(METRICS_PORT)
+        except:
+            logging.error("Failed to start the metrics endpoint on port {0}".format(METRICS_PORT))
         fin = finesse()
         fin.agent_monitor()
 
@@ -4,6 +4,10 @@ import subprocess, math
 import sys
 from pymongo import MongoClient
 import time
+import functools
+import ae_metrics
+
+METRICS_PORT = 9110
 
 
 __file__ = 'loadgen_{0}.log'.format(time.strftime("%m-%d-%Y"))
@@ -27,7 +31,9 @@ class AllEventListener(EventListener):
     def on_event(event,**kwargs):
         logging.debug('Event',event)
 
-def callback_response(response):
+def callback_response(response, action=None, sent=None):
+    if sent is not None:
+        ae_metrics.AMI_ACTION_LATENCY.observe(time.time() - sent, action=action)
     logging.debug(response)
 
 
@@ -73,7 +79,9 @@ def asteris_call():
             logging.debug("The sleep timer is {0} seconds per call".format(cpmsleeptimer))
             while currentcallcount <= int(calls['cpm']):
                 logging.debug("Placing {0} call".format(currentcallcount))
-                call = ast_client.send_action(action,callback=callback_response)
+                call = ast_client.send_action(action,callback=functools.partial(
+                    callback_response, action='Originate', sent=time.time()))
+                ae_metrics.CALLS_ORIGINATED.inc(context='{0}'.format(calls['context']))
                 #logging.debug(call)
                 time.sleep(cpmsleeptimer)
                 currentcallcount = currentcallcount + 1
@@ -84,6 +92,10 @@ def asteris_call():
 
 
 if __name__ == '__main__':
+    try:
+        ae_metrics.start_http_server(METRICS_PORT)
+    except:
+        logging.error("Failed to start the metrics endpoint on port {0}".format(METRICS_PORT))
     try:
         ## Asterisk client connection
         ast_client = AMIClient(address='10.38.243.35',port=5038)
@@ -1,6 +1,9 @@
 import pymongo
-import logging, time
+import logging, time, zlib
 import camelot
+from camelot.events import EventType
+import ae_metrics
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 # Logging
@@ -29,6 +32,12 @@ class fun_db():
             logging.error("Failed to pull phone mac addresses from Database")
             return
 
+    def record_registration(self, phonemac, result):
+        try:
+            self.col_agents.update_one({'phonemac': phonemac}, {'$set': {'registration': result}})
+        except:
+            logging.error("Failed to record registration of {0} in Database".format(phonemac))
+
 class telephony():
 
     def __init__(self):
@@ -39,7 +48,18 @@ class telephony():
             self.camgroup2 = 5001
             self.camgroup3 = 5002
             self.camgroup4 = 5003
-            self.serv = camelot.create_camelot_server(self.camelotserver, self.camgroup1)
+            self.register_timeout = 30
+            self.phone_config = {'sip.phone.ip': self.camelotserver,
+                                 'sip.phone.httpip': self.ccmserver,
+                                 'sip.phone.modelnumber': '684',
+                                 'sip.protocol.reguseragenthdr': 'Cisco-CP8851/11.5.1'}
+            self.servers = {}
+            for camgroup in [self.camgroup1, self.camgroup2, self.camgroup3, self.camgroup4]:
+                try:
+                    self.servers[camgroup] = camelot.create_camelot_server(self.camelotserver, camgroup, pipelined=True, event_reactor=True)
+                except:
+                    logging.error("Failed to connect to Camelot group {0}".format(camgroup))
+            self.serv = self.servers.get(self.camgroup1)
         except:
             logging.error("Failed to to load telephony class")
         return
@@ -53,54 +73,140 @@ class telephony():
             if (stream['CallId'] == callref and stream['Direction'] == direction and stream['Type'] == type):
                 return stream['StrmID']
 
-    ''' Used for Event Callback'''
+    ''' Used for Event Callback, registered for the ccmreg station events only'''
 
-    def event_callbacks(self,event):
-        logging.debug("Received Event : %s" % event)
-        logging.debug("Received Event Type : %s" % event.event_type)
-        logging.debug("Received Event Sub_type: %s" % event.event_sub_type)
-        logging.debug("Received Event Message: %s" % event.message)
+    def event_callbacks(self,event,evtargs):
+        logging.debug("Received %s event of %s: %s", event.event_sub_type, event.endpoint_id, event.message)
         return ()
 
 
-    def register_phone(self,ephonemac):
+    ''' Creates and configures the endpoints of the phones on one Camelot group, the new_ep and the config
+        commands each go out as one batch. Returns {phonemac: endpoint, None when it failed}'''
+
+    def create_phones(self,ephonemacs,serv=None):
+        serv = serv or self.serv
+        try:
+            created = serv.create_new_endpoints('sipx', ephonemacs, config=self.phone_config)
+        except:
+            logging.error("Failed to create {0} endpoints".format(len(ephonemacs)))
+            return dict.fromkeys(ephonemacs)
+        eps = {}
+        for ephonemac, result in created.items():
+            ep = result['endpoint']
+            if ep is None:
+                logging.error("Failed to create {0}: {1}".format(ephonemac, result['error']))
+            elif result['config_errors']:
+                logging.error("Failed to configure {0}: {1}".format(ephonemac, result['config_errors']))
+                self.release_phone(ep)
+                ep = None
+            eps[ephonemac] = ep
+        return eps
+
+    ''' Takes the endpoint out of service and releases it on Camelot'''
+
+    def release_phone(self,ep):
+        for step in (ep.outofservice, ep.uninit, ep._release_ep):
+            try:
+                step()
+            except:
+                logging.error("Failed to {0} endpoint {1}".format(step.__name__, ep.ep_id))
+
+    ''' Returns (endpoint, seconds from ep.inservice() to the inservice state) once the phone is inservice,
+        (None, None) when it could not be registered'''
+
+    def register_phone(self,ep,ephonemac):
         try:
-            logging.debug("Lets get {0} registered - Started".format(ephonemac))
-            # Create Phone Endpoint
-            ep = self.serv.create_new_endpoint('sipx', ephonemac)
-            # Build Additional Phone elements
-            ep.config('sip.phone.ip', self.camelotserver)
-            ep.config('sip.phone.httpip', self.ccmserver)
-            ep.config('sip.phone.modelnumber', '684')
-            ep.config('sip.protocol.reguseragenthdr', 'Cisco-CP8851/11.5.1')
-            # Start call back for events at device level
-            ep.register_event_callback(self.event_callbacks)
-            __return__ = ep.start_info_events()
-            logging.debug("Start info events = {0}".format(__return__))
+            logging.debug("Lets get %s registered - Started", ephonemac)
+            # Call back for the registration events of the device, wait_for_state turns the state events on
+            ep.register_event_callback(self.event_callbacks, event_type=EventType.STATION_EVENT,
+                                       event_sub_type='ccmreg')
             __return__ = ep.start_station_events()
-            logging.debug("Start Station events = {0}".format(__return__))
+            logging.debug("Start Station events = %s", __return__)
             # Try to register device
             ep.set_client_data(ephonemac)
+            registered = ep.wait_for_state('inservice', timeout=self.register_timeout)
             ep.init()
+            started = time.time()
             ep.inservice()
-            # We need to wait for the phone to register
-            i = 5
-            while i >= 0 and "inservice" not in ep.get_info()['state']:
-                logging.debug("ep1 state -> {0}".format(ep.get_info()['state']))
-                time.sleep(3)
-                i = i - 1
-            ret = self.serv.get_endpoint(ephonemac)
-            logging.debug("Return from Ret = {0}".format(ret))
-            return(ep)
+            # We need to wait for the phone to register, the state events tell us when
+            state = registered.result()
+            time_to_inservice = time.time() - started
+            logging.debug("%s state -> %s", ephonemac, state)
+            return(ep, time_to_inservice)
         except:
             logging.error("Failed to register {0}".format(ephonemac))
-            return()
+            # don't leave the endpoint behind on Camelot
+            self.release_phone(ep)
+            return(None, None)
+
+
+''' Registers phones on all the Camelot groups, at most concurrency at a time'''
+
+class registration_engine():
+
+    def __init__(self, cam, db, concurrency=64):
+        self.cam = cam
+        self.db = db
+        self.concurrency = concurrency
+        self.camgroups = sorted(cam.servers)
+
+    def shard(self, phonemac):
+        # the same phone always goes to the same Camelot group
+        return self.camgroups[zlib.crc32(phonemac.encode()) % len(self.camgroups)]
+
+    def register(self, phonemac, ep):
+        camgroup = self.shard(phonemac)
+        time_to_inservice = None
+        if ep is not None:
+            ep, time_to_inservice = self.cam.register_phone(ep, phonemac)
+        result = {'camgroup': camgroup,
+                  'status': 'inservice' if ep else 'failed',
+                  'time_to_inservice': round(time_to_inservice, 3) if ep else None,
+                  'timestamp': time.time()}
+        self.db.record_registration(phonemac, result)
+        return result
+
+    def run(self, phonemacs):
+        if not self.camgroups:
+            logging.error("No Camelot group available, nothing registered")
+            return {}
+        results = {}
+        started = time.time()
+        groups = {}
+        for phonemac in phonemacs:
+            groups.setdefault(self.shard(phonemac), []).append(phonemac)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            # the endpoints of each group are created in bulk, then registered one by one
+            endpoints = {}
+            creates = [pool.submit(self.cam.create_phones, macs, self.cam.servers[camgroup])
+                       for camgroup, macs in groups.items()]
+            for future in as_completed(creates):
+                endpoints.update(future.result())
+            futures = {pool.submit(self.register, phonemac, endpoints.get(phonemac)): phonemac
+                       for phonemac in phonemacs}
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+        elapsed = time.time() - started
+        registered = [r for r in results.values() if r['status'] == 'inservice']
+        print("Registered {0}/{1} phones on {2} Camelot groups in {3:.1f}s - {4:.1f} registrations/sec".format(
+            len(registered), len(results), len(self.camgroups), elapsed, len(registered) / elapsed if elapsed else 0))
+        return results
+
 
+# Camelot command latency and event rates on :9112/metrics while registering
+ae_metrics.REGISTRY.register_collector(ae_metrics.collect_camelot)
+try:
+    ae_metrics.start_http_server(9112)
+except:
+    logging.error("Failed to start the metrics endpoint on port 9112")
 
 # Build Classes
 db_class = fun_db()
 cam = telephony()
 phone_mac = db_class.pull_phones()
+phonemacs = []
 for phones in phone_mac:
     logging.debug("Found {0} Phone Mac, lets get it registered".format(phones['phonemac']))
-    ephone = cam.register_phone(phones['phonemac'])
+    phonemacs.append(phones['phonemac'])
+engine = registration_engine(cam, db_class)
+engine.run(phonemacs)
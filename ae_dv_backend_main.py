@@ -1,7 +1,8 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flasgger import Swagger
 from flask_pymongo import PyMongo
 import logging,time
+import ae_metrics
 
 __file__ = 'loadgen_api_{0}.log'.format(time.strftime("%m-%d-%Y_%H"))
 logging.basicConfig(filename='/var/AgentEmulator/logs/{0}'.format(__file__), level=logging.DEBUG,
@@ -13,6 +14,7 @@ app = Flask(__name__, instance_relative_config=False)
 app.config["MONGO_URI"] = "mongodb://127.0.0.1:27017/aedb"
 mongo_client = PyMongo(app)
 db = mongo_client.db
+ae_metrics.REGISTRY.register_collector(ae_metrics.collect_agent_states(db['agents']))
 
 
 template= {
@@ -67,5 +69,16 @@ def loadgen():
     return(jsonify(loadgen_status))
 
 
+@app.route('/metrics')
+def metrics():
+    """
+    ---
+    responses:
+      200:
+        description: Agent Emulator metrics in the Prometheus text format
+    """
+    return Response(ae_metrics.REGISTRY.render(), content_type=ae_metrics.CONTENT_TYPE)
+
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0',port=8445,debug=True)
\ No newline at end of file
@@ -0,0 +1,386 @@
+'''
+Prometheus metrics for the Agent Emulator services.
+
+Every service keeps its metrics in the process wide REGISTRY and exposes
+them in the Prometheus text format (which OpenMetrics scrapers accept):
+
+* through the Flask app of ae_dv_backend_main.py on /metrics, or
+* standalone with start_http_server(port), e.g. from LoadGen-service.py.
+
+The services record:
+
+* ae_calls_originated_total - AMI Originate actions sent by LoadGen
+* ae_ami_action_latency_seconds - AMI action to response time
+* ae_finesse_request_latency_seconds - Finesse/SSO requests by step
+* ae_finesse_requests_total - Finesse/SSO requests by step and status
+* ae_agent_state_changes_total - agent state changes made by the services
+
+and the collectors add, on each scrape:
+
+* ae_agents - agents by state, read from MongoDB (collect_agent_states)
+* camelot_command_latency_seconds, camelot_command_errors_total,
+  camelot_events_total - from the Camelot servers of the process
+  (collect_camelot)
+
+To check an exporter locally:
+
+    python ae_metrics.py --port 9109 &
+    python ae_metrics.py --scrape http://127.0.0.1:9109/metrics
+'''
+import argparse
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+import logging
+import sys
+import threading
+import time
+from urllib.request import urlopen
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+                   30)
+
+
+def _escape(value):
+    return (str(value).replace('\\', '\\\\').replace('\n', '\\n')
+            .replace('"', '\\"'))
+
+
+def _labels_text(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, _escape(value))
+                             for name, value in labels)
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return repr(value)
+    return str(value)
+
+
+class Metric(object):
+    '''Base of the metric types, a value per combination of label values.
+    '''
+    TYPE = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError('{} expects labels {}, got {}'.format(
+                self.name, self.labelnames, sorted(labels)))
+        return tuple((name, labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        '''Returns (name, labels, value) of every sample.'''
+        with self._lock:
+            return [(self.name, key, value)
+                    for key, value in self._values.items()]
+
+
+class Counter(Metric):
+    TYPE = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    TYPE = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    TYPE = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, seconds, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1),
+                                             0.0]
+            entry[0][bisect_left(self.buckets, seconds)] += 1
+            entry[1] += seconds
+
+    def time(self, **labels):
+        '''Context manager which observes the time spent in its block.'''
+        return _Timer(self, labels)
+
+    def samples(self):
+        with self._lock:
+            values = [(key, list(counts), total)
+                      for key, (counts, total) in self._values.items()]
+        samples = []
+        for key, counts, total in values:
+            samples.extend(histogram_samples(self.name, key, self.buckets,
+                                             counts, total))
+        return samples
+
+
+def histogram_samples(name, labels, bounds, counts, total):
+    '''Returns the _bucket, _sum and _count samples of a histogram from the
+    count of every bucket (the last one being +Inf) and the sum.
+    '''
+    samples = []
+    cumulative = 0
+    for bound, count in zip(tuple(bounds) + (float('inf'),), counts):
+        cumulative += count
+        samples.append((name + '_bucket', labels + (('le', _number(bound)),),
+                        cumulative))
+    samples.append((name + '_sum', labels, total))
+    samples.append((name + '_count', labels, cumulative))
+    return samples
+
+
+class _Timer(object):
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.time() - self.start, **self.labels)
+        return False
+
+
+class Registry(object):
+    '''The metrics of a process and the collectors which produce metrics
+    when scraped. A collector is a function returning a list of
+    (name, type, documentation, samples).
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._collectors = []
+
+    def _add(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._add(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._add(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(),
+                  buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, collector):
+        with self._lock:
+            if collector not in self._collectors:
+                self._collectors.append(collector)
+
+    def collect(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        families = [(metric.name, metric.TYPE, metric.documentation,
+                     metric.samples()) for metric in metrics]
+        for collector in collectors:
+            try:
+                families.extend(collector())
+            except Exception:
+                logging.exception('metrics collector {} failed'.format(
+                    collector))
+        return families
+
+    def render(self):
+        '''Returns the metrics in the Prometheus text format.'''
+        lines = []
+        for name, metric_type, documentation, samples in self.collect():
+            lines.append('# HELP {} {}'.format(
+                name, documentation.replace('\n', ' ')))
+            lines.append('# TYPE {} {}'.format(name, metric_type))
+            for sample_name, labels, value in samples:
+                lines.append('{}{} {}'.format(
+                    sample_name, _labels_text(labels), _number(value)))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+CALLS_ORIGINATED = REGISTRY.counter(
+    'ae_calls_originated_total', 'Originate actions sent to Asterisk',
+    ['context'])
+AMI_ACTION_LATENCY = REGISTRY.histogram(
+    'ae_ami_action_latency_seconds',
+    'Time from sending an AMI action to its response', ['action'])
+FINESSE_REQUEST_LATENCY = REGISTRY.histogram(
+    'ae_finesse_request_latency_seconds',
+    'Latency of the Finesse and SSO requests', ['step'])
+FINESSE_REQUESTS = REGISTRY.counter(
+    'ae_finesse_requests_total', 'Finesse and SSO requests by response code',
+    ['step', 'code'])
+AGENT_STATE_CHANGES = REGISTRY.counter(
+    'ae_agent_state_changes_total', 'Agent state changes made', ['state'])
+
+
+def collect_agent_states(collection, field='agent_state'):
+    '''Returns a collector counting the agents of the MongoDB collection by
+    their state.
+
+    >>> REGISTRY.register_collector(collect_agent_states(db['agents']))
+    '''
+    def collector():
+        samples = [((('state', str(row['_id'])),), row['count'])
+                   for row in collection.aggregate(
+                       [{'$group': {'_id': '$' + field,
+                                    'count': {'$sum': 1}}}])]
+        return [('ae_agents', 'gauge', 'Agents by state',
+                 [('ae_agents', labels, count)
+                  for labels, count in samples])]
+    return collector
+
+
+def collect_camelot():
+    '''Collector for the command latency, command errors and event counts
+    of the Camelot servers created in this process.
+    '''
+    import camelot
+    from camelot.protocol.tcp.transport_stats import Histogram as CmdHistogram
+
+    bounds = [bound / 1000.0 for bound in CmdHistogram.BOUNDS_MS]
+    latency = []
+    errors = []
+    events = []
+    for serv in camelot.get_camelot_servers():
+        server = '{}:{}'.format(serv._ip, serv._port)
+        stats = serv.get_transport_stats()
+        for request, entry in stats['requests'].items():
+            labels = (('server', server), ('request', request))
+            total = entry['latency'].get('total')
+            if total:
+                counts = []
+                previous = 0
+                for bound in CmdHistogram.BOUNDS_MS + ('+Inf',):
+                    cumulative = total['buckets'][str(bound)]
+                    counts.append(cumulative - previous)
+                    previous = cumulative
+                latency.extend(histogram_samples(
+                    'camelot_command_latency_seconds', labels, bounds,
+                    counts, total['sum_ms'] / 1000.0))
+            for error, count in entry['errors'].items():
+                errors.append(('camelot_command_errors_total',
+                               labels + (('error', error),), count))
+        dispatch = serv.get_event_dispatch_stats()
+        received = dispatch.get('received', 0)
+        filtered = dispatch.get('filtered', 0)
+        events.append(('camelot_events_total',
+                       (('server', server), ('result', 'delivered')),
+                       received - filtered))
+        events.append(('camelot_events_total',
+                       (('server', server), ('result', 'filtered')),
+                       filtered))
+    return [('camelot_command_latency_seconds', 'histogram',
+             'Camelot command latency by request type', latency),
+            ('camelot_command_errors_total', 'counter',
+             'Camelot command errors by request type', errors),
+            ('camelot_events_total', 'counter',
+             'Camelot events read, delivered or filtered', events)]
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def start_http_server(port, addr='', registry=REGISTRY):
+    '''Serves the metrics on http://addr:port/metrics from a daemon thread.
+
+    :returns: the HTTPServer, shutdown() stops it
+    '''
+    class MetricsHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = _ThreadingHTTPServer((addr, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever,
+                              name='ae-metrics')
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def parse(text):
+    '''Parses the Prometheus text format, returns {(name, labels): value}.
+    Raises ValueError on a malformed line.
+    '''
+    samples = {}
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        name_labels, _, value = line.rpartition(' ')
+        if not name_labels:
+            raise ValueError('Malformed sample: {!r}'.format(line))
+        name, _, labels = name_labels.partition('{')
+        samples[(name, labels.rstrip('}'))] = float(value)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--port', type=int, default=9109,
+                        help='serve the metrics of this process')
+    parser.add_argument('--scrape', help='URL to scrape and check')
+    args = parser.parse_args()
+
+    if args.scrape:
+        text = urlopen(args.scrape, timeout=10).read().decode()
+        samples = parse(text)
+        print(text)
+        print('{} samples'.format(len(samples)))
+        return
+    start_http_server(args.port)
+    print('Serving metrics on :{}/metrics'.format(args.port))
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    sys.exit(main())
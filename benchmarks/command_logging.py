@@ -0,0 +1,77 @@
+'''
+Measures the commands/sec of Connection.execute_camelot_command with the
+camelot debug messages dropped (the enable_logging() default) and with a
+DEBUG handler attached.
+
+The connection is opened to the fake Camelot server
+(camelot.utils.fake_camelot_server) on 127.0.0.1 with the usual handshake,
+so the numbers are the client side cost of framing, logging and decoding a
+getinfo command over loopback.
+
+    python benchmarks/command_logging.py
+    python benchmarks/command_logging.py --commands 50000 --rounds 5
+'''
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import camelot  # noqa: E402
+from camelot import camlogger  # noqa: E402
+from camelot.encoder import encoder  # noqa: E402
+from camelot.protocol.tcp.camelot_connection import Connection  # noqa: E402
+from camelot.utils.fake_camelot_server import FakeCamelotServer  # noqa: E402
+from camelot.utils.vapi_ei_utils import VAPIEIUtils  # noqa: E402
+
+
+def open_connection(port):
+    conn_id = '127.0.0.1:%s' % port
+    conn = Connection('127.0.0.1', port, conn_id, VAPIEIUtils.CLIENT_VERSION)
+    conn.init_connection(conn_id)
+    return conn
+
+
+def run(conn, encoded, commands):
+    started = time.time()
+    for i in range(commands):
+        conn.execute_camelot_command(camelot.GET_INFO, encoded)
+    return time.time() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--commands', type=int, default=20000)
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    camlogger.enable_logging()
+    root_logger = logging.getLogger('camelot')
+    debug_handler = logging.FileHandler(os.devnull)
+    debug_handler.setLevel(logging.DEBUG)
+    debug_handler.setFormatter(logging.Formatter(
+        '[%(asctime)s] [%(name)s] [%(levelname)s] %(message)s'))
+
+    fake = FakeCamelotServer(('127.0.0.1', 0)).start()
+    serv = camelot.create_camelot_server('127.0.0.1', fake.port)
+    ep_id = serv.create_new_endpoint('sipv2', 'SEP000000000001').ep_id
+    encoded = encoder.encode_frame(camelot.GET_INFO, ep_id)
+    conn = open_connection(fake.port)
+    for label, handler in (('DEBUG off', None), ('DEBUG on', debug_handler)):
+        if handler:
+            root_logger.addHandler(handler)
+        best = None
+        for i in range(args.rounds):
+            elapsed = run(conn, encoded, args.commands)
+            best = elapsed if best is None else min(best, elapsed)
+        if handler:
+            root_logger.removeHandler(handler)
+        print('{:<10}: {:>8} commands {:>10.0f} commands/sec'.format(
+            label, args.commands, args.commands / best))
+    fake.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+'''
+Measures the responses/sec of the TCL brace list parsers of
+CamelotDecodeHelper against the character by character scanners they
+replaced, and checks that both give the same output.
+
+The responses are the getinfo, getcallinfo, getcallinfoext, getstreams and
+getstreaminfo answers of a connected sipv2 endpoint, or the ones of a file
+with one "request response" line each, e.g. taken from a camelot debug log.
+
+    python benchmarks/decode_helper.py
+    python benchmarks/decode_helper.py --responses 20000 --rounds 5
+    python benchmarks/decode_helper.py --recorded responses.txt
+'''
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import camelot  # noqa: E402
+from camelot.decoder.decode_helper import CamelotDecodeHelper  # noqa: E402
+
+RECORDED = [
+    (camelot.GET_INFO,
+     '{state inservice} {type sipv2} {description {}} '
+     '{{overall state} inservice} {{current login} {}} {lines 1} {calls 1} '
+     '{streams 2} {{primary cm} 10.20.1.21} {{backup cm} 10.20.1.22} '
+     '{status {}} {{registration error} {}} {{last error} {}} '
+     '{{delay offer} false} {{Voice Mail client status} {}} '
+     '{{primary cti} {}} {{backup cti} {}} {{current cti} {}} {id 1} '
+     '{userid agent0001} {{preferred mode} {}} {{call type} {}} '
+     '{domain {}} {{sip port} 5060} {ixenabled no} {esrstvernego {}} '
+     '{{login type} {}} {deploymentmodel on-premise} {privacy disabled} '
+     '{tlscipher {}} {{config version stamp} 1564157271-4cb0d3e6} '
+     '{{config file version refer response} 200} '
+     '{{register_supported} {{X-cisco-sis-10.0.0} {path} {replaces}}} '
+     '{voicepush_delete_code {}} {voicepush_token_code {}} '
+     '{register_callid 0050569d-a6710003-1b2e4f5a-7c3d9e01@10.12.10.113}'),
+    (camelot.GET_CALL_INFO,
+     '{{call reference} 0xf0424034} {{line reference} 1} {type outbound} '
+     '{state connected} {{sub state} {}} {{calling address} 7003} '
+     '{{calling name} {Agent 0001}} {{called address} 6001} '
+     '{{called name} {}} {{original called address} 6001} '
+     '{{original called name} {}} {{last redirecting address} {}} '
+     '{{start date} 06/11/2019} {{start time} 10:23:41:512} '
+     '{{setup time} 412} {{end time} {}} {{call duration} 00:02:17} '
+     '{{gcid} 0x4a3f2b1c} {{media control} inband} {{hold reversion} 0}'),
+    (camelot.GET_CALL_INFO_EXT,
+     '{{call reference} 0xf0424034} {{line reference} 1} {type outbound} '
+     '{state connected} {{calling address} 7003} {{called address} 6001} '
+     '{{start date} 06/11/2019} {{start time} 10:23:41:512} '
+     '{attribute {{resume disabled} {hold enabled} {transfer enabled}}} '
+     '{{holdreversionreq} {}} {{call duration} 00:02:17} '
+     '{{gcid} 0x4a3f2b1c} {{sip callid} 6a1f3c00-5cd15e3d-1b2-150a0c0a} '
+     '{{remote sdp} {}} {{security} {not authenticated}}'),
+    (camelot.GET_STREAMS,
+     '{0x0a57c898 0xf185a030 audio inbound open line} '
+     '{0x0a6e5328 0xf185a030 audio outbound open line} '
+     '{0x0a7d1a10 0xf185a030 video inbound open line} '
+     '{0x0a7e4b20 0xf185a030 video outbound open line}'),
+    (camelot.GET_STREAM_INFO,
+     '{address 10.12.10.113:45142} {{local_address} 10.12.10.20:22000} '
+     '{{remote_address} 10.12.10.113:45142} '
+     '{{stream reference} 0x0a57c898} {{call reference} 0xf0424034} '
+     '{type audio} {transport rtp} {direction inbound} {state open} '
+     '{circuit 0} {date 06/11/2019} {start 10:23:41:540} '
+     '{end 00:00:00:000} {codec g711u} {payloadtype 0} {{bit rate} 64} '
+     '{{packet size} 20} {status {}} {recording {}} {mifctype line} '
+     '{content {}} {floorctrl {}} {setup {}} {userid {}} {confid 0} '
+     '{floorId {0 {0}}} {label {}} {{fingerprint data} {}} '
+     '{rfc2833payloadtype 101} {rfc2833fmtpparams 0-15}'),
+]
+
+
+class LegacyDecodeHelper(CamelotDecodeHelper):
+    '''The character by character brace scanners which split_brace_groups
+    replaced, kept here to compare speed and output.
+    '''
+
+    def complex_parse_return_lines(self, response):
+        str_list = []
+        response = response.strip()
+        open_braces = 0
+        start = response.index('{')
+        i = start
+        str_tmp = ''
+        while i < len(response):
+            tmp = response[i]
+            if tmp == '{':
+                open_braces += 1
+            elif tmp == '}':
+                open_braces -= 1
+            i += 1
+            str_tmp += tmp
+
+            if open_braces == 0:
+                str_list.append(str_tmp)
+                str_tmp = ''
+                try:
+                    start = response.index('{', i)
+                    i = start
+                except Exception:
+                    break
+                if start == -1:
+                    break
+        return str_list
+
+    def detailed_parse_char_by_char(self, msg):
+        ret_dict = dict()
+        l_index = msg.find('{')
+        if l_index == -1:
+            return
+        char_index = 0
+        while char_index < len(msg):
+            r_index = msg.find('}', char_index)
+            if r_index == -1 or char_index >= len(msg):
+                return
+            char_index = r_index + 1
+            send_line = msg[l_index:r_index + 1]
+            ret_val = dict()
+            if send_line.count('{') == send_line.count('}'):
+                if '{attribute {{' in send_line:
+                    val_index = send_line.find('{', 2)
+                    val_end_index = send_line.rfind('}', 0, len(send_line))
+                    ret_val['attribute'] = send_line[val_index:val_end_index]
+                elif '{{holdreversionreq} {' in send_line:
+                    index = send_line.find('{', 2)
+                    end_index = send_line.rfind('}', 0, len(send_line))
+                    if len(send_line[index:end_index]) > 10:
+                        ret_val['holdreversionreq'] = (
+                            self.parse_holdreversionreq_1
+                            (send_line[index:end_index]))
+                    else:
+                        ret_val = (self.
+                                   parse_single_line_to_key_value_pair
+                                   (send_line))
+                else:
+                    ret_val = (self.
+                               parse_single_line_to_key_value_pair(send_line))
+                l_index = msg.find('{', char_index)
+                for k in ret_val:
+                    key = k
+                    value = ret_val[k]
+                if key:
+                    ret_dict[key] = value
+        return ret_dict
+
+
+def parsers(helper):
+    return {
+        camelot.GET_INFO: helper.complex_parse,
+        camelot.GET_CALL_INFO: helper.parse_info,
+        camelot.GET_CALL_INFO_EXT: helper.detailed_parse_char_by_char,
+        camelot.GET_STREAMS: helper.parse_get_streams,
+        camelot.GET_STREAM_INFO: helper.complex_parse_stream_info,
+    }
+
+
+def load_recorded(path):
+    recorded = []
+    with open(path) as f:
+        for line in f:
+            request, _, response = line.strip().partition(' ')
+            if response:
+                recorded.append((request, response))
+    return recorded
+
+
+def run(parse, recorded, responses):
+    calls = [(parse[request], response) for request, response in recorded]
+    started = time.time()
+    for i in range(responses):
+        fn, response = calls[i % len(calls)]
+        fn(response)
+    return time.time() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--responses', type=int, default=20000)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--recorded', help='file of "request response" lines')
+    args = parser.parse_args()
+
+    recorded = load_recorded(args.recorded) if args.recorded else RECORDED
+    legacy = parsers(LegacyDecodeHelper())
+    current = parsers(CamelotDecodeHelper())
+    recorded = [(request, response) for request, response in recorded
+                if request in current]
+    for request, response in recorded:
+        if legacy[request](response) != current[request](response):
+            print('{}: output differs for {!r}'.format(request, response))
+            return 1
+
+    for request in current:
+        subset = [entry for entry in recorded if entry[0] == request]
+        if not subset:
+            continue
+        results = []
+        for label, parse in (('legacy', legacy), ('current', current)):
+            best = min(run(parse, subset, args.responses)
+                       for i in range(args.rounds))
+            results.append(args.responses / best)
+        print('{:<16}: legacy {:>9.0f}/sec  current {:>9.0f}/sec  '
+              'x{:.2f}'.format(request, results[0], results[1],
+                               results[1] / results[0]))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,70 @@
+'''
+Measures the encode throughput of encoder.encode and encoder.encode_frame
+per command type: the name only requests framed from their precompiled
+template (getinfo, getcalls, ...), and requests which get_control_msg,
+get_config_msg and get_endpoint_create_msg build from their arguments.
+
+Each row also times the CamelotEncodeHelper method the request used to go
+through, which builds the same frame from scratch.
+
+    python benchmarks/encoder.py
+    python benchmarks/encoder.py --commands 200000 --rounds 5
+'''
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import camelot  # noqa: E402
+from camelot.encoder import encoder  # noqa: E402
+
+EP_ID = '0000000a'
+
+WORKLOAD = [
+    ('getinfo', (camelot.GET_INFO, EP_ID), {},
+     encoder.encode_helper.get_control_msg),
+    ('getcalls', (camelot.GET_CALLS, EP_ID), {},
+     encoder.encode_helper.get_control_msg),
+    ('inservice', (camelot.IN_SERVICE, EP_ID), {},
+     encoder.encode_helper.get_control_msg),
+    ('getcallinfo', (camelot.GET_CALL_INFO, EP_ID, '0xf0424034'), {},
+     encoder.encode_helper.get_control_msg),
+    ('config', (camelot.CONFIG, EP_ID, 'tftpip', '10.20.1.21'), {}, None),
+    ('new_ep', (camelot.NEW_ENDPOINT, 'sipv2', 'SEP000000000001'), {}, None),
+]
+
+
+def run(fn, args, kwargs, commands):
+    started = time.time()
+    for i in range(commands):
+        fn(*args, **kwargs)
+    return time.time() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--commands', type=int, default=100000)
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    for label, encode_args, kwargs, helper in WORKLOAD:
+        best = min(run(encoder.encode, encode_args, kwargs, args.commands)
+                   for i in range(args.rounds))
+        as_bytes = min(run(encoder.encode_frame, encode_args, kwargs,
+                           args.commands) for i in range(args.rounds))
+        line = '{:<12}: {:>9.0f} frames/sec  bytes {:>9.0f} frames/sec'.format(
+            label, args.commands / best, args.commands / as_bytes)
+        if helper and encode_args[0] in encoder.frame_suffixes:
+            assert (helper(*encode_args, **kwargs) ==
+                    encoder.encode(*encode_args, **kwargs))
+            from_scratch = min(run(helper, encode_args, kwargs, args.commands)
+                               for i in range(args.rounds))
+            line += '  helper {:>9.0f} frames/sec x{:.2f}'.format(
+                args.commands / from_scratch, from_scratch / best)
+        print(line)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,140 @@
+'''
+Replays a Camelot event stream through the event frame parser and reports
+the events/sec.
+
+The stream is either a capture of the raw bytes received on a Camelot
+event port (e.g. saved from tcpdump with "Follow TCP stream" -> raw) or a
+synthetic stream of state, station and call events.
+
+    python benchmarks/event_stream_replay.py
+    python benchmarks/event_stream_replay.py --capture events.raw --rounds 5
+    python benchmarks/event_stream_replay.py --subscribed 10
+
+With --subscribed N only the first N endpoints have a callback, the events
+of the others are dropped by the subscription filter before being built.
+'''
+import argparse
+import os
+import random
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from camelot.protocol.tcp.frame_reader import FrameReader  # noqa: E402
+from camelot.protocol.tcp.camelot_event_connection import build_event  # noqa: E402
+from camelot.events import EventSubscriptions  # noqa: E402
+
+
+def synthetic_stream(events, endpoints):
+    messages = ['state inservice',
+                'station 17:27:33:314 ccmreg {registration ok} 10.20.1.21',
+                'station 17:27:34:001 ring 1',
+                'callevent 0aef0000 connected',
+                'calls 2',
+                'station 17:27:35:120 prompt {Your current options}']
+    out = bytearray()
+    for i in range(events):
+        msg = messages[i % len(messages)].encode()
+        out += b'e:%08x:%04x:' % (i % endpoints + 1, len(msg)) + msg
+    return bytes(out)
+
+
+def make_subscriptions(subscribed):
+    subscriptions = EventSubscriptions()
+    if subscribed is None:
+        subscriptions.catch_all = True
+    for i in range(subscribed or 0):
+        subscriptions.subscribe('%08x' % (i + 1))
+    return subscriptions
+
+
+def replay_feed(stream, chunk_size, subscriptions):
+    reader = FrameReader(None)
+    wants = subscriptions.wants
+    count = 0
+    started = time.time()
+    for offset in range(0, len(stream), chunk_size):
+        reader.feed(stream[offset:offset + chunk_size])
+        for event_type, ep_id, message in reader.pop_frames():
+            if wants(ep_id, message):
+                build_event('127.0.0.1', 5000, ep_id, message)
+            count += 1
+    return count, time.time() - started
+
+
+def replay_socket(stream, max_chunk, subscriptions):
+    '''Sends the stream over a socketpair in random sized writes, which
+    splits and coalesces events the way a loaded TCP connection does.
+    '''
+    rsock, wsock = socket.socketpair()
+
+    def writer():
+        offset = 0
+        rand = random.Random(7)
+        while offset < len(stream):
+            size = rand.randint(1, max_chunk)
+            wsock.sendall(stream[offset:offset + size])
+            offset += size
+        wsock.shutdown(socket.SHUT_WR)
+
+    reader = FrameReader(rsock)
+    wants = subscriptions.wants
+    count = 0
+    started = time.time()
+    write_thread = threading.Thread(target=writer)
+    write_thread.start()
+    frames = reader.read_frames()
+    while frames is not None:
+        for event_type, ep_id, message in frames:
+            if wants(ep_id, message):
+                build_event('127.0.0.1', 5000, ep_id, message)
+            count += 1
+        frames = reader.read_frames()
+    elapsed = time.time() - started
+    write_thread.join()
+    rsock.close()
+    wsock.close()
+    return count, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--capture', help='raw event port capture to replay')
+    parser.add_argument('--events', type=int, default=200000)
+    parser.add_argument('--endpoints', type=int, default=1000)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--subscribed', type=int,
+                        help='endpoints with a callback, default all')
+    args = parser.parse_args()
+
+    if args.capture:
+        with open(args.capture, 'rb') as f:
+            stream = f.read()
+    else:
+        stream = synthetic_stream(args.events, args.endpoints)
+    print('stream: {} bytes'.format(len(stream)))
+    subscriptions = make_subscriptions(args.subscribed)
+
+    for chunk_size in (16, 1460, 65536):
+        best = None
+        for i in range(args.rounds):
+            count, elapsed = replay_feed(stream, chunk_size,
+                                         subscriptions)
+            best = elapsed if best is None else min(best, elapsed)
+        print('feed     chunk {:>6}: {:>8} events {:>10.0f} events/sec'.format(
+            chunk_size, count, count / best))
+    for max_chunk in (64, 4096):
+        best = None
+        for i in range(args.rounds):
+            count, elapsed = replay_socket(stream, max_chunk,
+                                           subscriptions)
+            best = elapsed if best is None else min(best, elapsed)
+        print('socket writes <= {:>5}: {:>8} events {:>10.0f} events/sec'.format(
+            max_chunk, count, count / best))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+'''
+Measures the commands/sec and events/sec of the camelot package against
+the fake Camelot server (camelot.utils.fake_camelot_server) on this box.
+
+The endpoints are created, configured and brought in service through
+create_camelot_server like against a real Camelot server, then every
+thread runs getinfo on its endpoint. The event storm is counted by an
+event callback.
+
+    python benchmarks/fake_camelot.py
+    python benchmarks/fake_camelot.py --endpoints 50 --latency 0.002
+    python benchmarks/fake_camelot.py --pipelined --pool-size 2
+    python benchmarks/fake_camelot.py --events 200000 --rate 50000
+'''
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import camelot  # noqa: E402
+from camelot.utils.fake_camelot_server import FakeCamelotServer  # noqa: E402
+
+
+def wait_for(predicate, timeout):
+    deadline = time.time() + timeout
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def register(serv, endpoints):
+    eps = []
+    for i in range(endpoints):
+        ep = serv.create_new_endpoint('sipv2', 'SEP%012d' % (i + 1))
+        ep.config('tftpip', '127.0.0.1')
+        ep.init()
+        ep.inservice()
+        eps.append(ep)
+    if not wait_for(lambda: all(ep.get_info()['state'] == 'inservice'
+                                for ep in eps), 10):
+        raise camelot.CamelotError('endpoints did not come in service')
+    return eps
+
+
+def run_commands(eps, commands):
+    per_ep = max(commands // len(eps), 1)
+
+    def worker(ep):
+        for i in range(per_ep):
+            ep.get_info()
+    threads = [threading.Thread(target=worker, args=(ep,)) for ep in eps]
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return per_ep * len(eps), time.time() - started
+
+
+def run_events(fake, serv, events, rate):
+    received = []
+    serv.register_event_callback(lambda event: received.append(1))
+    started = time.time()
+    fake.event_storm(events, rate=rate).join()
+    wait_for(lambda: len(received) >= events, 30)
+    return len(received), time.time() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--endpoints', type=int, default=10)
+    parser.add_argument('--commands', type=int, default=20000)
+    parser.add_argument('--latency', type=float, default=0)
+    parser.add_argument('--pipelined', action='store_true')
+    parser.add_argument('--pool-size', type=int, default=1)
+    parser.add_argument('--events', type=int, default=100000)
+    parser.add_argument('--rate', type=int, help='events/sec of the storm')
+    args = parser.parse_args()
+    logging.getLogger('camelot').setLevel(logging.ERROR)
+
+    fake = FakeCamelotServer(('127.0.0.1', 0), latency=args.latency,
+                             register_time=0.01).start()
+    serv = camelot.create_camelot_server(
+        '127.0.0.1', fake.port, pipelined=args.pipelined,
+        pool_size=args.pool_size)
+    eps = register(serv, args.endpoints)
+
+    count, elapsed = run_commands(eps, args.commands)
+    print('getinfo, {} endpoints: {:>8} commands {:>10.0f} commands/sec'
+          ''.format(len(eps), count, count / elapsed))
+    count, elapsed = run_events(fake, serv, args.events, args.rate)
+    print('event storm          : {:>8} events   {:>10.0f} events/sec'
+          ''.format(count, count / elapsed))
+    print(fake.get_stats())
+    fake.stop()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+'''
+Measures the responses/sec of decoder.decode on a get_info heavy workload
+of a server in JSON output format, with the default CamelotOrderedDict
+decoding and with fast_json (plain dicts, through orjson when installed).
+
+It also times a TCL answer decoded while the server is in JSON mode, which
+no longer goes through a failing json.loads first.
+
+    python benchmarks/json_decode.py
+    python benchmarks/json_decode.py --responses 50000 --rounds 5
+'''
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import camelot  # noqa: E402
+from camelot.decoder import decoder, decode_helper  # noqa: E402
+
+GET_INFO = json.dumps({
+    'state': 'inservice', 'type': 'sipv2', 'description': '',
+    'overall state': 'inservice', 'current login': '', 'lines': '1',
+    'calls': '1', 'streams': '2', 'primary cm': '10.20.1.21',
+    'backup cm': '10.20.1.22', 'status': '', 'registration error': '',
+    'last error': '', 'delay offer': 'false',
+    'Voice Mail client status': '', 'primary cti': '', 'backup cti': '',
+    'current cti': '', 'id': '1', 'userid': 'agent0001',
+    'preferred mode': '', 'call type': '', 'domain': '', 'sip port': '5060',
+    'ixenabled': 'no', 'esrstvernego': '', 'login type': '',
+    'deploymentmodel': 'on-premise', 'privacy': 'disabled', 'tlscipher': '',
+    'config version stamp': '1564157271-4cb0d3e6',
+    'config file version refer response': '200',
+    'register_supported': ['X-cisco-sis-10.0.0', 'path', 'replaces'],
+    'register_callid': '0050569d-a6710003-1b2e4f5a-7c3d9e01@10.12.10.113'})
+GET_CALLS = json.dumps({'JSON_LIST': [
+    {'call_ref': '0xeff5c034', 'line_ref': '1', 'state': 'connected'}]})
+TCL_STATS = ('{rtpPacketsSent 5012} {rtpPacketsReceived 5009} '
+             '{rtpBytesSent 862064} {rtpBytesReceived 861548} '
+             '{jitter 2} {latency 0} {{packets lost} 0}')
+
+
+class Response(object):
+
+    def __init__(self, message):
+        self.ack = 'A'
+        self.message = message
+
+
+def run(workload, responses, **kargs):
+    started = time.time()
+    for i in range(responses):
+        request, response = workload[i % len(workload)]
+        decoder.decode('ep', request, response, output_format='json',
+                       **kargs)
+    return time.time() - started
+
+
+def best(rounds, *args, **kargs):
+    return min(run(*args, **kargs) for i in range(rounds))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--responses', type=int, default=20000)
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+    logging.getLogger('camelot').setLevel(logging.ERROR)
+
+    # 8 get_info for one get_calls, like a registration or wait loop
+    workload = ([(camelot.GET_INFO, Response(GET_INFO))] * 8 +
+                [(camelot.GET_CALLS, Response(GET_CALLS))])
+    ordered = best(args.rounds, workload, args.responses)
+    fast = best(args.rounds, workload, args.responses, fast_json=True)
+    print('get_info ordered dict : {:>9.0f} responses/sec'.format(
+        args.responses / ordered))
+    print('get_info fast_json    : {:>9.0f} responses/sec x{:.2f} ({})'.format(
+        args.responses / fast, ordered / fast,
+        'orjson' if decode_helper.orjson else 'json, orjson not installed'))
+
+    tcl = [(camelot.GET_CALL_STATS, Response(TCL_STATS))]
+    skipped = best(args.rounds, tcl, args.responses)
+    may_be_json = decoder._may_be_json
+    decoder._may_be_json = lambda message: True
+    try:
+        attempted = best(args.rounds, tcl, args.responses)
+    finally:
+        decoder._may_be_json = may_be_json
+    print('TCL answer, json tried: {:>9.0f} responses/sec'.format(
+        args.responses / attempted))
+    print('TCL answer, skipped   : {:>9.0f} responses/sec x{:.2f}'.format(
+        args.responses / skipped, attempted / skipped))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
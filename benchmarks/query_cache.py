@@ -0,0 +1,111 @@
+'''
+Measures the get_info/get_calls polling rate of endpoints with and without
+the query cache, and the rate of reading the same from the state mirror,
+against the fake Camelot server (camelot.utils.fake_camelot_server) on
+this box.
+
+Every thread polls its endpoint like a monitoring loop does, while the fake
+server places and ends a call on each endpoint every --call-interval
+seconds, so the cache keeps being invalidated by the call events.
+
+    python benchmarks/query_cache.py
+    python benchmarks/query_cache.py --endpoints 20 --latency 0.002
+'''
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import camelot  # noqa: E402
+from camelot.utils.fake_camelot_server import FakeCamelotServer  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_camelot import register  # noqa: E402
+
+
+def call_churn(eps, interval, stop):
+    '''Places and ends a call on every endpoint each interval seconds.'''
+    while not stop.is_set():
+        for ep in eps:
+            ref = ep.place_call('7002')
+            if ref:
+                ep.endcall(ref)
+        stop.wait(interval)
+
+
+def poll(ep):
+    ep.get_info()
+    ep.get_calls()
+
+
+def read_mirror(ep):
+    ep.state
+    ep.active_calls
+
+
+def run_polls(eps, duration, query):
+    counts = [0] * len(eps)
+    stop = time.time() + duration
+
+    def worker(index, ep):
+        while time.time() < stop:
+            query(ep)
+            counts[index] += 2
+    threads = [threading.Thread(target=worker, args=(i, ep))
+               for i, ep in enumerate(eps)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--endpoints', type=int, default=10)
+    parser.add_argument('--duration', type=float, default=3)
+    parser.add_argument('--latency', type=float, default=0)
+    parser.add_argument('--call-interval', type=float, default=0.5)
+    args = parser.parse_args()
+    logging.getLogger('camelot').setLevel(logging.ERROR)
+
+    fake = FakeCamelotServer(('127.0.0.1', 0), latency=args.latency,
+                             register_time=0.01, answer_time=0.01).start()
+    serv = camelot.create_camelot_server('127.0.0.1', fake.port)
+    eps = register(serv, args.endpoints)
+
+    results = []
+    for label, cached, query in (('no cache', False, poll),
+                                 ('query cache', True, poll),
+                                 ('state mirror', False, read_mirror)):
+        for ep in eps:
+            if cached:
+                ep.enable_query_cache()
+            else:
+                ep.disable_query_cache()
+            if query is read_mirror:
+                ep.enable_state_mirror()
+        stop = threading.Event()
+        churn = threading.Thread(target=call_churn,
+                                 args=(eps, args.call_interval, stop))
+        churn.start()
+        commands = fake.get_stats()['commands']
+        polls = run_polls(eps, args.duration, query)
+        stop.set()
+        churn.join()
+        sent = fake.get_stats()['commands'] - commands
+        results.append(polls / args.duration)
+        print('{:<12}: {:>8} queries {:>10.0f} queries/sec {:>8} commands '
+              'sent'.format(label, polls, results[-1], sent))
+    print('query cache x{:.2f}, state mirror x{:.2f}'.format(
+        results[1] / results[0], results[2] / results[0]))
+    fake.stop()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,110 @@
+'''
+Measures the commands/sec of Connection.execute_camelot_command over a TCP
+connection to a local fake Camelot server, with the command socket wrapped
+in CamelotSocket and in the eval based wrapper it replaced.
+
+The connections are opened to the fake Camelot server
+(camelot.utils.fake_camelot_server) on 127.0.0.1 with the usual handshake,
+so the numbers are the client side cost of sending, framing and decoding a
+getinfo command over loopback. The eval based wrapper sends the str frame
+of encoder.encode, CamelotSocket the bytes frame of encoder.encode_frame.
+
+    python benchmarks/socket_loopback.py
+    python benchmarks/socket_loopback.py --commands 50000 --rounds 5
+'''
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import camelot  # noqa: E402
+from camelot.encoder import encoder  # noqa: E402
+from camelot.protocol.tcp.camelot_connection import (  # noqa: E402
+    Connection, CamelotSocket)
+from camelot.utils.fake_camelot_server import FakeCamelotServer  # noqa: E402
+from camelot.utils.vapi_ei_utils import VAPIEIUtils  # noqa: E402
+
+
+class LegacyCamelotSocket(object):
+    '''The CamelotSocket before it became bytes native, kept here to
+    compare speed: every attribute lookup went through eval and every send
+    and recv checked the python version.
+    '''
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        if name in ['send', 'recv', 'sendall']:
+            return eval('self.%s' % name)
+        return eval('self._conn.%s' % name)
+
+    def send(self, message):
+        if sys.version_info < (3, 5):
+            self._conn.send(message)
+        else:
+            self._conn.send(message.encode())
+
+    def sendall(self, message):
+        if sys.version_info < (3, 5):
+            self._conn.sendall(message)
+        else:
+            self._conn.sendall(message.encode())
+
+    def recv(self, bufsize, *args):
+        if sys.version_info < (3, 5):
+            return self._conn.recv(bufsize, *args)
+        else:
+            data = self._conn.recv(bufsize, *args)
+            return data.decode()
+
+
+class LegacyConnection(Connection):
+    socket_class = LegacyCamelotSocket
+
+
+def open_connection(connection_class, port):
+    conn_id = '127.0.0.1:%s' % port
+    conn = connection_class('127.0.0.1', port, conn_id,
+                            VAPIEIUtils.CLIENT_VERSION)
+    conn.init_connection(conn_id)
+    return conn
+
+
+def run(conn, encoded, commands):
+    started = time.time()
+    for i in range(commands):
+        conn.execute_camelot_command(camelot.GET_INFO, encoded)
+    return time.time() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--commands', type=int, default=20000)
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+    logging.getLogger('camelot').setLevel(logging.ERROR)
+
+    fake = FakeCamelotServer(('127.0.0.1', 0)).start()
+    serv = camelot.create_camelot_server('127.0.0.1', fake.port)
+    ep_id = serv.create_new_endpoint('sipv2', 'SEP000000000001').ep_id
+    results = []
+    for label, connection_class, encoded in (
+            ('eval wrapper', LegacyConnection,
+             encoder.encode(camelot.GET_INFO, ep_id)),
+            ('CamelotSocket', Connection,
+             encoder.encode_frame(camelot.GET_INFO, ep_id))):
+        conn = open_connection(connection_class, fake.port)
+        best = min(run(conn, encoded, args.commands)
+                   for i in range(args.rounds))
+        results.append(args.commands / best)
+        print('{:<14}: {:>8} commands {:>10.0f} commands/sec'.format(
+            label, args.commands, results[-1]))
+    print('x{:.2f}'.format(results[1] / results[0]))
+    fake.stop()
+
+if __name__ == '__main__':
+    sys.exit(main())
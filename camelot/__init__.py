@@ -675,14 +675,34 @@ def __exit_handler():
 atexit.register(__exit_handler)
 
 
-def _get_camelot_connection(ip, port, version):
+def _get_camelot_connection(ip, port, version, pipelined=False,
+                            pool_size=1, event_reactor=False,
+                            transport_stats=None, fast_json=False):
     connection_key = '%s:%s' % (ip, port)
-    from camelot.protocol.tcp.camelot_connection import Connection
+    from camelot.protocol.tcp.camelot_connection import (Connection,
+                                                         ConnectionPool)
+    from camelot.protocol.tcp.transport_stats import TransportStats
+    if transport_stats is None:
+        # all the members of a pool share the stats
+        transport_stats = TransportStats()
     with _connections_lock:
-
-        conn = Connection(ip, port, connection_key, version)
-        conn.init_connection(connection_key)
-    return conn
+        conns = []
+        for index in range(max(pool_size, 1)):
+            conn = Connection(ip, port, connection_key, version,
+                              pipelined=pipelined,
+                              event_reactor=event_reactor,
+                              transport_stats=transport_stats,
+                              fast_json=fast_json)
+            try:
+                conn.init_connection(connection_key)
+            except Exception:
+                for open_conn in conns:
+                    open_conn.close_event_channel()
+                raise
+            conns.append(conn)
+    if len(conns) == 1:
+        return conns[0]
+    return ConnectionPool(conns)
 
 
 class CamelotMessage(object):
@@ -718,6 +738,17 @@ def get_camelot_server(ip, port):
     return __camelot_servers.get(server_key, None)
 
 
+def get_camelot_servers():
+    '''
+    returns the handles of all the camelot servers created in this process.
+
+    >>> camelot.get_camelot_servers()
+    [<camelot.camelot_server.CamelotServer object at 0xb3a550>]
+    '''
+    with _camelot_servers_lock:
+        return list(__camelot_servers.values())
+
+
 def create_camelot_server(ip, port, **kwargs):
     '''
     returns new handle for camelot server object if the
@@ -728,6 +759,24 @@ def create_camelot_server(ip, port, **kwargs):
     :parameter port: listening port of Camelot server
     :parameter server_class: custom type which is subclass of CamelotServer.
      Default value is CamelotServer
+    :parameter pipelined: if True, endpoint commands are pipelined on the
+     command socket: many threads can have commands in flight and ACKs are
+     matched back by endpoint id. Default value is False
+    :parameter pool_size: number of command sockets opened to the server.
+     Each one does its own handshake and gets its own event channel,
+     endpoints are spread over them by ep_id. Default value is 1
+    :parameter event_workers: number of threads which run the callbacks
+     registered per event type on the endpoints. Events of one endpoint
+     are handled in order by the same thread. Default value is 8
+    :parameter event_reactor: if True, the event sockets of this server are
+     read by the one selector thread shared by all the servers of the
+     process which use it, instead of a reader thread per event socket.
+     Callbacks run inline on that thread should not block. Default value
+     is False
+    :parameter fast_json: if True, JSON responses are decoded into plain
+     dicts, with orjson when it is installed, instead of CamelotOrderedDict.
+     They keep the server order, only their repr differs. Default value
+     is False
 
     :returns: on success returns camelot server handle else throws CamelotError
 
@@ -749,6 +798,11 @@ def create_camelot_server(ip, port, **kwargs):
     server_class = kwargs.setdefault('server_class', CamelotServer)
     serv_params = kwargs.setdefault('server_params', {})
     version = kwargs.setdefault('version', VAPIEIUtils.CLIENT_VERSION)
+    pipelined = kwargs.setdefault('pipelined', False)
+    pool_size = kwargs.setdefault('pool_size', 1)
+    event_workers = kwargs.setdefault('event_workers', 8)
+    event_reactor = kwargs.setdefault('event_reactor', False)
+    fast_json = kwargs.setdefault('fast_json', False)
 
     if not issubclass(server_class, CamelotServer):
         raise CamelotError('server_class not subclass of CamelotServer')
@@ -764,7 +818,10 @@ def create_camelot_server(ip, port, **kwargs):
                 'camserv exists.Use get_camelot_server instead', 'Internal')
         else:
             serv = server_class(ip, port, server_key, version=version,
-                                **serv_params)
+                                pipelined=pipelined, pool_size=pool_size,
+                                event_workers=event_workers,
+                                event_reactor=event_reactor,
+                                fast_json=fast_json, **serv_params)
             __camelot_servers[server_key] = serv
 
     if not serv:
@@ -776,6 +833,9 @@ def stop_all():
     def cleanup_server(serv):
         serv.clean_up_eps()
         serv._server_conn.close_event_channel()
+        if serv._event_batcher:
+            serv._event_batcher.flush()
+        serv._event_dispatcher.stop(timeout=1)
 
     stop_threads = []
     with _camelot_servers_lock:
@@ -787,9 +847,12 @@ def stop_all():
         # waiting for all stop threads to end
         for ch_th in stop_threads:
             try:
-                if ch_th.isAlive():
+                if ch_th.is_alive():
                     ch_th.join()
             except Exception:
                 pass
 
         __camelot_servers.clear()
+
+    from camelot.protocol.tcp.event_reactor import event_reactor
+    event_reactor.stop(timeout=1)
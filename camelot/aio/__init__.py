@@ -0,0 +1,90 @@
+'''
+asyncio API for Camelot.
+
+Every endpoint of a server shares one pipelined command socket and one
+event socket which are driven by the running event loop, so thousands of
+emulated endpoints can be run from one process without a thread per
+endpoint or per event.
+
+>>> import asyncio
+>>> from camelot import aio
+>>> async def register(serv, mac):
+...     ep = await serv.create_new_endpoint('sipx', mac)
+...     await ep.config('sip.phone.deviceid', '1')
+...     await ep.init()
+...     return await ep.inservice()
+...
+>>> async def main():
+...     serv = await aio.create_camelot_server('10.12.10.180', 5001)
+...     macs = ['SEPBAACBAAC%04d' % i for i in range(1000)]
+...     print(await asyncio.gather(*[register(serv, mac) for mac in macs]))
+...     await serv.close()
+...
+>>> asyncio.run(main())
+'''
+from threading import RLock
+import camelot
+from camelot.aio.camelot_server import AsyncCamelotServer
+from camelot.aio.endpoint import AsyncCamelotEndpoint
+from camelot.utils.vapi_ei_utils import VAPIEIUtils
+
+__camelot_servers = {}
+_camelot_servers_lock = RLock()
+
+
+def get_camelot_server(ip, port):
+    '''returns the existing asyncio camelot server handle for given ip and
+    port, else throws CamelotError.
+    '''
+    server_key = '%s:%s' % (ip, port)
+    if server_key not in __camelot_servers:
+        raise camelot.CamelotError('camserv not found')
+    return __camelot_servers.get(server_key, None)
+
+
+async def create_camelot_server(ip, port, **kwargs):
+    '''Connects to the camelot server running on ip and port and returns
+    new asyncio camelot server handle, otherwise throws CamelotError.
+
+    :parameter ip: ip address of Camelot server
+    :parameter port: listening port of Camelot server
+    :parameter server_class: subclass of AsyncCamelotServer.
+     Default value is AsyncCamelotServer
+    :parameter fast_json: if True, JSON responses are decoded into plain
+     dicts, see camelot.create_camelot_server. Default value is False
+
+    >>> serv = await camelot.aio.create_camelot_server('10.12.10.180', 5001)
+    '''
+    server_class = kwargs.setdefault('server_class', AsyncCamelotServer)
+    version = kwargs.setdefault('version', VAPIEIUtils.CLIENT_VERSION)
+    fast_json = kwargs.setdefault('fast_json', False)
+
+    if not issubclass(server_class, AsyncCamelotServer):
+        raise camelot.CamelotError(
+            'server_class not subclass of AsyncCamelotServer')
+    if not ip or not port:
+        raise camelot.CamelotError('either ip or port is invalid')
+
+    server_key = '%s:%s' % (ip, port)
+    with _camelot_servers_lock:
+        if server_key in __camelot_servers:
+            raise camelot.CamelotError(
+                'camserv exists.Use get_camelot_server instead', 'Internal')
+        serv = server_class(ip, port, version=version, fast_json=fast_json)
+        __camelot_servers[server_key] = serv
+    try:
+        await serv._connect()
+    except Exception:
+        with _camelot_servers_lock:
+            __camelot_servers.pop(server_key, None)
+        raise
+    return serv
+
+
+async def stop_all():
+    '''Closes every asyncio camelot server created by this module.'''
+    with _camelot_servers_lock:
+        servers = list(__camelot_servers.values())
+        __camelot_servers.clear()
+    for serv in servers:
+        await serv.close()
@@ -0,0 +1,149 @@
+import asyncio
+import camelot
+from camelot import camlogger
+from camelot.aio.connection import AsyncConnection
+from camelot.aio.endpoint import AsyncCamelotEndpoint
+from camelot.encoder import encoder
+from camelot.events import EventType, InfoEventType
+from camelot.utils.camelot_version_validator import CamelotCrypto
+from camelot.utils.vapi_ei_utils import VAPIEIUtils
+
+log = camlogger.getLogger(__name__)
+
+
+class AsyncCamelotServer(object):
+
+    def __init__(self, ip, port, version=VAPIEIUtils.CLIENT_VERSION,
+                 fast_json=False):
+        self._ip = ip
+        self._port = port
+        self.__version = version
+        self.ver_validator = CamelotCrypto()
+        self.ver_validator.validate_version()
+        self._server_conn = AsyncConnection(
+            ip, port, version, event_handler=self._default_event_callback,
+            fast_json=fast_json)
+        self._fast_json = fast_json
+        self._callback = None
+        self.__endpoints = {}
+        self._connected = False
+        self._connect_lock = None
+
+    async def _connect(self):
+        self._connect_lock = asyncio.Lock()
+        await self._server_conn.open()
+        self._connected = True
+
+    async def _get_server_conn(self):
+        '''Returns the connection, reopened if it stopped, e.g. after a
+        socket error. Like
+        :py:meth:`camelot.camelot_server.CamelotServer._get_server_conn`, the
+        endpoints created before are marked invalid then.
+        '''
+        if not (self._server_conn._stopped and self._connected):
+            return self._server_conn
+        async with self._connect_lock:
+            if self._server_conn._stopped and self._connected:
+                await self._server_conn.close()
+                self._server_conn = AsyncConnection(
+                    self._ip, self._port, self.__version,
+                    event_handler=self._default_event_callback,
+                    fast_json=self._fast_json)
+                await self._server_conn.open()
+                log.info('connection to camelot server is re-established')
+                for ep in self.__endpoints.values():
+                    ep._is_valid = False
+        return self._server_conn
+
+    def _get_all_endpoints(self):
+        return self.__endpoints
+
+    def _get_endpoint(self, ep_id):
+        if ep_id not in self.__endpoints:
+            raise (camelot.CamelotError(
+                'endpoint index invalid or out of bounds'))
+        return self.__endpoints.get(ep_id, None)
+
+    async def get_server_os(self):
+        '''Queries currently running Camelot server for its host OS.
+
+        >>> await serv.get_server_os()
+        'Linux'
+        '''
+        conn = await self._get_server_conn()
+        res = await conn.execute_camelot_command(
+            camelot.GET_SERVER_OS, 'os', request_type='server')
+        return res.server_os if res else None
+
+    async def get_server_version(self):
+        '''Queries currently running Camelot server for its version.
+
+        >>> await serv.get_server_version()
+        '14.0.37.0.0.0'
+        '''
+        conn = await self._get_server_conn()
+        res = await conn.execute_camelot_command(
+            camelot.GET_SERVER_VERSION, 'vr', request_type='server')
+        return res.server_version if res else None
+
+    async def create_new_endpoint(self, ep_type, *args, **kwargs):
+        '''Creates a new endpoint on the Camelot server, see
+        :py:meth:`camelot.camelot_server.CamelotServer.create_new_endpoint`
+
+        :parameter ep_type: endpoint type
+        :parameter args: endpoint type specific arguments
+        :parameter ep_class: subclass of AsyncCamelotEndpoint to create.
+         Default value is AsyncCamelotEndpoint
+
+        :returns: AsyncCamelotEndpoint object on successful creation of the
+         endpoint else camelot.CamelotError
+
+        >>> ep1 = await serv.create_new_endpoint('sipx', 'SEPBAACBAAC7001')
+        '''
+        ep_class = kwargs.get('ep_class', AsyncCamelotEndpoint)
+        if not issubclass(ep_class, AsyncCamelotEndpoint):
+            raise camelot.CamelotError(
+                'ep_class: %s not a subclass of AsyncCamelotEndpoint' % (
+                    ep_class))
+        encoded_msg = encoder.encode(camelot.NEW_ENDPOINT, ep_type, *args)
+        conn = await self._get_server_conn()
+        response = await conn.execute_raw_command(encoded_msg)
+        if response.ack != 'A':
+            raise camelot.CamelotError(
+                response.message or 'Recevied error response from the '
+                'Camelot[%s]' % vars(response))
+        if response.epAddress in self.__endpoints:
+            raise camelot.CamelotError(
+                'endpoint {} already exists'.format(response.epAddress))
+        ep = ep_class(response.epAddress, self)
+        ep.ep_type = ep_type
+        self.__endpoints[ep.ep_id] = ep
+        return ep
+
+    def register_event_callback(self, callback):
+        '''Registers the callback for events of endpoints which have no
+        callback of their own. callback can be a plain function or a
+        coroutine function.
+        '''
+        self._callback = callback
+
+    def _default_event_callback(self, event):
+        callback = self._callback
+        ep = self.__endpoints.get(event.endpoint_id)
+        if (ep is not None and event.event_type == EventType.INFO_EVENT and
+                event.event_sub_type == InfoEventType.STATE):
+            ep._handle_state_event(event)
+        if ep is not None and ep._callback is not None:
+            callback = ep._callback
+        if callback is None:
+            log.debug("no event callback registered for: {}".format(event))
+            return
+        if asyncio.iscoroutinefunction(callback):
+            asyncio.ensure_future(callback(event))
+        else:
+            callback(event)
+
+    async def close(self):
+        '''Closes the command and event sockets to the Camelot server.'''
+        self._connected = False
+        await self._server_conn.close()
@@ -0,0 +1,407 @@
+'''
+asyncio version of the Camelot command and event connection.
+
+The wire format is the same as the one of
+camelot.protocol.tcp.camelot_connection.Connection, the command socket is
+always pipelined: any number of coroutines can have commands in flight and
+ACKs are matched back to them by endpoint id. The generic (non endpoint)
+requests share one persistent socket.
+'''
+import asyncio
+from collections import deque
+import camelot
+from camelot import camlogger
+from camelot.decoder import decoder
+from camelot.protocol.tcp.camelot_connection import (frame_bytes,
+                                                     frame_ep_id)
+from camelot.protocol.tcp.camelot_event_connection import build_event
+from camelot.utils.server_utils import CamelotServerResponse
+from camelot.utils.vapi_ei_utils import VAPIEIUtils
+
+
+log = camlogger.getLogger(__name__)
+
+
+class ConnectionError(Exception):
+    pass
+
+
+class AsyncConnection(object):
+    SOCKET_TIMEOUT = 4
+    HAND_SHAKE_CHARS_TO_READ = 4
+    HEX_TO_DIGIT_RADIX = 16
+    HEADER_DELIM = b':'
+    HEADER_TOKENS = 3
+    NO_EP_ID = '00000000'
+
+    def __init__(self, server_ip, server_port, version, event_handler=None,
+                 fast_json=False):
+        self.server_ip = server_ip
+        self.server_port = server_port
+        self.connection_key = '%s:%s' % (server_ip, server_port)
+        self.version = version
+        self.output_format = 'non_json'
+        self.fast_json = fast_json
+        self.event_handler = event_handler
+        self._stopped = True
+        self._reader = None
+        self._writer = None
+        self._event_reader = None
+        self._event_writer = None
+        self._reader_task = None
+        self._event_task = None
+        self._pending_cond = None
+        self._pending = {}
+        self._exclusive = False
+        self._inflight = 0
+        # commands queued behind a late ACK, see _read_responses
+        self._skewed = set()
+        self._generic_lock = None
+        self._generic_reader = None
+        self._generic_writer = None
+
+    async def open(self):
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.server_ip, self.server_port),
+            AsyncConnection.SOCKET_TIMEOUT)
+        self._pending_cond = asyncio.Condition()
+        self._generic_lock = asyncio.Lock()
+        await self._hand_shake_with_server()
+        self._stopped = False
+        self._reader_task = asyncio.ensure_future(self._command_reader())
+        self._event_task = asyncio.ensure_future(self._event_loop())
+        if self._check_json_support_version():
+            self.output_format = await self._set_output_format()
+            log.debug("output_format in server has been set to:{}".format(
+                self.output_format))
+        log.debug("Created connection: " + self.connection_key)
+
+    def _check_json_support_version(self):
+        i_ver = list(map(int, self.version.split('.')))
+        if i_ver[0] > 11:
+            return True
+        elif self.version.startswith('11.0'):
+            if i_ver[4] > 10:
+                return True
+            elif i_ver[4] == 10 and i_ver[5] > 10:
+                return True
+        if i_ver[0] == 11 and i_ver[1] > 0:
+            return True
+        return False
+
+    async def _hand_shake_with_server(self):
+        client_version = self.version
+        log.info("Client Version: " + client_version)
+        ver_exchange = "vcclientversion:%s:%s" % (
+            VAPIEIUtils.message_length_to_decimal(client_version),
+            client_version)
+        self._writer.write(ver_exchange.encode())
+        hand_shake_res = (await self._reader.readexactly(1)).decode()
+        if hand_shake_res != 'a':
+            data = await self._reader.readexactly(
+                AsyncConnection.HAND_SHAKE_CHARS_TO_READ)
+            fail_reason = await self._reader.readexactly(int(data))
+            self._writer.close()
+            raise ConnectionError(
+                "Client package: %s not compatible with server, failure "
+                "reason: %s" % (client_version, fail_reason.decode()))
+
+        ver_h_user = '%s%s' % (VAPIEIUtils.message_length_to_decimal("root"),
+                               "root")
+        self._writer.write(ver_h_user.encode())
+        event_port_str = (await self._reader.readexactly(
+            AsyncConnection.HAND_SHAKE_CHARS_TO_READ)).decode()
+        event_port = int(event_port_str, AsyncConnection.HEX_TO_DIGIT_RADIX)
+        log.debug("Received Event port: %s" % event_port)
+        self._event_reader, self._event_writer = await asyncio.wait_for(
+            asyncio.open_connection(self.server_ip, event_port),
+            AsyncConnection.SOCKET_TIMEOUT)
+
+    async def _set_output_format(self):
+        out_msg = '{} setjson @'.format(camelot.SET_OUTPUT_FORMAT)
+        hex_len = VAPIEIUtils.get_message_length_hex(out_msg)
+        response = await self._send_and_receive(
+            '%s:%s:%s:%s' % ('l', AsyncConnection.NO_EP_ID, hex_len, out_msg))
+        return response.message
+
+    @staticmethod
+    async def _read_frame(reader):
+        '''Returns the next (ack, ep_id, message) frame from the stream, or
+        None on end of stream. An invalid frame header also ends the stream,
+        nothing after it can be read.
+        '''
+        header = b''
+        try:
+            for _ in range(AsyncConnection.HEADER_TOKENS):
+                header += await reader.readuntil(AsyncConnection.HEADER_DELIM)
+            tokens = header.decode().split(':')
+            payload = await reader.readexactly(
+                int(tokens[2], AsyncConnection.HEX_TO_DIGIT_RADIX))
+        except asyncio.IncompleteReadError:
+            return None
+        except (asyncio.LimitOverrunError, ValueError, IndexError):
+            log.error("Invalid frame header: {!r}".format(header[:32]))
+            return None
+        return tokens[0].strip(), tokens[1], payload.decode()
+
+    def _command_ep_id(self, command):
+        return frame_ep_id(command)
+
+    def _failed_response(self):
+        res = CamelotServerResponse()
+        res.ack = 'N'
+        res.message = ('Unable to send/receive message to Camelot server, '
+                       'after retries')
+        return res
+
+    async def _send_and_receive(self, command, timeout=10):
+        '''Writes the command and waits for its ACK. Commands which can't be
+        matched by endpoint id (endpoint creation, server level requests) are
+        sent alone, once everything in flight has been answered.
+
+        Waiting for the pipeline and for the ACK are both bounded by
+        timeout. A missing ACK fails the commands of the endpoint, see
+        _abandon_endpoint. The ACKs of the commands sent alone are matched
+        by their order only, so a missing one stops the connection and fails
+        the pending commands, as does a missing ACK after a late one was
+        dropped for the endpoint: the late ACK may have been the one of the
+        command, and the ACKs of the endpoint are out of step then.
+        '''
+        if self._stopped and self._reader_task:
+            return self._failed_response()
+        ep_id = self._command_ep_id(command)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        future = loop.create_future()
+        async with self._pending_cond:
+            try:
+                await asyncio.wait_for(self._pending_cond.wait_for(
+                    lambda: self._stopped or (not self._exclusive and (
+                        ep_id is not None or self._inflight == 0))),
+                    timeout)
+            except asyncio.TimeoutError:
+                log.error("Pipeline of {} not available within {}s for "
+                          "[{}]".format(self.connection_key, timeout,
+                                        command))
+                return self._failed_response()
+            if self._stopped:
+                return self._failed_response()
+            if ep_id is None:
+                self._exclusive = True
+            self._pending.setdefault(ep_id, deque()).append(future)
+            self._inflight += 1
+            self._writer.write(frame_bytes((command,)))
+        try:
+            await self._writer.drain()
+            return await asyncio.wait_for(
+                asyncio.shield(future), max(deadline - loop.time(), 0))
+        except asyncio.TimeoutError:
+            reason = "Timed out waiting for the response of [{}]".format(
+                command)
+            if ep_id is None or future in self._skewed:
+                await self._fail_connection(reason)
+                return self._failed_response()
+            async with self._pending_cond:
+                answered = future.done()
+                if not answered:
+                    self._abandon_endpoint(ep_id)
+            if answered:
+                return future.result()
+            log.error(reason)
+            return self._failed_response()
+        except OSError as e:
+            await self._fail_connection(
+                "Unable to send [{}]: {}".format(command, e))
+            return self._failed_response()
+
+    def _abandon_endpoint(self, ep_id):
+        '''Fails the commands queued for ep_id after one of them got no ACK
+        in time, with _pending_cond held. Their futures stay queued, done,
+        so their ACKs, if they come late, are dropped instead of being handed
+        to the next commands of the endpoint.
+        '''
+        for future in self._pending.get(ep_id, ()):
+            if not future.done():
+                future.set_result(self._failed_response())
+                self._inflight -= 1
+            self._skewed.discard(future)
+        self._pending_cond.notify_all()
+
+    async def _fail_connection(self, reason):
+        '''Stops the connection: the command and event sockets are closed
+        and the pending commands fail.
+        '''
+        if self._stopped:
+            return
+        log.error("{}, closing the connection to {}".format(
+            reason, self.connection_key))
+        self._stopped = True
+        for writer in (self._writer, self._event_writer):
+            if writer:
+                writer.close()
+        async with self._pending_cond:
+            self._fail_pending()
+            self._pending_cond.notify_all()
+
+    async def _command_reader(self):
+        try:
+            await self._read_responses()
+        except Exception:
+            if not self._stopped:
+                log.exception('_command_reader failed:')
+        self._stopped = True
+        async with self._pending_cond:
+            self._fail_pending()
+            self._pending_cond.notify_all()
+
+    async def _read_responses(self):
+        while not self._stopped:
+            frame = await self._read_frame(self._reader)
+            if not frame:
+                if not self._stopped:
+                    log.error("End of stream reached on the command "
+                              "socket: {}".format(self.connection_key))
+                break
+            response = CamelotServerResponse()
+            response.ack, response.epAddress, response.message = frame
+            response.ack = response.ack.upper()
+            async with self._pending_cond:
+                queue = self._pending.get(response.epAddress)
+                if queue and queue[0].done():
+                    # the command timed out, see _abandon_endpoint
+                    queue.popleft()
+                    if not queue:
+                        del self._pending[response.epAddress]
+                    self._skewed.update(future for future in queue
+                                        if not future.done())
+                    log.warning("Dropping late ACK: {}".format(frame))
+                    continue
+                key = None if self._exclusive else response.epAddress
+                queue = self._pending.get(key)
+                if not queue:
+                    log.warning("Dropping unmatched ACK: {}".format(frame))
+                    continue
+                future = queue.popleft()
+                if not queue:
+                    del self._pending[key]
+                self._skewed.discard(future)
+                self._inflight -= 1
+                if key is None:
+                    self._exclusive = False
+                if not future.done():
+                    future.set_result(response)
+                self._pending_cond.notify_all()
+
+    def _fail_pending(self):
+        for queue in self._pending.values():
+            for future in queue:
+                if not future.done():
+                    future.set_result(self._failed_response())
+        self._pending.clear()
+        self._skewed.clear()
+        self._inflight = 0
+        self._exclusive = False
+
+    async def _event_loop(self):
+        while True:
+            frame = await self._read_frame(self._event_reader)
+            if not frame:
+                if not self._stopped:
+                    log.error("End of stream reached for the socket, Event "
+                              "channel is closed")
+                break
+            event_type, ep_address, event_msg = frame
+            try:
+                event = build_event(self.server_ip, self.server_port,
+                                    ep_address, event_msg)
+                if self.event_handler:
+                    self.event_handler(event)
+            except Exception as e:
+                log.error("Unexpected exception %s" % e)
+
+    async def _send_and_receive_generic(self, command):
+        '''Generic requests are answered with one newline terminated line on
+        a socket of their own, which is kept open for the next request. A
+        socket which went stale while idle is reconnected once.
+        '''
+        async with self._generic_lock:
+            for attempt in range(2):
+                reused = self._generic_writer is not None
+                try:
+                    if not reused:
+                        self._generic_reader, self._generic_writer = \
+                            await asyncio.wait_for(asyncio.open_connection(
+                                self.server_ip, self.server_port),
+                                AsyncConnection.SOCKET_TIMEOUT)
+                    self._generic_writer.write(frame_bytes((command,)))
+                    line = await asyncio.wait_for(
+                        self._generic_reader.readline(),
+                        AsyncConnection.SOCKET_TIMEOUT)
+                except Exception as ioe:
+                    self._close_generic()
+                    log.error("Unable to send/receive message to Camelot "
+                              "server %s" % ioe)
+                    if reused:
+                        continue
+                    return None
+                if self._generic_reader.at_eof():
+                    # server closed the socket after replying
+                    self._close_generic()
+                if line or not reused:
+                    break
+        if not line:
+            return None
+        res = CamelotServerResponse()
+        res.message = line.decode().rstrip('\n')
+        return res
+
+    def _close_generic(self):
+        if self._generic_writer:
+            self._generic_writer.close()
+        self._generic_reader = None
+        self._generic_writer = None
+
+    async def execute_camelot_command(
+            self, request, encoded_command, request_type='ep', timeout=10,
+            ep_class=None, ep_params=None):
+        if not encoded_command:
+            raise camelot.CamelotError('Invalid command for the Camelot:%s' % (
+                encoded_command))
+        if request_type != 'ep':
+            response = await self._send_and_receive_generic(encoded_command)
+        else:
+            response = await self._send_and_receive(encoded_command, timeout)
+        if request == camelot.SERVER_EXIT and not response:
+            return True
+        if not response:
+            return None
+        return self._decode_response(request_type, request, response,
+                                     ep_class=ep_class, ep_params=ep_params)
+
+    async def execute_raw_command(self, encoded_msg, timeout=10):
+        return await self._send_and_receive(encoded_msg, timeout)
+
+    def _decode_response(self, req_type, request, response, ep_class=None,
+                         ep_params=None):
+        kargs = {'ip': self.server_ip,
+                 'port': self.server_port,
+                 'ep_class': ep_class,
+                 'ep_params': ep_params,
+                 'output_format': self.output_format,
+                 'fast_json': self.fast_json}
+        return decoder.decode(req_type, request, response, **kargs)
+
+    async def close(self):
+        self._stopped = True
+        for writer in (self._writer, self._event_writer):
+            if writer:
+                writer.close()
+        self._close_generic()
+        for task in (self._reader_task, self._event_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+        self._fail_pending()
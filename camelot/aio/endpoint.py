@@ -0,0 +1,180 @@
+'''
+asyncio version of the hot CamelotEndpoint calls. The commands are encoded
+and the responses decoded exactly like the blocking CamelotEndpoint does.
+'''
+import asyncio
+import camelot
+from camelot import camlogger
+from camelot.encoder import encoder
+from camelot.endpoint import ENDPOINT_STATES
+from camelot.events import InfoEventType
+from camelot.utils import common_utils
+from camelot.vapi.vapi_camelot_utils import CamelotVapiUtils
+
+log = camlogger.getLogger(__name__)
+
+
+class AsyncCamelotEndpoint(CamelotVapiUtils):
+
+    def __init__(self, ep_id, server):
+        self.ep_id = ep_id
+        self.server = server
+        self.ep_type = None
+        self._callback = None
+        self._is_valid = True
+        self._state_waiters = []
+        self._state_events_on = False
+
+    def _is_valid_object(self):
+        if self._is_valid:
+            return True
+        else:
+            raise camelot.CamelotError('invalid endpoint address')
+
+    async def _query_camelot(self, request, *args, **kwargs):
+        self._is_valid_object()
+        encoded_msg = encoder.encode_frame(
+            request, self.ep_id, *args, **kwargs)
+        conn = await self.server._get_server_conn()
+        return await conn.execute_camelot_command(
+            request, encoded_msg, request_type='ep')
+
+    def register_event_callback(self, callback):
+        '''Registers the callback for the events of this endpoint. callback
+        can be a plain function or a coroutine function, coroutines are
+        scheduled as tasks on the running loop.
+        '''
+        self._callback = callback
+
+    async def config(self, param, value=None):
+        '''Set or get the value of a configuration parameter, see
+        :py:meth:`camelot.endpoint.CamelotEndpoint.config`
+
+        >>> await ep1.config('sip.phone.ip', '10.20.1.3')
+        '10.20.1.3'
+        '''
+        if value == '':
+            value = 'none'
+        return await self._query_camelot(camelot.CONFIG, param, value)
+
+    async def init(self):
+        '''Initializes the endpoint, see
+        :py:meth:`camelot.endpoint.CamelotEndpoint.init`
+
+        >>> await ep1.init()
+        'outofservice'
+        '''
+        return await self._query_camelot(camelot.INIT)
+
+    async def inservice(self):
+        '''Brings the endpoint in service, see
+        :py:meth:`camelot.endpoint.CamelotEndpoint.inservice`
+
+        >>> await ep1.inservice()
+        'inservicepending'
+        '''
+        return await self._query_camelot(camelot.IN_SERVICE)
+
+    async def get_info(self):
+        '''Gets information about the endpoint, see
+        :py:meth:`camelot.endpoint.CamelotEndpoint.get_info`
+        '''
+        return await self._query_camelot(camelot.GET_INFO)
+
+    async def start_info_events(self, event_type='state'):
+        return await self._query_camelot(camelot.START_INFO_EVENTS,
+                                         event_type)
+
+    async def wait_for_state(self, state, timeout=None):
+        '''Waits until the endpoint reaches one of the given states, see
+        :py:meth:`camelot.endpoint.CamelotEndpoint.wait_for_state`. The state
+        is followed through the state info events, nothing polls get_info
+        while waiting.
+
+        :parameter state: state or list of states to wait for
+        :parameter timeout: seconds after which common_utils.TimeoutException
+         is raised. Default None waits forever
+
+        :returns: the state reached
+
+        >>> await ep1.inservice()
+        'inservicepending'
+        >>> await ep1.wait_for_state('inservice', timeout=120)
+        'inservice'
+        '''
+        self._is_valid_object()
+        states = [state] if isinstance(state, str) else list(state)
+        waiter = (states, asyncio.get_running_loop().create_future())
+        self._state_waiters.append(waiter)
+        try:
+            if not self._state_events_on:
+                self._state_events_on = True
+                await self.start_info_events(InfoEventType.STATE)
+            # the state may have been reached before the events were on
+            self._resolve_state_waiters((await self.get_info())['state'])
+            return await asyncio.wait_for(waiter[1], timeout)
+        except asyncio.TimeoutError:
+            raise common_utils.TimeoutException(
+                'endpoint {} did not reach {} within {}s'.format(
+                    self.ep_id, states, timeout))
+        finally:
+            if waiter in self._state_waiters:
+                self._state_waiters.remove(waiter)
+
+    def _resolve_state_waiters(self, state):
+        for waiter in list(self._state_waiters):
+            if state in waiter[0] and not waiter[1].done():
+                self._state_waiters.remove(waiter)
+                waiter[1].set_result(state)
+
+    async def _refresh_state(self):
+        try:
+            self._resolve_state_waiters((await self.get_info())['state'])
+        except Exception:
+            log.exception('refreshing the state of {} failed:'.format(
+                self.ep_id))
+
+    def _handle_state_event(self, event):
+        if not self._state_waiters:
+            return
+        tokens = event.message_tokens
+        if tokens and tokens[0] in ENDPOINT_STATES:
+            self._resolve_state_waiters(tokens[0])
+        else:
+            # the event doesn't carry the new state
+            asyncio.ensure_future(self._refresh_state())
+
+    async def place_call(self, dial_str='null', line_ref='0', calling='null',
+                         call_type='0', **kwargs):
+        '''Sets up a call, see
+        :py:meth:`camelot.endpoint.CamelotEndpoint.place_call`
+
+        >>> await ep1.place_call('7002')
+        '0aef0000'
+        '''
+        dialstr = kwargs.get('dialstr', None)
+        if dialstr and dialstr != 'null':
+            dial_str = dialstr
+        kargs = {'called': dial_str or 'null',
+                 'lineref': line_ref or '0',
+                 'calling': calling or 'null',
+                 'calltype': call_type or '0'}
+        return await self._query_camelot(camelot.PLACE_CALL, **kargs)
+
+    async def answer(self, call_ref):
+        '''Answers an inbound call, see
+        :py:meth:`camelot.endpoint.CamelotEndpoint.answer`
+        '''
+        if not call_ref or not self._is_valid_call_ref(call_ref):
+            log.error('call reference not valid')
+            return
+        return await self._query_camelot(camelot.ANSWER_CALL, call_ref)
+
+    async def endcall(self, call_ref, timeout=0):
+        '''Disconnects a call, see
+        :py:meth:`camelot.endpoint.CamelotEndpoint.endcall`
+        '''
+        if not call_ref or not self._is_valid_call_ref(call_ref):
+            log.error('call reference not valid')
+            return
+        return await self._query_camelot(camelot.END_CALL, call_ref, timeout)
@@ -2,10 +2,13 @@ import camelot
 from camelot.encoder import encoder
 from camelot import camlogger
 from camelot.endpoint import CamelotEndpoint
+from camelot.events import EventType, InfoEventType, EventSubscriptions
+from camelot.event_dispatcher import EventDispatcher, EventBatcher
 from camelot.utils.rawendpoint_helper import (OutActionObject, InActionObject)
 from threading import Thread
 from camelot.utils.vapi_ei_utils import VAPIEIUtils
 from camelot.utils.camelot_version_validator import CamelotCrypto
+from camelot.protocol.tcp.transport_stats import TransportStats
 
 log = camlogger.getLogger(__name__)
 
@@ -13,18 +16,30 @@ log = camlogger.getLogger(__name__)
 class CamelotServer(object):
 
     def __init__(self, ip, port, server_key,
-                 version=VAPIEIUtils.CLIENT_VERSION):
+                 version=VAPIEIUtils.CLIENT_VERSION, pipelined=False,
+                 pool_size=1, event_workers=EventDispatcher.DEFAULT_WORKERS,
+                 event_reactor=False, fast_json=False):
         self._ip = ip
         self._port = port
         self.__server_key = server_key
         self.__version = version
+        self._pipelined = pipelined
+        self._pool_size = pool_size
+        self._event_reactor = event_reactor
+        self._fast_json = fast_json
+        self._transport_stats = TransportStats()
         self.ver_validator = CamelotCrypto()
         self.ver_validator.validate_version()
-        self._server_conn = camelot._get_camelot_connection(self._ip,
-                                                            self._port,
-                                                            self.__version)
+        self._server_conn = camelot._get_camelot_connection(
+            self._ip, self._port, self.__version, self._pipelined,
+            self._pool_size, self._event_reactor, self._transport_stats,
+            self._fast_json)
         self._callback = None
         self.__endpoints = {}
+        self._event_dispatcher = EventDispatcher(
+            event_workers, name='camelot-event-{}'.format(port))
+        self._subscriptions = EventSubscriptions()
+        self._event_batcher = None
         self.__reconnect_callback = None
         self._tng_cleanup_required = False
 
@@ -50,9 +65,13 @@ class CamelotServer(object):
         '''
 
         if (self._server_conn._stopped):
-            self._server_conn = camelot._get_camelot_connection(self._ip,
-                                                                self._port,
-                                                                self.__version)
+            if self._pool_size > 1:
+                # close the members of the pool which are still up
+                self._server_conn.close_event_channel()
+            self._server_conn = camelot._get_camelot_connection(
+                self._ip, self._port, self.__version, self._pipelined,
+                self._pool_size, self._event_reactor, self._transport_stats,
+                self._fast_json)
 
             if self.__reconnect_callback is not None:
                 log.info('connection to camelot server is re-established')
@@ -89,6 +108,140 @@ class CamelotServer(object):
                 'endpoint index invalid or out of bounds'))
         return self.__endpoints.get(ep_id, None)
 
+    def get_pipeline_stats(self):
+        '''Returns the in-flight command counters of the connection to the
+        Camelot server. Useful to size the pipelining depth when the server
+        is created with pipelined=True.
+
+        :returns: dictionary with pipelined, inflight, max_inflight,
+         commands, timeouts and unmatched counters.
+
+        >>> serv = camelot.create_camelot_server('10.12.10.180', '5001',
+        ...                                      pipelined=True)
+        >>> serv.get_pipeline_stats()
+        {'pipelined': True, 'inflight': 3, 'max_inflight': 42,
+         'commands': 12040, 'timeouts': 0, 'unmatched': 0}
+        '''
+        return self._get_server_conn().get_pipeline_stats()
+
+    def get_generic_socket_stats(self):
+        '''Returns the request counters of the persistent sockets which carry
+        the server level requests (server_os, server_version, log settings,
+        sss scripts).
+
+        >>> serv.get_generic_socket_stats()
+        [{'socket_id': 0, 'connected': True, 'requests': 118,
+          'reconnects': 1, 'failures': 0},
+         {'socket_id': 1, 'connected': False, 'requests': 0,
+          'reconnects': 0, 'failures': 0}]
+        '''
+        return self._get_server_conn().get_generic_socket_stats()
+
+    def get_event_dispatch_stats(self):
+        '''Returns the counters of the worker threads which run the event
+        callbacks registered per event type on the endpoints.
+
+        >>> serv.get_event_dispatch_stats()
+        {'workers': 8, 'queue_depth': [0, 2, 0, 0, 1, 0, 0, 0],
+         'max_queue_depth': 37, 'dispatched': 52013, 'errors': 0,
+         'latency_avg_ms': 0.412, 'latency_max_ms': 48.7,
+         'received': 1532246, 'filtered': 1480233}
+
+        received counts the events read from the event socket, filtered the
+        ones dropped by the reader because no callback was registered for
+        them. With a batch callback registered, batches
+        gives the number of batches and events delivered to it and the
+        events still pending.
+        '''
+        stats = self._event_dispatcher.get_stats()
+        subscriptions = self._subscriptions
+        stats['received'] = subscriptions.delivered + subscriptions.dropped
+        stats['filtered'] = subscriptions.dropped
+        if self._event_batcher:
+            stats['batches'] = self._event_batcher.get_stats()
+        return stats
+
+    def get_transport_stats(self):
+        '''Returns per request type latency histograms and error counters
+        of the commands sent to this Camelot server. They are kept across
+        reconnects and cover all the sockets of a pool.
+
+        Latencies are in ms, per phase: lock_wait (waiting for the command
+        socket), send, first_byte (end of send to first byte of the answer,
+        non pipelined only), response (start of send to full answer), decode
+        and total. Errors are failed (no answer), timeout, nack and
+        decode_error. Already framed messages are recorded as 'raw' and
+        batches as 'batch'.
+
+        >>> serv.get_transport_stats()
+        {'commands': 1204, 'errors': {'failed': 0, 'timeout': 0,
+         'nack': 3, 'decode_error': 0},
+         'requests': {'getinfo': {'count': 1000, 'errors': {...},
+          'latency': {'total': {'count': 1000, 'sum_ms': 412.3,
+           'avg_ms': 0.412, 'max_ms': 6.1,
+           'buckets': {'0.1': 0, '0.25': 12, ..., '+Inf': 1000}},
+           'lock_wait': {...}, 'send': {...}, 'first_byte': {...},
+           'response': {...}, 'decode': {...}}}, ...}}
+        '''
+        return self._transport_stats.get_stats()
+
+    def get_query_cache_stats(self):
+        '''Returns the query cache counters of the endpoints which enabled
+        it (see CamelotEndpoint.enable_query_cache), summed by request.
+
+        >>> serv.get_query_cache_stats()
+        {'endpoints': 100, 'hits': 5230, 'misses': 412,
+         'requests': {'getinfo': {'hits': 5230, 'misses': 312,
+          'invalidations': 298, 'expired': 14}, 'getcalls': {...}, ...}}
+        '''
+        caches = [ep._query_cache for ep in list(self.__endpoints.values())
+                  if ep._query_cache is not None]
+        requests = {}
+        for cache in caches:
+            for request, counts in cache.get_stats().items():
+                totals = requests.setdefault(request, dict.fromkeys(counts, 0))
+                for name, count in counts.items():
+                    totals[name] += count
+        return {'endpoints': len(caches),
+                'hits': sum(counts['hits'] for counts in requests.values()),
+                'misses': sum(counts['misses']
+                              for counts in requests.values()),
+                'requests': requests}
+
+    def get_mirrored_states(self):
+        '''Returns the state and number of calls of the endpoints which
+        enabled the state mirror (see CamelotEndpoint.enable_state_mirror),
+        without querying the Camelot server.
+
+        >>> serv.get_mirrored_states()
+        {'00000001': ('inservice', 1), '00000002': ('outofservice', 0)}
+        '''
+        states = {}
+        for ep_id, ep in list(self.__endpoints.items()):
+            mirror = ep._state_mirror
+            if mirror is not None:
+                states[ep_id] = (mirror.state, mirror.call_count)
+        return states
+
+    def get_pool_stats(self):
+        '''Returns how the endpoints are spread over the command sockets
+        when the server is created with pool_size greater than 1.
+
+        >>> serv = camelot.create_camelot_server('10.12.10.180', '5001',
+        ...                                      pool_size=4)
+        >>> serv.get_pool_stats()
+        [{'member': 0, 'command_socket_stopped': False, 'endpoints': 125},
+         {'member': 1, 'command_socket_stopped': False, 'endpoints': 125},
+         {'member': 2, 'command_socket_stopped': False, 'endpoints': 125},
+         {'member': 3, 'command_socket_stopped': False, 'endpoints': 125}]
+        '''
+        conn = self._get_server_conn()
+        if not hasattr(conn, 'get_pool_stats'):
+            return [{'member': 0,
+                     'command_socket_stopped': conn._stopped,
+                     'endpoints': len(self.__endpoints)}]
+        return conn.get_pool_stats()
+
     def get_server_os(self):
         '''Queries currently running Camelot server for its host OS.
 
@@ -228,6 +381,95 @@ class CamelotServer(object):
         ep.ep_type = ep_type
         return ep
 
+    def create_new_endpoints(self, ep_type, macs, config=None, **kwargs):
+        '''Creates one endpoint per MAC and optionally configures them, with
+        all the new_ep commands written as one batch and all the config
+        commands written as a second batch, instead of one round trip per
+        command.
+
+        :parameter ep_type: endpoint type, see :py:meth:`create_new_endpoint`
+        :parameter macs: list of MAC addresses (or device names)
+        :parameter config: dictionary of param:value pairs set on every
+         endpoint, or a dictionary of such dictionaries keyed by MAC for
+         per endpoint values
+        :parameter ep_class: subclass of CamelotEndpoint to create. Default
+         value is CamelotEndpoint
+        :parameter ep_params: keyword arguments for ep_class
+        :parameter timeout: seconds to wait for the answers of each batch on
+         a pipelined connection. Default grows with the size of the batch,
+         see Connection.batch_timeout. Endpoints which Camelot creates after
+         the timeout are not known here, so keep it well above the time
+         Camelot needs for the batch.
+
+        :returns: dictionary keyed by MAC with following fields:\n
+            * endpoint - CamelotEndpoint object, None if creation failed
+            * error - reason of the creation failure, else None
+            * config - param:result of the params which were set
+            * config_errors - param:reason of the params which failed
+
+        >>> serv = camelot.create_camelot_server('10.12.10.180', '5001',
+        ...                                      pipelined=True)
+        >>> res = serv.create_new_endpoints(
+        ...     'sipx', ['SEPBAACBAAC7001', 'SEPBAACBAAC7002'],
+        ...     config={'sip.phone.tftpip': '10.20.1.21'})
+        >>> res['SEPBAACBAAC7001']
+        {'endpoint': <camelot.endpoint.CamelotEndpoint object at 0x29ed490>,
+         'error': None, 'config': {'sip.phone.tftpip': '10.20.1.21'},
+         'config_errors': {}}
+        '''
+        ep_class = kwargs.setdefault('ep_class', CamelotEndpoint)
+        ep_params = kwargs.setdefault('ep_params', {})
+        timeout = kwargs.setdefault('timeout', None)
+        if not issubclass(ep_class, CamelotEndpoint):
+            raise (camelot.CamelotError
+                   ('ep_class: %s not a subclass of CamelotEndpoint'))
+        results = {}
+        for mac in macs:
+            results[mac] = {'endpoint': None, 'error': None, 'config': {},
+                            'config_errors': {}}
+
+        conn = self._get_server_conn()
+        encoded_msgs = [encoder.encode(camelot.NEW_ENDPOINT, ep_type, mac)
+                        for mac in macs]
+        responses = conn.execute_raw_batch(encoded_msgs, timeout)
+        created = []
+        for mac, response in zip(macs, responses):
+            try:
+                ep = conn._decode_response(
+                    'ep', camelot.NEW_ENDPOINT, response, ep_class=ep_class,
+                    ep_params=ep_params)
+            except camelot.CamelotError as ce:
+                log.error('Failed to create endpoint {}: {}'.format(
+                    mac, ce.message))
+                results[mac]['error'] = ce.message
+                continue
+            self.__endpoints[ep.ep_id] = ep
+            ep.ep_type = ep_type
+            results[mac]['endpoint'] = ep
+            created.append(mac)
+
+        if not config:
+            return results
+        per_mac = all(isinstance(value, dict) for value in config.values())
+        config_msgs = []
+        config_keys = []
+        for mac in created:
+            ep_config = config.get(mac, {}) if per_mac else config
+            ep = results[mac]['endpoint']
+            for param in CamelotEndpoint._ordered_config_params(ep_config):
+                config_msgs.append(encoder.encode_frame(
+                    camelot.CONFIG, ep.ep_id, param, str(ep_config[param])))
+                config_keys.append((mac, param))
+        responses = conn.execute_raw_batch(config_msgs, timeout)
+        for (mac, param), response in zip(config_keys, responses):
+            try:
+                results[mac]['config'][param] = conn._decode_response(
+                    'ep', camelot.CONFIG, response)
+            except camelot.CamelotError as ce:
+                log.error('Failed to configure {} on {}'.format(param, mac))
+                results[mac]['config_errors'][param] = ce.message
+        return results
+
     def log_mask(self, level=None, moduleid=None, device=None, reset=False,
                  endpoint_level=None):
         '''
@@ -484,17 +726,7 @@ class CamelotServer(object):
         if not message:
             log.warning('No message passed to get Hex length')
             return
-        msg_len = len(message)
-        hex_val_in_str = hex(msg_len)
-        len_hex = len(hex_val_in_str)
-        if len_hex == 3:
-            hex_val_in_str = hex_val_in_str.replace('0x', '000')
-        if len_hex == 4:
-            hex_val_in_str = hex_val_in_str.replace('0x', '00')
-        elif len_hex == 5:
-            hex_val_in_str = hex_val_in_str.replace('0x', '0')
-        len_hex = len(hex_val_in_str)
-        return hex_val_in_str[(len_hex - 4):len_hex]
+        return VAPIEIUtils.get_message_length_hex(message)
 
     def _send_message(self, sendMsg, functionStr):
         hex_len = self._get_message_length_hex(sendMsg)
@@ -507,10 +739,9 @@ class CamelotServer(object):
         return self._camelot_query(rawmessage)
 
     def _camelot_query(self, encoded_msg):
-        with self._get_server_conn().command_lock:
-            ret = self._get_server_conn()._send_and_receive(encoded_msg)
-            if ret.message:
-                return ret.message
+        ret = self._get_server_conn().execute_raw_command(encoded_msg)
+        if ret.message:
+            return ret.message
 
     def _query_camelot(self, request, *args, **kwargs):
         encoded_msg = encoder.encode(
@@ -651,6 +882,42 @@ class CamelotServer(object):
                 'camelot_port': 5004, 'message': ''}
         '''
         self._callback = callback
+        self._subscriptions.catch_all = (
+            callback is not None or self._event_batcher is not None)
+
+    def register_batch_event_callback(self, callback, max_events=100,
+                                      max_delay_ms=50):
+        '''Register a callback which is given the events of all the
+        endpoints of this server in batches, as a list of events gathered
+        until max_events are received or max_delay_ms passed since the first
+        event of the batch. The callbacks registered per event or endpoint
+        are still called for every event.
+
+        The batches are delivered on one event worker thread, one at a time
+        and in the order the events arrived, so a monitor can handle a burst
+        of events with one lock acquisition or one write.
+
+        :parameter callback: callable taking the list of events, None
+         removes the batch callback
+        :parameter max_events: number of events after which a batch is
+         delivered
+        :parameter max_delay_ms: milliseconds after the first event of a
+         batch after which it is delivered however small it is
+
+        >>> def write_events(events):
+        ...     db.insert_many([vars(event) for event in events])
+        ...
+        >>> serv.register_batch_event_callback(write_events, max_events=500,
+        ...                                    max_delay_ms=200)
+        '''
+        if self._event_batcher:
+            self._event_batcher.flush()
+        self._event_batcher = None
+        if callback is not None:
+            self._event_batcher = EventBatcher(
+                self._event_dispatcher, callback, max_events, max_delay_ms)
+        self._subscriptions.catch_all = (
+            self._callback is not None or self._event_batcher is not None)
 
     def load_sss(self, script, scripttype='tcl'):
         '''load script on to the current camelot server.
@@ -764,35 +1031,52 @@ class CamelotServer(object):
 
     def _default_event_callback(self, event):
         found_ep_callback = False
-        log.debug("inside default callback: event: %s \n" % event)
-        log.debug("event epid: %s eventtype: %s \n" %
-                  (event.endpoint_id, event.event_type))
-
-        if self.__endpoints and event.endpoint_id in self.__endpoints:
-            ep = self.__endpoints[event.endpoint_id]
+        ep = self.__endpoints.get(event.endpoint_id)
+        if ep is not None:
+            # before any callback can query the endpoint again
+            if ep._query_cache is not None:
+                ep._query_cache.invalidate_for(event)
+            if ep._state_mirror is not None:
+                ep._state_mirror.apply(event)
+        if self._event_batcher is not None:
+            self._event_batcher.add(event)
+        debug = camlogger.is_debug_enabled(log)
+        if debug:
+            log.debug("inside default callback: event: %s \n", event)
+            log.debug("event epid: %s eventtype: %s \n",
+                      event.endpoint_id, event.event_type)
+
+        if ep is not None:
+            if (event.event_type == EventType.INFO_EVENT and
+                    event.event_sub_type == InfoEventType.STATE):
+                try:
+                    ep._handle_state_event(event, self._event_dispatcher)
+                except Exception:
+                    log.exception('state event handling failed:')
             if (ep._callback is not None):
                 ep._callback(event)
                 found_ep_callback = True
             else:
                 key = "{}:{}".format(event.event_type, event.event_sub_type)
                 if (key in ep._callbackdict):
-                    processThread = Thread(
-                        target=ep._callbackdict[key],
-                        args=(event, ep._callbackarg))
-                    processThread.start()
+                    self._event_dispatcher.submit(
+                        event.endpoint_id, ep._callbackdict[key], event,
+                        ep._callbackarg)
                     found_ep_callback = True
 
-            if found_ep_callback is True:
+            if debug and found_ep_callback is True:
                 log.debug(" ep call back is registered")
-            else:
+            elif debug:
                 log.debug("ep call back is not registered ")
 
         if (found_ep_callback is not True):
-            log.debug(" ep event call back is not registered")
+            if debug:
+                log.debug(" ep event call back is not registered")
             if (self._callback is not None):
-                log.debug("calling server level callback")
+                if debug:
+                    log.debug("calling server level callback")
                 self._callback(event)
-            else:
+            elif debug:
                 log.debug(" no callback registered on server side.. \
                 so ignoring the event")
 
@@ -847,17 +1131,7 @@ class CamelotServer(object):
         if message is None:
             log.warning('No message passed to get Hex length')
             return
-        msg_len = len(message)
-        hex_val_in_str = hex(msg_len)
-        len_hex = len(hex_val_in_str)
-        if len_hex == 3:
-            hex_val_in_str = hex_val_in_str.replace('0x', '000')
-        if len_hex == 4:
-            hex_val_in_str = hex_val_in_str.replace('0x', '00')
-        elif len_hex == 5:
-            hex_val_in_str = hex_val_in_str.replace('0x', '0')
-        len_hex = len(hex_val_in_str)
-        return hex_val_in_str[(len_hex - 4):len_hex]
+        return VAPIEIUtils.get_message_length_hex(message)
 
     def create_out_action_set(self):
         '''
@@ -47,6 +47,29 @@ def getLogger(name):
     return logging.getLogger(name)
 
 
+def is_debug_enabled(logger):
+    '''Returns True if a debug message of logger reaches a handler.
+
+    enable_logging() leaves the camelot logger at DEBUG with its stdout
+    handler at INFO, so logger.isEnabledFor(logging.DEBUG) alone is True
+    even though nothing is printed. The hot path checks this once per call
+    and skips building its debug messages when it is False.
+
+    :parameter logger: logger returned by :py:func:`getLogger`
+    '''
+    if not logger.isEnabledFor(logging.DEBUG):
+        return False
+    current = logger
+    while current:
+        for handler in current.handlers:
+            if handler.level <= logging.DEBUG:
+                return True
+        if not current.propagate:
+            break
+        current = current.parent
+    return False
+
+
 def setLevel(level):
     '''Set's logger level for Camelot logging
 
@@ -10,45 +10,139 @@ from camelot.utils import common_utils
 import camelot
 from camelot import camlogger
 from collections import OrderedDict
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 log = camlogger.getLogger(__name__)
 
+_BRACE = re.compile(r'[{}]')
+# a group nested up to 3 levels deep, else a lone brace
+_GROUP = re.compile(
+    r'{[^{}]*(?:{[^{}]*(?:{[^{}]*}[^{}]*)*}[^{}]*)*}|[{}]')
+_INFO_PATTERN = re.compile(r"""{\w+\s}|
+                            {\w+\s[\w0-9:/.@-]+}|
+                            {\w+\s\w+}|
+                            {\w+\s\+\w+}|
+                            {{*[^{}]*}*
+                        """
+                           '\s{*[^{}]*}*}', re.VERBOSE)
+_LOGMASK_PATTERN = re.compile(
+    r'{\w+\}|{\w+\s[0-9:/.]+}|{\w+\s\w+}|{{*[^{}]*}*')
+_CURRENT_CALL_PATTERN = re.compile(r'{\w+\s+\w}')
+_CURRENT_CALL_KEY_PATTERN = re.compile(r'\w+\s\w')
+_GETCALLS_PATTERN = re.compile(r'{\w+\s\w+\s\w+}')
+_GET_STREAMS_PATTERN = re.compile(r'{[\w+\s]*\w+\s*}')
+_CONFID_PATTERN = re.compile(r'{[\w0-9\s]*\w}')
+_GET_LINES_PATTERN = re.compile(r'{[\w\s.\\[\]+:@-]*}')
+_URI_INDEX_PATTERN = re.compile('\{\d+\}')
+_URIS_PATTERN = re.compile(r'{[0-9]\s{[\w+.:@]*}\s{[\w\s]*')
+_URI_INFO_PATTERN = re.compile(r'[\w+.:@]*[\w\s]*')
+_CMSTATS_TIMESTAMP_PATTERN = re.compile(
+    r'''
+    ^
+    {(timestamp)\s{
+    (?P<registration_event>.+)}\s
+    (?P<ip_addr>.+)\s
+    (?P<date>.+)\s
+    (?P<time>.*)}
+    $
+    ''', re.I | re.VERBOSE)
+
+
+def split_brace_groups(text, start=0):
+    '''Splits the TCL list text into its top level brace groups in one pass.
+    Groups up to 3 levels deep are matched whole, deeper ones are scanned
+    brace by brace.
+
+    :parameter text: Camelot response, e.g. '{state inservice} {lines 1}'
+    :parameter start: index to start from
+    :returns: (groups, depth), groups lists the top level groups in order,
+     with None for every '}' found outside of a group. depth is the number of
+     groups left open at the end of text, 0 when text is balanced.
+
+    >>> split_brace_groups('{state inservice} {{primary cm} 10.20.1.21}')
+    (['{state inservice}', '{{primary cm} 10.20.1.21}'], 0)
+    '''
+    groups = _GROUP.findall(text, start)
+    if '{' not in groups:
+        if '}' in groups:
+            groups = [None if group == '}' else group for group in groups]
+        return groups, 0
+    groups = []
+    pos = start
+    while True:
+        match = _GROUP.search(text, pos)
+        if match is None:
+            return groups, 0
+        token = match.group()
+        if len(token) > 1:
+            groups.append(token)
+            pos = match.end()
+        elif token == '}':
+            groups.append(None)
+            pos = match.end()
+        else:
+            begin = match.start()
+            depth = 0
+            for brace in _BRACE.finditer(text, begin):
+                depth += 1 if brace.group() == '{' else -1
+                if not depth:
+                    break
+            if depth:
+                return groups, depth
+            pos = brace.end()
+            groups.append(text[begin:pos])
+
+
+def loads_json(json_string):
+    '''json.loads into plain dicts, through orjson when it is installed.
+    Input orjson rejects (e.g. integers over 64 bits) is retried with json.
+    '''
+    if orjson is not None:
+        try:
+            return orjson.loads(json_string)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(json_string)
+
 
 class CamelotDecodeHelper(object):
 
+    def _detailed_lines(self, msg):
+        '''Returns the top level groups of msg as parse_detailed and
+        detailed_parse_char_by_char see them and whether msg is complete,
+        i.e. ending with a '}'. A '}' outside of a group gives an empty line,
+        except as the very last character.
+        '''
+        groups, depth = split_brace_groups(msg)
+        complete = msg.endswith('}')
+        if complete and not depth and groups and groups[-1] is None:
+            groups.pop()
+        return ['' if group is None else group for group in groups], complete
+
     def parse_detailed(self, msg, msg_type=None):
         ret_dict = dict()
-        l_index = msg.find('{')
-        if l_index == -1:
+        if '{' not in msg:
             return
-        char_index = 0
-        send_line = ''
-        while char_index < len(msg):
-            r_index = msg.find('}', char_index)
-            if r_index == -1 or char_index >= len(msg):
-                return
-            char_index = r_index + 1
-            attr = msg[l_index:r_index + 1]
-            send_line = attr
+        lines, complete = self._detailed_lines(msg)
+        for send_line in lines:
             ret_val = dict()
-            if send_line.count('{') == send_line.count('}'):
-                if '{attribute {{' in send_line:
-                    val_index = send_line.find('{', 2)
-                    val_end_index = send_line.rfind('}', 0, len(send_line))
-                    ret_val['attribute'] = send_line[val_index:val_end_index]
-                else:
-                    ret_val = (self.
-                               parse_single_line_to_key_value_pair(send_line))
-                l_index = msg.find('{', char_index)
-                send_line = ''
-                for k in ret_val:
-                    key = k
-                    value = ret_val[k]
-                if key:
-                    ret_dict[key] = value
-                pass
+            if '{attribute {{' in send_line:
+                val_index = send_line.find('{', 2)
+                val_end_index = send_line.rfind('}', 0, len(send_line))
+                ret_val['attribute'] = send_line[val_index:val_end_index]
             else:
-                continue
+                ret_val = (self.
+                           parse_single_line_to_key_value_pair(send_line))
+            for k in ret_val:
+                key = k
+                value = ret_val[k]
+            if key:
+                ret_dict[key] = value
+        if not complete:
+            return
 
         if msg_type == camelot.GET_CALL_INFO_EXT:
             ret_obj = CallInfoExt()
@@ -58,32 +152,9 @@ class CamelotDecodeHelper(object):
             return ret_dict
 
     def complex_parse_return_lines(self, response):
-        str_list = []
         response = response.strip()
-        open_braces = 0
-        start = response.index('{')
-        i = start
-        str_tmp = ''
-        while i < len(response):
-            tmp = response[i]
-            if tmp == '{':
-                open_braces += 1
-            elif tmp == '}':
-                open_braces -= 1
-            i += 1
-            str_tmp += tmp
-
-            if open_braces == 0:
-                str_list.append(str_tmp)
-                str_tmp = ''
-                try:
-                    start = response.index('{', i)
-                    i = start
-                except Exception:
-                    break
-                if start == -1:
-                    break
-        return str_list
+        groups, depth = split_brace_groups(response, response.index('{'))
+        return [group for group in groups if group is not None]
 
     def complex_parse_list_into_dict(self, str_list, msg_type=None):
         ret_dict = {}
@@ -188,8 +259,7 @@ class CamelotDecodeHelper(object):
         return ret_list
 
     def parse_logmask(self, response):
-        pat = re.compile(r'{\w+\}|{\w+\s[0-9:/.]+}|{\w+\s\w+}|{{*[^{}]*}*')
-        attribs = re.findall(pat, response)
+        attribs = _LOGMASK_PATTERN.findall(response)
         key_val = {}
         limit = len(attribs)
         for i in xrange(0, limit, 3):
@@ -212,14 +282,7 @@ class CamelotDecodeHelper(object):
 
     def parse_info(self, info, msg_type=None):
 
-        pat = re.compile(r"""{\w+\s}|
-                            {\w+\s[\w0-9:/.@-]+}|
-                            {\w+\s\w+}|
-                            {\w+\s\+\w+}|
-                            {{*[^{}]*}*
-                        """
-                         '\s{*[^{}]*}*}', re.VERBOSE)
-        attribs = re.findall(pat, info)
+        attribs = _INFO_PATTERN.findall(info)
         ret_dict = {}
         for attr in attribs:
             ret_val = self.parse_single_line_to_key_value_pair(attr)
@@ -300,12 +363,10 @@ class CamelotDecodeHelper(object):
             key = attr[key_start_index + 2:key_end_index]
             len_val = len(attr)
             tmpVal = attr[key_end_index + 2:len_val]
-            pat = re.compile(r'{\w+\s+\w}')
-            valuelist = re.findall(pat, tmpVal)
-            pat = re.compile(r'\w+\s\w')
+            valuelist = _CURRENT_CALL_PATTERN.findall(tmpVal)
             value = {}
             for v in valuelist:
-                vkey = re.findall(pat, v)
+                vkey = _CURRENT_CALL_KEY_PATTERN.findall(v)
                 if len(vkey) == 1:
                     data = vkey[0].split(' ')
                     if len(data) == 2:
@@ -367,8 +428,7 @@ class CamelotDecodeHelper(object):
 
     def parse_getcalls(self, output):
 
-        pat = re.compile(r'{\w+\s\w+\s\w+}')
-        attribs = re.findall(pat, output)
+        attribs = _GETCALLS_PATTERN.findall(output)
         call_list = list()
         for attr in attribs:
             attr = attr.strip()
@@ -391,8 +451,7 @@ class CamelotDecodeHelper(object):
 
     def parse_get_streams(self, output):
         output = output.strip()
-        pat = re.compile(r'{[\w+\s]*\w+\s*}')
-        attribs = re.findall(pat, output)
+        attribs = _GET_STREAMS_PATTERN.findall(output)
         streams_list = []
         for attr in attribs:
             attr = attr.strip()
@@ -413,9 +472,7 @@ class CamelotDecodeHelper(object):
     def parse_get_confid_list(self, output):
         output = output.strip()
         # print 'parse_get_confid_list ', output
-        # pat = re.compile(r'{[\w+\s]*\w+}')
-        pat = re.compile(r'{[\w0-9\s]*\w}')
-        attribs = re.findall(pat, output)
+        attribs = _CONFID_PATTERN.findall(output)
         # print 'attibs ', attribs
         streams_list = []
         for attr in attribs:
@@ -432,8 +489,7 @@ class CamelotDecodeHelper(object):
 
     def parse_get_lines(self, output):
         output = output.strip()
-        pat = re.compile(r'{[\w\s.\\[\]+:@-]*}')
-        attribs = re.findall(pat, output)
+        attribs = _GET_LINES_PATTERN.findall(output)
         attribs[0] = attribs[0].replace('\\', '')
         line_list = []
         for attr in attribs:
@@ -452,8 +508,7 @@ class CamelotDecodeHelper(object):
         ret = {}
         uriInfo = {}
         try:
-            pat = re.compile('\{\d+\}')
-            output = ''.join(pat.split(output))
+            output = ''.join(_URI_INDEX_PATTERN.split(output))
         except Exception:
             return ret
         if output:
@@ -468,16 +523,14 @@ class CamelotDecodeHelper(object):
                 uris_end_index = len(line)
                 lindex = line[line_start_index + 1:line_end_index - 1]
                 uriValue = line[uris_start_index:uris_end_index]
-                pat = re.compile(r'{[0-9]\s{[\w+.:@]*}\s{[\w\s]*')
-                lUris = re.findall(pat, uriValue)
+                lUris = _URIS_PATTERN.findall(uriValue)
                 for u in lUris:
                     uriInfo = {}
                     uri_start_index = u.index('{')
                     uri_end_index = u.index('{', uri_start_index + 1)
                     uIndex = u[uri_start_index + 1:uri_end_index - 1]
                     uInfo = u[uri_end_index:len(u)]
-                    pat = re.compile(r'[\w+.:@]*[\w\s]*')
-                    uInfos = re.findall(pat, uInfo)
+                    uInfos = _URI_INFO_PATTERN.findall(uInfo)
                     uInfos.pop(uInfos.index(' '))
                     uInfos = filter(None, uInfos)
                     uriInfo['uri'] = uInfos[0]
@@ -492,48 +545,36 @@ class CamelotDecodeHelper(object):
 
     def detailed_parse_char_by_char(self, msg):
         ret_dict = dict()
-        l_index = msg.find('{')
-        if l_index == -1:
+        if '{' not in msg:
             return
-        char_index = 0
-        send_line = ''
-        while char_index < len(msg):
-            r_index = msg.find('}', char_index)
-            if r_index == -1 or char_index >= len(msg):
-                return
-            char_index = r_index + 1
-            attr = msg[l_index:r_index + 1]
-            send_line = attr
+        lines, complete = self._detailed_lines(msg)
+        for send_line in lines:
             ret_val = dict()
-            if send_line.count('{') == send_line.count('}'):
-                if '{attribute {{' in send_line:
-                    val_index = send_line.find('{', 2)
-                    val_end_index = send_line.rfind('}', 0, len(send_line))
-                    ret_val['attribute'] = send_line[val_index:val_end_index]
-                elif '{{holdreversionreq} {' in send_line:
-                    index = send_line.find('{', 2)
-                    end_index = send_line.rfind('}', 0, len(send_line))
-                    if len(send_line[index:end_index]) > 10:
-                        ret_val['holdreversionreq'] = (
-                            self.parse_holdreversionreq_1
-                            (send_line[index:end_index]))
-                    else:
-                        ret_val = (self.
-                                   parse_single_line_to_key_value_pair
-                                   (send_line))
+            if '{attribute {{' in send_line:
+                val_index = send_line.find('{', 2)
+                val_end_index = send_line.rfind('}', 0, len(send_line))
+                ret_val['attribute'] = send_line[val_index:val_end_index]
+            elif '{{holdreversionreq} {' in send_line:
+                index = send_line.find('{', 2)
+                end_index = send_line.rfind('}', 0, len(send_line))
+                if len(send_line[index:end_index]) > 10:
+                    ret_val['holdreversionreq'] = (
+                        self.parse_holdreversionreq_1
+                        (send_line[index:end_index]))
                 else:
                     ret_val = (self.
-                               parse_single_line_to_key_value_pair(send_line))
-                l_index = msg.find('{', char_index)
-                send_line = ''
-                for k in ret_val:
-                    key = k
-                    value = ret_val[k]
-                if key:
-                    ret_dict[key] = value
-                pass
+                               parse_single_line_to_key_value_pair
+                               (send_line))
             else:
-                continue
+                ret_val = (self.
+                           parse_single_line_to_key_value_pair(send_line))
+            for k in ret_val:
+                key = k
+                value = ret_val[k]
+            if key:
+                ret_dict[key] = value
+        if not complete:
+            return
         return ret_dict
 
     def jsonify_string(self, json_string):
@@ -545,6 +586,16 @@ class CamelotDecodeHelper(object):
                 return decoded_val['JSON_LIST']
             return decoded_val
 
+    def fast_jsonify_string(self, json_string):
+        '''jsonify_string which returns plain dicts, they keep the order of
+        the server but print like any dict.
+        '''
+        if json_string:
+            decoded_val = loads_json(json_string)
+            if isinstance(decoded_val, dict) and 'JSON_LIST' in decoded_val:
+                return decoded_val['JSON_LIST']
+            return decoded_val
+
     def parse_cmstats(self, msg):
         cmstats_part_1 = msg
         cmstats_part_2 = None
@@ -561,17 +612,7 @@ class CamelotDecodeHelper(object):
             ret[key] = int(ret[key])
         ret['timestamps'] = []
         if cmstats_part_2:
-            pat = re.compile(
-                r'''
-                ^
-                {(timestamp)\s{
-                (?P<registration_event>.+)}\s
-                (?P<ip_addr>.+)\s
-                (?P<date>.+)\s
-                (?P<time>.*)}
-                $
-                ''', re.I | re.VERBOSE)
-
+            pat = _CMSTATS_TIMESTAMP_PATTERN
             while cmstats_part_2:
                 if ' {timestamp ' in cmstats_part_2:
                     idx = cmstats_part_2.index(' {timestamp ')
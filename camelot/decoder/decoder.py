@@ -832,35 +832,48 @@ def error_response(request, response, **kargs):
                                    ' from the Camelot[%s]' % vars(response))
 
 
+def _may_be_json(message):
+    '''False when json.loads can't decode message, e.g. for the TCL list
+    '{state inservice} {lines 1}'. A JSON text with a '{' or a '[' starts
+    with one of '{', '[' or '"', and an object goes on with '"' or '}'.
+    '''
+    message = message.lstrip()
+    first = message[:1]
+    if first == '{':
+        return message[1:].lstrip()[:1] in ('"', '}')
+    return first in ('[', '"')
+
+
 def invalid_request(request, responce, **kargs):
     log.warning('Invalid Request %s to Decode' % request)
 
 
 def decode(req_type, request, response, **kargs):
-    log.debug(
-        'Request for decoding response:'
-        '\n\tType: {}'
-        '\n\tRequest: {}'
-        '\n\tResponse: {}'
-        '\n\tResponse Vars: {}'
-        '\n\tkargs: {}'.format(
+    if camlogger.is_debug_enabled(log):
+        log.debug(
+            'Request for decoding response:'
+            '\n\tType: %s'
+            '\n\tRequest: %s'
+            '\n\tResponse: %s'
+            '\n\tResponse Vars: %s'
+            '\n\tkargs: %s',
             req_type, request, response, vars(response), kargs)
-    )
     ack = 'A'
     if hasattr(response, 'ack'):
         ack = response.ack
     if ack == 'A' or req_type != 'ep':
         output_format = kargs.get('output_format')
         srv_resp = response.message
-        json_ptrn_chk = any(i for i in ['{', '['] if i in srv_resp)
+        json_ptrn_chk = '{' in srv_resp or '[' in srv_resp
         if output_format == 'json' and json_ptrn_chk:
+            if (request in camelot.non_json_supported_commands or
+                    not _may_be_json(srv_resp)):
+                return commands.get(request, invalid_request)(
+                    request, response, **kargs)
             try:
-                log.debug("JSON decoding.....")
-                if request not in camelot.non_json_supported_commands:
-                    return decode_helper.jsonify_string(srv_resp)
-                else:
-                    return commands.get(request, invalid_request)(
-                        request, response, **kargs)
+                if kargs.get('fast_json'):
+                    return decode_helper.fast_jsonify_string(srv_resp)
+                return decode_helper.jsonify_string(srv_resp)
             except Exception as e:
                 log.warning('Decoding failed. Falling '
                             'back to non-json {}'.format(e))
@@ -6,6 +6,7 @@ Created on 16-Sep-2013
 import camelot
 from camelot.encoder.encoder_helper import CamelotEncodeHelper
 from camelot import camlogger
+from camelot.utils.vapi_ei_utils import VAPIEIUtils
 
 
 log = camlogger.getLogger(__name__)
@@ -192,7 +193,7 @@ def encode_control_msg(request, *args, **kwargs):
 @request(camelot.RESET_TVS_CACHE)
 @request(camelot.GET_TVS_CLIENTSTATS)
 @request(camelot.GET_TVS_SERVERSTATS)
-def encode_control_msg(request, *args, **kwargs):
+def encode_tvs_control_msg(request, *args, **kwargs):
     ret = encode_helper.get_control_msg(request, *args, **kwargs)
     return ret
 
@@ -923,10 +924,58 @@ def _validate_new_endpont(*args, **kwargs):
             args[0]))
 
 
+def _control_frame_suffixes():
+    '''Precompiled frames of the requests which get_control_msg sends as
+    '<request>@', e.g. {'getinfo': ':0008:getinfo@'}: the frame for an
+    endpoint is 'm:<ep_id>' followed by the suffix. The requests of
+    CONTROL_MSG_PLAIN_WITHOUT_ARGS only use it when called without
+    arguments.
+    '''
+    suffixes = {}
+    for cmd, fn in commands.items():
+        if (fn in (encode_control_msg, encode_tvs_control_msg) and
+                (cmd not in encode_helper.CONTROL_MSG_WITH_ARGS or
+                 cmd in encode_helper.CONTROL_MSG_PLAIN_WITHOUT_ARGS)):
+            message = '%s@' % cmd
+            suffixes[cmd] = ':%s:%s' % (
+                VAPIEIUtils.get_message_length_hex(message), message)
+    return suffixes
+
+
+frame_suffixes = _control_frame_suffixes()
+# frame_suffixes as bytes, for encode_frame
+frame_suffixes_bytes = dict((cmd, suffix.encode())
+                            for cmd, suffix in frame_suffixes.items())
+
+
+def _precompiled(request, args, kwargs):
+    return args and args[0] and not (
+        request in encode_helper.CONTROL_MSG_PLAIN_WITHOUT_ARGS and
+        (kwargs or any(args[1:])))
+
+
 def encode(request, *args, **kwargs):
-    log.debug("Request for encoding response")
+    '''Returns the frame of the request as str.'''
+    suffix = frame_suffixes.get(request)
+    if suffix is not None and _precompiled(request, args, kwargs):
+        return 'm:%s%s' % (args[0], suffix)
     fn = commands.get(request, invalid_request)
     if fn == invalid_request:
         fn(request)
     else:
         return fn(request, *args, **kwargs)
+
+
+def encode_frame(request, *args, **kwargs):
+    '''Returns the frame of the request as bytes, as it is written on the
+    command socket. The frames of the requests of frame_suffixes are built
+    from their precompiled bytes without encoding the message.
+
+    >>> encode_frame(camelot.GET_INFO, '00000001')
+    b'm:00000001:0008:getinfo@'
+    '''
+    suffix = frame_suffixes_bytes.get(request)
+    if suffix is not None and _precompiled(request, args, kwargs):
+        return b'm:%s%s' % (str(args[0]).encode(), suffix)
+    frame = encode(request, *args, **kwargs)
+    return frame.encode() if frame is not None else None
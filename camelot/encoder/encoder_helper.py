@@ -6,6 +6,7 @@ Created on 16-Sep-2013
 import camelot
 import os
 from camelot import camlogger, CamelotError
+from camelot.utils.vapi_ei_utils import VAPIEIUtils
 
 FORMAT = "%s:%s:%s:%s"  # Format for
 log = camlogger.getLogger(__name__)
@@ -17,17 +18,7 @@ class CamelotEncodeHelper(object):
         if message is None:
             log.warning('No message passed to get Hex length')
             return
-        msg_len = len(message)
-        hex_val_in_str = hex(msg_len)
-        len_hex = len(hex_val_in_str)
-        if len_hex == 3:
-            hex_val_in_str = hex_val_in_str.replace('0x', '000')
-        if len_hex == 4:
-            hex_val_in_str = hex_val_in_str.replace('0x', '00')
-        elif len_hex == 5:
-            hex_val_in_str = hex_val_in_str.replace('0x', '0')
-        len_hex = len(hex_val_in_str)
-        return hex_val_in_str[(len_hex - 4):len_hex]
+        return VAPIEIUtils.get_message_length_hex(message)
 
     def get_load_sss_msg(self, *args, **kwargs):
         ''' returns the load sss message
@@ -115,6 +106,8 @@ class CamelotEncodeHelper(object):
         return self.get_out_msg(formated_str_string, args[0])
 
     def get_out_msg(self, message, ep_id, msg_type=None):
+        if ep_id and message is not None:
+            return 'm:%s:%04x:%s' % (ep_id, len(message) & 0xFFFF, message)
         len_msg_in_hex = self._get_message_length_hex(message)
         if ep_id:
             return FORMAT % (
@@ -142,8 +135,8 @@ class CamelotEncodeHelper(object):
     def get_config_header_msg(self, message, *args, **kwargs):
         if len(args) < 1:
             raise camelot.CamelotError('EP ID is not passed')
-        log.debug('get_config_header_msg : '
-                  'args{}\n kwargs{}\n'.format(args, kwargs))
+        log.debug('get_config_header_msg : args%s\n kwargs%s\n',
+                  args, kwargs)
         param = str(kwargs.get('param'))
         value = str(kwargs.get('value'))
         msg = "{}{}{}{}".format(
@@ -234,6 +227,18 @@ class CamelotEncodeHelper(object):
             'c', '00000000', len_msg_in_hex, formated_str_string)
         return outmsg
 
+    # the requests get_control_msg builds from their arguments, it sends
+    # any other one as '<request>@' (see encoder.encode)
+    CONTROL_MSG_WITH_ARGS = frozenset([
+        camelot.GET_BFCP_INFO, camelot.GET_CALL_CRYPTO_INFO, camelot.GET_CALLS,
+        camelot.GET_CALL_INFO, camelot.CTI_GET_RESPONSE_STATUS,
+        camelot.GET_DEVICE_CONFIG, camelot.GET_CERT_INFO,
+        camelot.HTTP_RESPONSE, camelot.CLIENT_FOREGROUND,
+        camelot.REMOVE_CONF_PARTICIPANT])
+    # the ones of CONTROL_MSG_WITH_ARGS which are sent as '<request>@' too
+    # when called with the endpoint id alone, e.g. getcalls without filter
+    CONTROL_MSG_PLAIN_WITHOUT_ARGS = frozenset([camelot.GET_CALLS])
+
     def get_control_msg(self, message, *args, **kwargs):
         if len(args) < 1:
             raise camelot.CamelotError('EP ID is not passed')
@@ -447,7 +452,7 @@ class CamelotEncodeHelper(object):
             msg_id = args[1]
             encoded_msg = '{} {}@'.format(
                 camelot.REMOVE_INACTION_OBJ, msg_id)
-        log.debug("encoded_msg={}".format(encoded_msg))
+        log.debug("encoded_msg=%s", encoded_msg)
         return self.get_out_msg(encoded_msg, ep_id, msg_type)
 
     def get_sip_request(self, message, *args, **kwargs):
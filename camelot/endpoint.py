@@ -2,6 +2,7 @@ import camelot
 from camelot import camlogger, FaxProfile, DivaFaxOptions, DivaFaxMaxSpeed
 import inspect
 from camelot.utils import common_utils
+from camelot.encoder import encoder
 from camelot.vapi.vapi_endpoint_query_control import CamelotEndpointControl
 from camelot.vapi.vapi_call_control import CamelotCallControl
 from camelot.vapi.vapi_supplementary_features import CamelotSFeatureControl
@@ -17,6 +18,12 @@ from camelot.vapi.vapi_cas_features import CamelotCasOperation
 from camelot.utils.rawendpoint_helper import InActionObject
 from camelot.utils.customheader_helper import CustomHeadersObject
 from camelot.vapi.vapi_headset_operations import CamelotHeadsetOperation
+from camelot.events import EventType, InfoEventType
+from camelot import query_cache
+from camelot import state_mirror
+from camelot.state_mirror import ENDPOINT_STATES, StateMirror
+from concurrent.futures import Future
+from threading import RLock
 import string
 
 
@@ -40,6 +47,11 @@ class CamelotEndpoint(CamelotEndpointControl, CamelotCallControl,
         self._callbackarg = {}
         self.func_generic_cmd = None
         self.args_generic_cmd = {}
+        self._state_lock = RLock()
+        self._state_waiters = []
+        self._state_events_on = False
+        self._query_cache = None
+        self._state_mirror = None
 
     def reset_to_default(self, camelot_server_conn):
         '''This resets the endpoint to default when connection
@@ -50,6 +62,24 @@ class CamelotEndpoint(CamelotEndpointControl, CamelotCallControl,
         self._callbackdict = {}
         self._is_valid = True
         self._callbackarg = {}
+        self._state_events_on = False
+        # events may have been lost while the connection was down
+        self._query_cache = None
+        self._state_mirror = None
+        subscriptions = self._event_subscriptions()
+        if subscriptions:
+            subscriptions.unsubscribe(self.ep_id)
+
+    def _event_subscriptions(self):
+        '''Returns the event subscription registry of the server of this
+        endpoint, None if the server is gone.
+        '''
+        try:
+            serv = camelot.get_camelot_server(self.server_conn.server_ip,
+                                              self.server_conn.server_port)
+        except camelot.CamelotError:
+            return None
+        return getattr(serv, '_subscriptions', None)
 
     def run_bcg_auto_cmd(self):
         if not self.func_generic_cmd:
@@ -105,44 +135,49 @@ class CamelotEndpoint(CamelotEndpointControl, CamelotCallControl,
         if not param_value_dict or not isinstance(param_value_dict, dict):
             raise camelot.CamelotError(
                 'Pass {parameter: value} dictionary for configuring endpoint')
+        self._is_valid_object()
         ret = {}
         ret_error = {}
-        is_errored = False
-        order_h264 = 'skinny.cap.vidcaps.0.payloadcapability'
-        if order_h264 in param_value_dict.keys():
-            result = self._send_config_param(order_h264, param_value_dict[
-                                             order_h264])
-            del param_value_dict[order_h264]
-            if result[0]:
-                is_errored = True
-                ret_error[order_h264] = result[1]
-            else:
-                ret[order_h264] = result[1]
-        param_value_list = sorted(param_value_dict)
-        for param in param_value_list:
-            if 'nogencertkey' not in param:
-                result = self._send_config_param(
-                    param, param_value_dict[param])
-            else:
-                log.debug('nogencertkey config not send to camelot')
-            if result[0]:
-                is_errored = True
-                ret_error[param] = result[1]
-            else:
-                ret[param] = result[1]
-        if is_errored:
+        params = self._ordered_config_params(param_value_dict)
+        if len(params) < len(param_value_dict):
+            log.debug('nogencertkey config not send to camelot')
+        # all the config frames are written back to back and the ACKs are
+        # collected in the same order, the h264 capability goes first.
+        conn = self._get_server_conn()
+        try:
+            responses = conn.execute_raw_batch(
+                [encoder.encode_frame(camelot.CONFIG, self.ep_id, param,
+                                      str(param_value_dict[param]))
+                 for param in params])
+        finally:
+            # the batch doesn't go through _query_camelot
+            cache = self._query_cache
+            if cache is not None:
+                cache.invalidate()
+        for param, response in zip(params, responses):
+            try:
+                ret[param] = conn._decode_response(
+                    'ep', camelot.CONFIG, response)
+            except camelot.CamelotError as ce:
+                log.error('Failed to configure ==%s==' % param)
+                ret_error[param] = ce.message
+        if ret_error:
             raise camelot.CamelotError('Failed to configure one or more '
                                        'config params: \n\t%s' % ret_error)
         return ret
 
-    def _send_config_param(self, param, param_value):
-        try:
-            result = self._query_camelot(camelot.CONFIG, param,
-                                         str(param_value))
-        except camelot.CamelotError as ce:
-            log.error('Failed to configure ==%s==' % param)
-            return [True, ce.message]
-        return [False, result]
+    @staticmethod
+    def _ordered_config_params(param_value_dict):
+        '''Returns the params of param_value_dict in the order they are sent
+        to Camelot: skinny.cap.vidcaps.0.payloadcapability first and the
+        rest sorted. nogencertkey params are not sent to Camelot.
+        '''
+        order_h264 = 'skinny.cap.vidcaps.0.payloadcapability'
+        params = [param for param in sorted(param_value_dict)
+                  if param != order_h264 and 'nogencertkey' not in param]
+        if order_h264 in param_value_dict:
+            params.insert(0, order_h264)
+        return params
 
     def config(self, param, value=None):
         '''Set or get the value of a configuration parameter
@@ -592,7 +627,7 @@ class CamelotEndpoint(CamelotEndpointControl, CamelotCallControl,
          'register_reason': '',
          'sip_remote_port;: '5061'}
         '''
-        return self._query_camelot(camelot.GET_INFO)
+        return self._cached_query(camelot.GET_INFO)
 
     def get_unity_info(self):
         '''Get information about an endpoint
@@ -1149,7 +1184,7 @@ class CamelotEndpoint(CamelotEndpointControl, CamelotCallControl,
         {'full_address': '7003@10.20.1.21:5060', 'line_num': '1'}
         '''
         log.debug('Entering get_lines function')
-        return self._query_camelot(camelot.GET_LINES)
+        return self._cached_query(camelot.GET_LINES)
 
     def get_calls(self, **kwargs):
         '''Retrieve current calls associated with an endpoint.
@@ -1188,7 +1223,9 @@ class CamelotEndpoint(CamelotEndpointControl, CamelotCallControl,
         if key in key_list:
             kargs = {'key': key,
                      'value': value}
-        return self._query_camelot(camelot.GET_CALLS, None, **kargs)
+        if kargs:
+            return self._query_camelot(camelot.GET_CALLS, None, **kargs)
+        return self._cached_query(camelot.GET_CALLS, None)
 
     def get_streams(self, mifc_type=None, additional_parms=True):
         '''Return the media streams associated with an endpoint.
@@ -1271,7 +1308,7 @@ class CamelotEndpoint(CamelotEndpointControl, CamelotCallControl,
         }]
         '''
         log.debug('Entering get_streams function')
-        stream_list = self._query_camelot(camelot.GET_STREAMS)
+        stream_list = self._cached_query(camelot.GET_STREAMS)
         ret_list = []
         if additional_parms:
             if stream_list:
@@ -4101,6 +4138,8 @@ class CamelotEndpoint(CamelotEndpointControl, CamelotCallControl,
         Note: If register_event_callback is been called without event_type
         and event_sub_type callback will be registered for all incoming
         events. We can't override it.
+        Events of the endpoint which match no registered callback are
+        dropped by the event reader before they are decoded.
 
         :parameter callback: callback method which can be invoked by SDK
 
@@ -4128,8 +4167,11 @@ class CamelotEndpoint(CamelotEndpointControl, CamelotCallControl,
                 'camelot_ip': '10.106.248.199', 'endpoint_id': '00000003',
                 'camelot_port': 5004, 'message': ''}
         '''
+        subscriptions = self._event_subscriptions()
         if event_type == 'all' and event_sub_type == 'all':
             self._callback = callback
+            if subscriptions:
+                subscriptions.subscribe(self.ep_id)
         else:
             if self._callback:
                 log.warning('Already callback is set for all'
@@ -4139,6 +4181,274 @@ class CamelotEndpoint(CamelotEndpointControl, CamelotCallControl,
                 key = event_type + ":" + event_sub_type
                 self._callbackdict[key] = callback
                 self._callbackarg = evtargsdict
+                if subscriptions:
+                    subscriptions.subscribe(
+                        self.ep_id, event_type,
+                        None if event_sub_type == 'all' else event_sub_type)
+
+    def wait_for_state(self, state, timeout=None):
+        '''Returns a future which is resolved as soon as the endpoint
+        reaches one of the given states. The state info events of the
+        endpoint are used to follow the state, so nothing polls get_info
+        while waiting.
+
+        :parameter state: state or list of states to wait for, e.g.
+         'inservice' or ['inservice', 'outofservice']
+        :parameter timeout: seconds after which the future fails with
+         common_utils.TimeoutException. Default None waits forever
+
+        :returns: concurrent.futures.Future which gives the state reached.
+         From a coroutine it can be awaited with asyncio.wrap_future()
+
+        >>> fut = ep1.wait_for_state('inservice', timeout=120)
+        >>> ep1.init()
+        'outofservice'
+        >>> ep1.inservice()
+        'inservicepending'
+        >>> fut.result()
+        'inservice'
+        '''
+        self._is_valid_object()
+        states = [state] if isinstance(state, str) else list(state)
+        future = Future()
+        waiter = (states, future)
+        with self._state_lock:
+            self._state_waiters.append(waiter)
+            start_events = not self._state_events_on
+            self._state_events_on = True
+        if start_events:
+            subscriptions = self._event_subscriptions()
+            if subscriptions:
+                subscriptions.subscribe(self.ep_id, EventType.INFO_EVENT,
+                                        InfoEventType.STATE)
+        try:
+            if start_events:
+                self.start_info_events(InfoEventType.STATE)
+            # the state may have been reached before the events were on
+            self._resolve_state_waiters(self.get_info()['state'])
+        except Exception:
+            with self._state_lock:
+                if waiter in self._state_waiters:
+                    self._state_waiters.remove(waiter)
+                if start_events:
+                    self._state_events_on = False
+            raise
+        if timeout is not None and not future.done():
+            common_utils.deadline_timer.schedule(
+                timeout, self._expire_state_waiter, waiter, timeout)
+        return future
+
+    def _expire_state_waiter(self, waiter, timeout):
+        with self._state_lock:
+            if waiter not in self._state_waiters:
+                return
+            self._state_waiters.remove(waiter)
+            states, future = waiter
+            future.set_exception(common_utils.TimeoutException(
+                'endpoint {} did not reach {} within {}s'.format(
+                    self.ep_id, states, timeout)))
+
+    def _resolve_state_waiters(self, state):
+        with self._state_lock:
+            reached = [waiter for waiter in self._state_waiters
+                       if state in waiter[0]]
+            for waiter in reached:
+                self._state_waiters.remove(waiter)
+                waiter[1].set_result(state)
+
+    def _handle_state_event(self, event, dispatcher):
+        '''Resolves the state waiters with the state carried by the event.
+        Runs on the event reader, so when the event doesn't carry the state
+        the get_info which fetches it is queued on the dispatcher.
+        '''
+        if not self._state_waiters:
+            return
+        tokens = event.message_tokens
+        if tokens and tokens[0] in ENDPOINT_STATES:
+            state = tokens[0]
+        else:
+            dispatcher.submit(self.ep_id, self._refresh_state_waiters)
+            return
+        log.debug('state event on {}: {}'.format(self.ep_id, state))
+        self._resolve_state_waiters(state)
+
+    def _refresh_state_waiters(self):
+        if self._state_waiters:
+            self._resolve_state_waiters(self.get_info()['state'])
+
+    def enable_query_cache(self, ttl=query_cache.QueryCache.DEFAULT_TTL):
+        '''Caches the results of get_info, get_lines, get_calls (without
+        filter) and get_streams of the endpoint, so polling them doesn't
+        query Camelot every time.
+
+        A result is dropped as soon as an event of the endpoint changes it:
+        the state, calls and streams info events, the call events and the
+        ccmreg station event. The info events of those types and the call
+        events are turned on for this, and stay on when the cache is
+        disabled. The results are also dropped once any other command than
+        a get request is sent for the endpoint through this object, e.g.
+        place_call or inservice, so the next query reads what it changed.
+
+        :parameter ttl: seconds a result is kept at most, in case an event
+         is lost
+
+        :returns: True
+
+        >>> ep1.enable_query_cache(ttl=10)
+        True
+        >>> ep1.get_info()['state']
+        'inservice'
+        >>> ep1.get_query_cache_stats()['getinfo']
+        {'hits': 0, 'misses': 1, 'invalidations': 0, 'expired': 0}
+        '''
+        self._is_valid_object()
+        subscriptions = self._event_subscriptions()
+        if subscriptions:
+            for event_type, event_sub_type in query_cache.SUBSCRIPTIONS:
+                subscriptions.subscribe(self.ep_id, event_type,
+                                        event_sub_type)
+        for info_type in (InfoEventType.STATE, InfoEventType.CALLS,
+                          EventType.STREAMS):
+            self.start_info_events(info_type)
+        self.start_call_events()
+        # only cache once the events which invalidate it are on
+        self._query_cache = query_cache.QueryCache(ttl)
+        return True
+
+    def disable_query_cache(self):
+        '''Stops caching the query results of the endpoint.'''
+        self._query_cache = None
+
+    def get_query_cache_stats(self):
+        '''Returns the hits, misses, invalidations and expired entries of
+        the query cache by request, None if the cache is not enabled.
+        '''
+        cache = self._query_cache
+        return cache.get_stats() if cache is not None else None
+
+    def _cached_query(self, request, *args):
+        '''_query_camelot for the requests of query_cache.CACHED_REQUESTS,
+        answered from the query cache when it is enabled.
+        '''
+        cache = self._query_cache
+        if cache is None:
+            return self._query_camelot(request, *args)
+        self._is_valid_object()
+        hit, result = cache.get(request)
+        if hit:
+            return result
+        generation = result
+        result = self._query_camelot(request, *args)
+        cache.put(request, result, generation)
+        return result
+
+    def _query_camelot(self, request, *args, **kwargs):
+        '''Drops the cached query results once a command which may change
+        them is answered: the results queried before can't be stored then.
+        '''
+        cache = self._query_cache
+        if cache is None or query_cache.is_query(request):
+            return super(CamelotEndpoint, self)._query_camelot(
+                request, *args, **kwargs)
+        try:
+            return super(CamelotEndpoint, self)._query_camelot(
+                request, *args, **kwargs)
+        finally:
+            cache.invalidate()
+
+    def enable_state_mirror(self):
+        '''Keeps a local mirror of the state, calls and streams of the
+        endpoint, updated from its info, streams and call events, so
+        :py:attr:`state`, :py:attr:`active_calls`, :py:attr:`call_count`
+        and :py:attr:`stream_count` are read without querying Camelot.
+
+        The state, calls and streams info events and the call events are
+        turned on for this and stay on when the mirror is disabled. The
+        mirror is seeded from get_info and get_calls; calling this again
+        seeds a new mirror, e.g. after events may have been lost.
+
+        :returns: True
+
+        >>> ep1.enable_state_mirror()
+        True
+        >>> ep1.state
+        'inservice'
+        >>> ep1.place_call('7002')
+        '0xeff5c001'
+        >>> ep1.active_calls
+        {'0xeff5c001': 'proceeding'}
+        '''
+        self._is_valid_object()
+        subscriptions = self._event_subscriptions()
+        if subscriptions:
+            for event_type, event_sub_type in state_mirror.SUBSCRIPTIONS:
+                subscriptions.subscribe(self.ep_id, event_type,
+                                        event_sub_type)
+        for info_type in (InfoEventType.STATE, InfoEventType.CALLS,
+                          EventType.STREAMS):
+            self.start_info_events(info_type)
+        self.start_call_events()
+        # events are applied from here on, so none is lost while seeding
+        mirror = StateMirror()
+        self._state_mirror = mirror
+        versions = mirror.versions()
+        mirror.seed(versions, self.get_info(), self.get_calls())
+        return True
+
+    def disable_state_mirror(self):
+        '''Stops mirroring the endpoint, the properties query Camelot
+        again.
+        '''
+        self._state_mirror = None
+
+    @property
+    def state(self):
+        '''The state of the endpoint, e.g. 'inservice'. Read from the
+        state mirror when enabled (see :py:meth:`enable_state_mirror`),
+        else from get_info.
+        '''
+        mirror = self._state_mirror
+        if mirror is not None and mirror.state is not None:
+            return mirror.state
+        info = self.get_info()
+        return info.get('state') if info else None
+
+    @property
+    def active_calls(self):
+        '''{call_ref: call state} of the calls of the endpoint. Read from
+        the state mirror when enabled, else from get_calls.
+        '''
+        mirror = self._state_mirror
+        if mirror is not None:
+            return mirror.active_calls
+        return dict((call.get('call_ref') or call.get('Ref'),
+                     call.get('state')) for call in self.get_calls() or [])
+
+    @property
+    def call_count(self):
+        '''The number of calls of the endpoint. Read from the state mirror
+        when enabled, else from get_info.
+        '''
+        return self._mirrored_count('call_count', 'calls')
+
+    @property
+    def stream_count(self):
+        '''The number of media streams of the endpoint. Read from the
+        state mirror when enabled, else from get_info.
+        '''
+        return self._mirrored_count('stream_count', 'streams')
+
+    def _mirrored_count(self, attr, info_key):
+        mirror = self._state_mirror
+        if mirror is not None:
+            count = getattr(mirror, attr)
+            if count is not None:
+                return count
+        info = self.get_info()
+        try:
+            return int(info[info_key])
+        except (TypeError, KeyError, ValueError):
+            return None
 
     def _get_message_length_hex(self, message):
         if not message:
@@ -4162,10 +4472,9 @@ class CamelotEndpoint(CamelotEndpointControl, CamelotCallControl,
         return self._camelot_query(rawmessage)
 
     def _camelot_query(self, encoded_msg):
-        with self._get_server_conn().command_lock:
-            ret = self._get_server_conn()._send_and_receive(encoded_msg)
-            if ret.message:
-                return ret.message
+        ret = self._get_server_conn().execute_raw_command(encoded_msg)
+        if ret.message:
+            return ret.message
 
     def get_rpid(self, call_ref):
         '''Get Latest Remote-Party-ID information of a call.
@@ -0,0 +1,173 @@
+'''
+Bounded pool of worker threads which run the endpoint event callbacks.
+'''
+from threading import Thread, Lock
+import time
+import zlib
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+from camelot import camlogger
+from camelot.utils import common_utils
+
+log = camlogger.getLogger(__name__)
+
+
+class EventDispatcher(object):
+    '''Runs event callbacks on a fixed number of worker threads.
+
+    Every endpoint is pinned to one worker by a hash of its ep_id, so the
+    callbacks for one endpoint run one at a time in the order the events
+    arrived, while different endpoints are spread over all the workers.
+    '''
+    DEFAULT_WORKERS = 8
+
+    def __init__(self, workers=DEFAULT_WORKERS, name='camelot-event'):
+        self.workers = max(workers, 1)
+        self.name = name
+        self._queues = [queue.Queue() for i in range(self.workers)]
+        self._threads = []
+        self._start_lock = Lock()
+        self._stats_lock = Lock()
+        self._stopped = False
+        self._dispatched = 0
+        self._errors = 0
+        self._max_queue_depth = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    def _start(self):
+        with self._start_lock:
+            if self._threads:
+                return
+            for index, work_queue in enumerate(self._queues):
+                worker = Thread(target=self._run, args=(work_queue,),
+                                name='{}-{}'.format(self.name, index))
+                worker.daemon = True
+                worker.start()
+                self._threads.append(worker)
+
+    def submit(self, ep_id, callback, *args):
+        '''Queues callback(*args) on the worker of ep_id.'''
+        if self._stopped:
+            return
+        if not self._threads:
+            self._start()
+        work_queue = self._queues[
+            zlib.crc32(str(ep_id).encode()) % self.workers]
+        work_queue.put((time.time(), callback, args))
+        depth = work_queue.qsize()
+        if depth > self._max_queue_depth:
+            self._max_queue_depth = depth
+
+    def _run(self, work_queue):
+        while True:
+            item = work_queue.get()
+            if item is None:
+                break
+            queued_at, callback, args = item
+            latency = time.time() - queued_at
+            try:
+                callback(*args)
+            except Exception:
+                log.exception('event callback {} failed:'.format(callback))
+                with self._stats_lock:
+                    self._errors += 1
+            with self._stats_lock:
+                self._dispatched += 1
+                self._latency_total += latency
+                if latency > self._latency_max:
+                    self._latency_max = latency
+
+    def stop(self, timeout=None):
+        '''Lets the workers finish the queued callbacks and stops them.'''
+        self._stopped = True
+        for work_queue in self._queues:
+            work_queue.put(None)
+        for worker in self._threads:
+            worker.join(timeout)
+
+    def get_stats(self):
+        '''Returns the dispatch counters.
+
+        :returns: dictionary with following fields:\n
+            * workers - number of worker threads
+            * queue_depth - callbacks waiting to run, per worker
+            * max_queue_depth - highest depth seen on one worker
+            * dispatched - callbacks run so far
+            * errors - callbacks which raised an exception
+            * latency_avg_ms - average time from the event being queued to
+              its callback being started
+            * latency_max_ms - highest such time
+        '''
+        with self._stats_lock:
+            dispatched = self._dispatched
+            return {'workers': self.workers,
+                    'queue_depth': [work_queue.qsize()
+                                    for work_queue in self._queues],
+                    'max_queue_depth': self._max_queue_depth,
+                    'dispatched': dispatched,
+                    'errors': self._errors,
+                    'latency_avg_ms': round(
+                        self._latency_total * 1000 / dispatched, 3)
+                    if dispatched else 0.0,
+                    'latency_max_ms': round(self._latency_max * 1000, 3)}
+
+
+class EventBatcher(object):
+    '''Gathers events and hands them to one callback as a list, once
+    max_events are gathered or max_delay_ms after the first event of the
+    batch, whichever comes first.
+
+    The batches are run on a worker of the dispatcher, one at a time and in
+    the order the events arrived.
+    '''
+    BATCH_KEY = 'event-batch'
+
+    def __init__(self, dispatcher, callback, max_events=100, max_delay_ms=50):
+        self.dispatcher = dispatcher
+        self.callback = callback
+        self.max_events = max(max_events, 1)
+        self.max_delay_ms = max_delay_ms
+        self._lock = Lock()
+        self._events = []
+        self._batch_seq = 0
+        self._batches = 0
+        self._events_total = 0
+
+    def add(self, event):
+        with self._lock:
+            self._events.append(event)
+            if len(self._events) >= self.max_events:
+                self._flush()
+            elif len(self._events) == 1:
+                common_utils.deadline_timer.schedule(
+                    self.max_delay_ms / 1000.0, self._flush_due,
+                    self._batch_seq)
+
+    def _flush_due(self, batch_seq):
+        with self._lock:
+            if batch_seq == self._batch_seq:
+                self._flush()
+
+    def _flush(self):
+        if not self._events:
+            return
+        events = self._events
+        self._events = []
+        self._batch_seq += 1
+        self._batches += 1
+        self._events_total += len(events)
+        self.dispatcher.submit(EventBatcher.BATCH_KEY, self.callback, events)
+
+    def flush(self):
+        '''Hands the events gathered so far to the callback now.'''
+        with self._lock:
+            self._flush()
+
+    def get_stats(self):
+        with self._lock:
+            return {'batches': self._batches,
+                    'events': self._events_total,
+                    'pending': len(self._events)}
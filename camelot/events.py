@@ -1,3 +1,4 @@
+from threading import Lock
 from camelot import camlogger
 
 log = camlogger.getLogger(__name__)
@@ -37,6 +38,17 @@ class InfoEventType(object):
     TRANSPORTS = 'transports'
 
 
+class EndpointState(object):
+    UNINITIALIZED = 'uninitialized'
+    INIT_PENDING = 'initpending'
+    OUT_OF_SERVICE = 'outofservice'
+    IN_SERVICE_PENDING = 'inservicepending'
+    IN_SERVICE = 'inservice'
+    OUT_OF_SERVICE_PENDING = 'outofservicepending'
+    CLIENT_SUSPENDED = 'client_suspended'
+    CLIENT_FOREGROUND_PENDING = 'client_foregroundpending'
+
+
 class StationEventType(object):
     RING = 'ring'
     START_TONE = 'starttone'
@@ -65,13 +77,34 @@ class StationEventType(object):
     ENVELOPE = 'envelope'
 
 
+INFO_EVENT_SUB_TYPES = frozenset([InfoEventType.STATE,
+                                  InfoEventType.CALLS,
+                                  InfoEventType.BACKUPCM,
+                                  InfoEventType.BCGREADY,
+                                  InfoEventType.LOSTCONN,
+                                  InfoEventType.PRIMARYCM])
+SUB_TYPED_EVENT_TYPES = frozenset([EventType.STATION_EVENT,
+                                   EventType.CALL_EVENT])
+
+
 class Event(object):
+    '''One event received from the Camelot server.
+
+    event_type and event_sub_type are decoded when the event is built, the
+    message body is only cut out of the raw event text when message is
+    first read, and split into tokens when message_tokens is first read.
+    '''
+    __slots__ = ('camelot_ip', 'camelot_port', 'endpoint_id', 'event_type',
+                 'event_sub_type', '_raw', '_message', '_tokens')
+
     _CAMELOT_IP = 'camelot_ip'
     _CAMELOT_PORT = 'camelot_port'
     _ENDPOINT_ID = 'endpoint_id'
     _EVENT_TYPE = 'event_type'
     _EVENT_SUB_TYPE = 'event_sub_type'
     _MESSAGE = 'message'
+    _FIELDS = (_CAMELOT_IP, _CAMELOT_PORT, _ENDPOINT_ID, _EVENT_TYPE,
+               _EVENT_SUB_TYPE, _MESSAGE)
 
     def __init__(self):
         self.camelot_ip = None
@@ -79,7 +112,62 @@ class Event(object):
         self.endpoint_id = None
         self.event_type = None
         self.event_sub_type = None
-        self.message = None
+        self._raw = None
+        self._message = None
+        self._tokens = None
+
+    @classmethod
+    def from_message(cls, camelot_ip, camelot_port, endpoint_id, raw):
+        '''Builds the event for the raw text of an event frame, e.g.
+        "station 17:27:33:314 ccmreg {registration ok} 10.20.1.21".
+        '''
+        event = cls()
+        event.camelot_ip = camelot_ip or None
+        event.camelot_port = camelot_port or None
+        event.endpoint_id = endpoint_id or None
+        event._raw = raw
+        event.event_type, event.event_sub_type = cls.classify(raw)
+        return event
+
+    @staticmethod
+    def classify(raw):
+        '''Returns (event_type, event_sub_type) of the raw text of an event
+        frame without building the event.
+        '''
+        event_type, sep, rest = raw.partition(' ')
+        if event_type in INFO_EVENT_SUB_TYPES:
+            return EventType.INFO_EVENT, event_type
+        if event_type in SUB_TYPED_EVENT_TYPES:
+            tokens = rest.split(' ', 2)
+            if len(tokens) > 1:
+                return event_type, tokens[1] or None
+        return event_type or None, None
+
+    @property
+    def message(self):
+        if self._raw is not None:
+            self._message = self._raw.partition(' ')[2] or None
+            self._raw = None
+        return self._message
+
+    @message.setter
+    def message(self, value):
+        self._raw = None
+        self._tokens = None
+        self._message = value
+
+    @property
+    def message_tokens(self):
+        '''The message split on spaces, split once on first access.'''
+        if self._tokens is None:
+            message = self.message
+            self._tokens = message.split(' ') if message else []
+        return self._tokens
+
+    @property
+    def __dict__(self):
+        # keeps vars(event) and event.__dict__ working for the callbacks
+        return dict((field, getattr(self, field)) for field in Event._FIELDS)
 
     def _copy_from_dict(self, event_dict):
         if type(event_dict) == dict:
@@ -98,3 +186,63 @@ class Event(object):
         else:
             log.error('passed parameter is not of type dict')
             return
+
+
+class EventSubscriptions(object):
+    '''Registry of the events somebody listens to, keyed by
+    (ep_id, event_type, event_sub_type) where None matches any type or sub
+    type.
+
+    The event reader asks :py:meth:`wants` before it builds an Event, so the
+    events of endpoints without a callback (e.g. the streamstate churn of a
+    load test) are dropped right after the frame is read. A callback for
+    all events of the server turns the filter off.
+    '''
+
+    def __init__(self):
+        self._lock = Lock()
+        self._by_ep = {}
+        self.catch_all = False
+        self.delivered = 0
+        self.dropped = 0
+
+    def subscribe(self, ep_id, event_type=None, event_sub_type=None):
+        '''Admits the events of ep_id of the given type and sub type.'''
+        if event_type is None:
+            event_sub_type = None
+        with self._lock:
+            # copy on write, the reader thread looks the sets up unlocked
+            keys = set(self._by_ep.get(ep_id, ()))
+            keys.add((event_type, event_sub_type))
+            self._by_ep[ep_id] = frozenset(keys)
+
+    def unsubscribe(self, ep_id):
+        '''Drops every subscription of ep_id.'''
+        with self._lock:
+            self._by_ep.pop(ep_id, None)
+
+    def wants(self, ep_id, raw):
+        '''Returns True if the event of ep_id with the raw text raw has a
+        subscriber. The event text is only looked at for endpoints which
+        subscribed to some of their events.
+        '''
+        if not self.catch_all:
+            keys = self._by_ep.get(ep_id)
+            if not keys or not ((None, None) in keys or
+                                self._matches(keys, raw)):
+                self.dropped += 1
+                return False
+        self.delivered += 1
+        return True
+
+    @staticmethod
+    def _matches(keys, raw):
+        event_type, event_sub_type = Event.classify(raw)
+        return ((event_type, None) in keys or
+                (event_type, event_sub_type) in keys)
+
+    def get_stats(self):
+        return {'catch_all': self.catch_all,
+                'subscribed_endpoints': len(self._by_ep),
+                'delivered': self.delivered,
+                'dropped': self.dropped}
@@ -3,7 +3,12 @@ Created on 11-Sep-2013
 
 @author: smaturi
 '''
-from threading import RLock
+from threading import RLock, Condition, Event, Thread
+from collections import deque
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 import socket
 import sys
 import time
@@ -11,6 +16,11 @@ from camelot.utils.server_utils import CamelotServerResponse
 from camelot.decoder import decoder
 import camelot
 from camelot.protocol.tcp.camelot_event_connection import EventConnection
+from camelot.protocol.tcp.event_reactor import (
+    event_reactor as shared_event_reactor)
+from camelot.protocol.tcp.frame_reader import FrameReader
+from camelot.protocol.tcp.transport_stats import (CommandTimer,
+                                                  TransportStats)
 from camelot import camlogger
 from camelot.utils.vapi_ei_utils import VAPIEIUtils
 
@@ -22,46 +32,162 @@ class ConnectionError(Exception):
     pass
 
 
+if sys.version_info < (3, 0):
+    text_type = unicode  # noqa: F821
+else:
+    text_type = str
+
+
+def frame_bytes(frames):
+    '''Returns the frames, str or bytes, joined as bytes.'''
+    return b''.join(frame if isinstance(frame, bytes) else frame.encode()
+                    for frame in frames)
+
+
+def frame_ep_id(command):
+    '''Returns the endpoint id a framed command, str or bytes, is addressed
+    to, or None for the frames which are not addressed to an endpoint
+    ('c:', 'l:' or the '00000000' endpoint).
+    '''
+    if isinstance(command, bytes):
+        tokens = command.split(b':', 2)
+        if len(tokens) < 3 or tokens[0] != b'm':
+            return None
+        ep_id = tokens[1].decode()
+    else:
+        tokens = command.split(VAPIEIUtils.ACK_DELIM, 2)
+        if len(tokens) < 3 or tokens[0] != 'm':
+            return None
+        ep_id = tokens[1]
+    if ep_id == Connection.NO_EP_ID:
+        return None
+    return ep_id
+
+
 class CamelotSocket(object):
+    '''Socket of a Camelot connection. Frames go out as bytes: the frames
+    precompiled by the encoder are bytes and are written as they are, a str
+    frame is encoded once in send. Frames are read
+    as bytes with recv_into by the FrameReader, which decodes each payload
+    once. Other attributes are the ones of the wrapped socket.
+    '''
+
     def __init__(self, conn):
         self._conn = conn
+        self.recv_into = conn.recv_into
 
     def __getattr__(self, name):
-        if name in ['send', 'recv', 'sendall']:
-            return eval('self.%s' % name)
-        return eval('self._conn.%s' % name)
+        return getattr(self._conn, name)
 
     def send(self, message):
-        if sys.version_info < (3, 5):
-            self._conn.send(message)
-        else:
-            self._conn.send(message.encode())
+        if isinstance(message, text_type):
+            message = message.encode()
+        self._conn.sendall(message)
 
-    def sendall(self, message):
-        if sys.version_info < (3, 5):
-            self._conn.sendall(message)
-        else:
-            self._conn.sendall(message.encode())
+    sendall = send
 
-    def recv(self, bufsize, *args):
-        if sys.version_info < (3, 5):
+    if sys.version_info < (3, 0):
+        def recv(self, bufsize, *args):
             return self._conn.recv(bufsize, *args)
-        else:
-            data = self._conn.recv(bufsize, *args)
-            return data.decode()
+    else:
+        def recv(self, bufsize, *args):
+            return self._conn.recv(bufsize, *args).decode()
+
+
+class PendingCommand(object):
+    '''A command written on a pipelined connection and waiting for its ACK.
+    An abandoned command has failed without its ACK, it stays queued to
+    match and drop the ACK if it comes late. A command is skewed once a
+    late ACK was dropped ahead of it: that ACK may have been its own.
+    '''
+
+    def __init__(self, ep_id, command):
+        self.ep_id = ep_id
+        self.command = command
+        self.response = None
+        self.abandoned = False
+        self.skewed = False
+        self.done = Event()
+
+
+class GenericSocket(object):
+    '''Persistent socket used for the non endpoint ("generic") requests,
+    which are answered with a single newline terminated line.
+    '''
+
+    def __init__(self, socket_id, server_ip, server_port, timeout):
+        self.socket_id = socket_id
+        self.server_ip = server_ip
+        self.server_port = server_port
+        self.timeout = timeout
+        self._sock = None
+        self._reader = None
+        self.requests = 0
+        self.connects = 0
+        self.reconnects = 0
+        self.failures = 0
+
+    def is_connected(self):
+        return self._sock is not None
+
+    def connect(self):
+        self.close()
+        self._sock = CamelotSocket(socket.create_connection(
+            (self.server_ip, self.server_port), timeout=self.timeout))
+        self._reader = FrameReader(self._sock)
+        if self.connects:
+            self.reconnects += 1
+        self.connects += 1
+
+    def close(self):
+        if self._sock:
+            try:
+                self._sock.close()
+            except Exception:
+                pass
+        self._sock = None
+        self._reader = None
+
+    def request(self, command):
+        if not self._sock:
+            self.connect()
+        self._sock.sendall(command)
+        ret_val = self._reader.read_line()
+        if ret_val:
+            self.requests += 1
+        if self._reader.eof:
+            # server closed the socket after replying, reconnect on next use
+            self.close()
+        return ret_val
+
+    def get_stats(self):
+        return {'socket_id': self.socket_id,
+                'connected': self.is_connected(),
+                'requests': self.requests,
+                'reconnects': self.reconnects,
+                'failures': self.failures}
 
 
 class Connection(object):
     SOCKET_TIMEOUT = 4
     HAND_SHAKE_CHARS_TO_READ = 4
     HEX_TO_DIGIT_RADIX = 16
-    MESSAGE_ACK_CHARS_TO_READ = 16
-    MESSAGE_ACK_READ_ONE_CHAR = 1
     NO_OF_TOKENS_IN_MESSAGE_ACK = 3
     RE_TRYS = 3
     NO_OF_SOCKET_FAILURES_TO_RECONNECT = 3
+    NO_EP_ID = '00000000'
+    GENERIC_POOL_SIZE = 2
+    # wrapper of the command socket
+    socket_class = CamelotSocket
+    # commands of a batch written before their ACKs are read
+    BATCH_CHUNK = 256
+    # timeout of a batch: BATCH_TIMEOUT plus BATCH_COMMAND_TIMEOUT per command
+    BATCH_TIMEOUT = 10
+    BATCH_COMMAND_TIMEOUT = 0.01
 
-    def __init__(self, servr_ip, server_port, connection_key, version):
+    def __init__(self, servr_ip, server_port, connection_key, version,
+                 pipelined=False, generic_pool_size=GENERIC_POOL_SIZE,
+                 event_reactor=False, transport_stats=None, fast_json=False):
         self.server_ip = servr_ip
         self.server_port = server_port
         self.connection_key = connection_key
@@ -69,6 +195,28 @@ class Connection(object):
         self._stopped = False
         self.version = version
         self.output_format = 'non_json'
+        self.fast_json = fast_json
+        self.pipelined = pipelined
+        self.event_reactor = event_reactor
+        self.transport_stats = transport_stats or TransportStats()
+        self._send_lock = RLock()
+        self._pending_cond = Condition()
+        self._pending = {}
+        self._exclusive = False
+        self._inflight = 0
+        self._max_inflight = 0
+        self._pipelined_commands = 0
+        self._unmatched_responses = 0
+        self._late_responses = 0
+        self._timed_out_commands = 0
+        self._reader_thread = None
+        self._generic_sockets = [
+            GenericSocket(sock_id, servr_ip, server_port,
+                          Connection.SOCKET_TIMEOUT)
+            for sock_id in range(max(generic_pool_size, 1))]
+        self._idle_generic_sockets = queue.Queue()
+        for generic_sock in self._generic_sockets:
+            self._idle_generic_sockets.put(generic_sock)
 
     def _check_json_support_version(self):
         i_ver = self.version
@@ -86,8 +234,9 @@ class Connection(object):
         return False
 
     def init_connection(self, conn_id):
-        self._connection = CamelotSocket(socket.create_connection(
+        self._connection = self.socket_class(socket.create_connection(
             (self.server_ip, self.server_port)))
+        self._reader = FrameReader(self._connection)
 
         self._hand_shake_with_server()
         if self._check_json_support_version():
@@ -99,28 +248,22 @@ class Connection(object):
 
         self.connection_id = conn_id
 
+        if self.pipelined:
+            self._reader_thread = Thread(target=self._pipeline_reader)
+            self._reader_thread.daemon = True
+            self._reader_thread.start()
+
         log.debug("Created connection: " + self.connection_id)
 
     def _camelot_query(self, encoded_msg):
         self._connection.send(encoded_msg)
-        char_to_read = 16
-        output_format = self._connection.recv(char_to_read)
-        if output_format:
-            log.debug("Camelot response recevied for [%s]: [%s]" % (
-                encoded_msg, output_format))
-            camelot_list = output_format.split(':')
-            log.debug("Message after spliting: [%s]" % camelot_list)
-            if len(camelot_list) >= 3 and camelot_list[2]:
-                char_to_read = int(camelot_list[2], 16)
-                output_format = self._connection.recv(char_to_read)
-                log.debug("Received Event port: %s" % output_format)
-            else:
-                raise ConnectionError('length received from'
-                                      ' camelot is invalid')
-        else:
-            raise ConnectionError('Unable to fetch the Event '
-                                  'Port from the Camelot server')
-        return output_format
+        frame = self._reader.read_frame()
+        if not frame:
+            raise ConnectionError('Unable to fetch the response '
+                                  'from the Camelot server')
+        log.debug("Camelot response recevied for [%s]: [%s]",
+                  encoded_msg, frame)
+        return frame[2]
 
     def _set_output_format(self):
         ''' get output format from server side.
@@ -150,19 +293,20 @@ class Connection(object):
         # self._connection.flush()
 
         buffer_to_read = 1
-        data = self._connection.recv(buffer_to_read)
+        data = self._reader.read_exact(buffer_to_read)
 
         log.debug("Version response received: %s" % data)
 
         hand_shake_res = data
 
         if not hand_shake_res or hand_shake_res[0] != 'a':
-            data = self._connection.recv(Connection.HAND_SHAKE_CHARS_TO_READ)
+            data = self._reader.read_exact(
+                Connection.HAND_SHAKE_CHARS_TO_READ)
 
             log.debug("Handshake failed, failure reason length: " + data)
 
             charsToRead = int(data)
-            failReason = self._connection.recv(charsToRead)
+            failReason = self._reader.read_exact(charsToRead)
             error_str = ("Client package: %s not compatible with server, "
                          "failure reason: %s" % (client_version, failReason))
 
@@ -175,7 +319,7 @@ class Connection(object):
         self._connection.send(ver_H_User)
 
         charsToRead = Connection.HAND_SHAKE_CHARS_TO_READ
-        event_port_str = self._connection.recv(charsToRead)
+        event_port_str = self._reader.read_exact(charsToRead)
         if not event_port_str:
             raise ConnectionError('Unable to fetch the Event '
                                   'Port from the Camelot server')
@@ -187,109 +331,85 @@ class Connection(object):
             (self.server_ip, event_port),
             Connection.SOCKET_TIMEOUT))
         self._event_process = EventConnection(
-            self._event_socket, self.server_ip, self.server_port, self)
+            self._event_socket, self.server_ip, self.server_port, self,
+            reactor=shared_event_reactor if self.event_reactor else None)
         self._event_process.start()
         log.debug("Received Event socket connection: %s" % self._event_socket)
 
-    def _send_and_receive_generic(self, command):
+    def _send_and_receive_generic(self, command, timer=None):
         retVal = ''
         res = None
+        generic_sock = self._idle_generic_sockets.get()
+        if timer:
+            timer.lock_acquired = CommandTimer.now()
         try:
-            tmpSoc = CamelotSocket(socket.create_connection(
-                (self.server_ip, self.server_port),
-                timeout=Connection.SOCKET_TIMEOUT))
-            tmpSoc.sendall(command)
             for i in range(Connection.RE_TRYS):
+                # only a socket which was idle in the pool can be stale, a
+                # failure on a freshly connected socket is final.
+                reused = generic_sock.is_connected()
                 try:
-                    while True:
-                        val = tmpSoc.recv(1)
-                        if not val or val == '\n':
-                            break
-                        retVal = '%s%s' % (retVal, val)
+                    retVal = generic_sock.request(command)
                 except Exception as ioe:
-                    log.exception('_send_and_receive failed:')
+                    generic_sock.failures += 1
+                    generic_sock.close()
+                    log.exception('_send_and_receive_generic failed:')
                     log.error("Unable to send/receive message to Camelot "
                               "server %s" % ioe)
-                    time.sleep(5)
-
-        except Exception as ioe:
-            log.exception('_send_and_receive retry failed:')
-            log.error("Unable to send/receive message to Camelot server %s" % (
-                ioe))
+                    if reused:
+                        continue
+                    break
+                if retVal or not reused:
+                    break
+                log.debug("generic socket %s went stale, reconnecting",
+                          generic_sock.socket_id)
+        finally:
+            self._idle_generic_sockets.put(generic_sock)
 
+        if timer:
+            timer.received = CommandTimer.now()
+            timer.failed = not retVal
         if retVal:
             res = CamelotServerResponse()
             res.message = retVal
         return res
 
-    def _read_header(self, command):
-        ack_str = ''
-        ep_id = None
-        ack = None
-        len_to_read = 0
-        chars_to_read = Connection.MESSAGE_ACK_CHARS_TO_READ
-        while True:
-            ack_str = '{}{}'.format(ack_str, self._connection.recv(
-                chars_to_read))
-            if not ack_str:
-                return ack, ep_id, len_to_read
-            if ack_str[-1] != ':':
-                chars_to_read = Connection.MESSAGE_ACK_READ_ONE_CHAR
-                continue
+    def _read_response(self, command, timer=None):
+        if timer:
+            if not self._reader.wait_for_data():
+                return None
+            timer.first_byte = CommandTimer.now()
+        frame = self._reader.read_frame()
+        if not frame:
+            return None
+        ack, ep_id, message = frame
+        if camlogger.is_debug_enabled(log):
+            log.debug("ACK received for the command:[%s], ACK:[%s:%s]",
+                      command, ack, ep_id)
+            log.debug("Message received, Message: %s", message)
+        ret = CamelotServerResponse()
+        ret.ack = ack.upper()
+        ret.epAddress = ep_id
+        ret.message = message
+        return ret
 
-            log.debug("ACK received for the command:[{}], ACK:[{}]".format(
-                command, ack_str))
-            ack_str = ack_str.strip()
-            ack_str_list = ack_str.split(VAPIEIUtils.ACK_DELIM)
-            if not ack_str_list or len(ack_str_list) < 3:
-                log.error("Invalid ACK received for the command:[{}], ACK:[{}]"
-                          " , and ACK List:[{}] ".format(command,
-                                                         ack_str,
-                                                         ack_str_list))
-                return ack, ep_id, len_to_read
-            ack = ack_str_list[0].upper()
-            ep_id = ack_str_list[1]
-            len_to_read = ack_str_list[2]
-            return ack, ep_id, len_to_read
-
-    def _send_and_receive(self, command):
+    def _send_and_receive(self, command, timer=None):
         ret = None
         try:
-            log.debug(
-                "Start send and receive for the command: "
-                "[{}], on Connection Id:[{}]".format(
-                    command, self.connection_id))
+            if camlogger.is_debug_enabled(log):
+                log.debug(
+                    "Start send and receive for the command: "
+                    "[%s], on Connection Id:[%s]", command,
+                    self.connection_id)
             self._connection.send(command)
-            ack_str = None
-            ep_id = None
-            ack = None
-            len_to_read = 0
-            extra_chars_read = None
+            if timer:
+                timer.sent = CommandTimer.now()
             try:
-                ack, ep_id, len_to_read = self._read_header(command)
-                if not ack:
-                    raise camelot.CamelotError('chars_to_read is None')
-                else:
-                    ret = CamelotServerResponse()
-                    ret.ack = ack
-                    ret.epAddress = ep_id
-
-                    chars_to_read = int(
-                        len_to_read, Connection.HEX_TO_DIGIT_RADIX)
-                    ack_msg = ''
-                    byte_recv = 0
-                    while byte_recv < chars_to_read:
-                        log.debug('Received bytes are less than: {} '
-                                  'expected bytes: {}'.format(byte_recv,
-                                                              chars_to_read))
-                        if chars_to_read > 0:
-                            temp_msg = self._connection.recv(
-                                min(chars_to_read - byte_recv, 2048))
-
-                            ack_msg = '{}{}'.format(ack_msg, temp_msg)
-                            byte_recv += len(temp_msg)
-                    log.debug("Message received, Message: {}".format(ack_msg))
-                    ret.message = ack_msg
+                ret = self._read_response(command, timer)
+                if timer:
+                    timer.received = CommandTimer.now()
+                if not ret:
+                    raise camelot.CamelotError('end of stream reached while '
+                                               'reading the response')
             except Exception as ioe:
                 log.exception('_send_and_receive failed:')
         except Exception as ioe:
@@ -298,6 +418,8 @@ class Connection(object):
                       "]".format(ioe))
 
         if not ret:
+            if timer:
+                timer.failed = True
             ret = CamelotServerResponse()
             ret.ack = 'N'
             ret.message = ('Unable to send/receive message to Camelot server,'
@@ -308,6 +430,11 @@ class Connection(object):
     def close_event_channel(self):
 
         if self._connection:
+            try:
+                if self.pipelined:
+                    self._connection.shutdown(socket.SHUT_RDWR)
+            except Exception:
+                pass
             try:
                 self._connection.close()
                 self._stopped = True
@@ -323,7 +450,9 @@ class Connection(object):
             except Exception:
                 pass
         '''
-        self._event_process.event_thread.join()
+        for generic_sock in self._generic_sockets:
+            generic_sock.close()
+        self._event_process.stop_reading()
 
     def execute_camelot_command(
             self, request, encoded_command, request_type='ep', timeout=10,
@@ -334,57 +463,656 @@ class Connection(object):
             raise camelot.CamelotError('Invalid command for the Camelot:%s' % (
                 encoded_command))
 
-        with self.command_lock:
-            log.debug("Processing Command: %s on %s" % (
-                encoded_command, self))
-
-            response = None
-            if request_type != 'ep':
-                response = self._send_and_receive_generic(encoded_command)
-                log.debug(
-                    "Received Response from generic send/recv, response: {}"
-                    "".format(response)
-                )
-            else:
-                response = self._send_and_receive(encoded_command)
-                log.debug(
-                    "Received Response from send/recv, response: {}"
-                    "".format(response)
-                )
+        debug = camlogger.is_debug_enabled(log)
+        timer = CommandTimer()
+        if self.pipelined and request_type == 'ep':
+            if debug:
+                log.debug("Processing pipelined Command: %s on %s",
+                          encoded_command, self)
+            response = self._pipelined_send_and_receive(
+                encoded_command, timeout, timer)
+            if debug:
+                log.debug("Received Response from pipelined send/recv, "
+                          "response: %s", response)
+        elif request_type != 'ep':
+            if debug:
+                log.debug("Processing generic Command: %s on %s",
+                          encoded_command, self)
+            response = self._send_and_receive_generic(encoded_command, timer)
+            if debug:
+                log.debug("Received Response from generic send/recv, "
+                          "response: %s", response)
+        else:
+            with self.command_lock:
+                timer.lock_acquired = CommandTimer.now()
+                if debug:
+                    log.debug("Processing Command: %s on %s",
+                              encoded_command, self)
+                response = self._send_and_receive(encoded_command, timer)
+                if debug:
+                    log.debug("Received Response from send/recv, "
+                              "response: %s", response)
 
         if request == camelot.SERVER_EXIT and not response:
+            self.transport_stats.record(request, timer)
             return True
 
         if response:
-            response_to_send = self._decode_response(
-                request_type, request, response, ep_class=ep_class,
-                ep_params=ep_params)
+            decode_start = CommandTimer.now()
+            try:
+                response_to_send = self._decode_response(
+                    request_type, request, response, ep_class=ep_class,
+                    ep_params=ep_params)
+            except Exception:
+                # commands without an answer are already counted as failed
+                error = None
+                if not (timer.failed or timer.timed_out):
+                    error = ('nack' if getattr(response, 'ack', None) == 'N'
+                             else 'decode_error')
+                self.transport_stats.record(
+                    request, timer, decode_start, CommandTimer.now(), error)
+                raise
+            self.transport_stats.record(request, timer, decode_start,
+                                        CommandTimer.now())
+        else:
+            self.transport_stats.record(request, timer)
 
-        if not response_to_send:
+        if not response_to_send and debug:
             log.debug(
                 'Failed to decode the response, unable to send '
                 'response to caller for'
-                '\n\tRequest: {}'
-                '\n\tResponse: {}'
-                '\n\tResponse Vars: {}'.format(
-                    request, response, vars(response))
-            )
+                '\n\tRequest: %s'
+                '\n\tResponse: %s'
+                '\n\tResponse Vars: %s',
+                request, response, vars(response) if response else None)
         return response_to_send
 
+    def execute_raw_command(self, encoded_msg, timeout=10):
+        '''Sends an already framed message on the command socket and returns
+        the undecoded CamelotServerResponse.
+        '''
+        timer = CommandTimer()
+        if self.pipelined:
+            ret = self._pipelined_send_and_receive(encoded_msg, timeout, timer)
+        else:
+            with self.command_lock:
+                timer.lock_acquired = CommandTimer.now()
+                ret = self._send_and_receive(encoded_msg, timer)
+        error = None
+        if ret.ack == 'N' and not (timer.failed or timer.timed_out):
+            error = 'nack'
+        self.transport_stats.record('raw', timer, error=error)
+        return ret
+
+    @staticmethod
+    def batch_timeout(commands):
+        '''Default timeout of a batch of commands, which grows with the size
+        of the batch.
+        '''
+        return (Connection.BATCH_TIMEOUT +
+                commands * Connection.BATCH_COMMAND_TIMEOUT)
+
+    def execute_raw_batch(self, encoded_msgs, timeout=None):
+        '''Writes the framed messages back to back and collects their ACKs,
+        in the order of the messages. Without pipelining nothing else is
+        written on the command socket until the whole batch is answered;
+        pipelined, only a batch with messages which are not addressed to an
+        endpoint holds the other commands back.
+
+        Without pipelining the messages are written BATCH_CHUNK at a time
+        and the ACKs of a chunk are read before the next one is written, so
+        neither side blocks on a full socket buffer. The pipelined reader
+        thread reads the ACKs while the batch is being written.
+
+        :parameter encoded_msgs: list of framed messages
+        :parameter timeout: seconds to wait for the whole batch (pipelined
+         mode only). Default is batch_timeout(len(encoded_msgs))
+
+        :returns: list of CamelotServerResponse, one per message. Messages
+         which couldn't be sent or answered get an 'N' response.
+        '''
+        if not encoded_msgs:
+            return []
+        if timeout is None:
+            timeout = Connection.batch_timeout(len(encoded_msgs))
+        timer = CommandTimer()
+        if self.pipelined:
+            responses = self._pipelined_batch(encoded_msgs, timeout, timer)
+            self.transport_stats.record('batch', timer)
+            return responses
+        responses = []
+        with self.command_lock:
+            timer.lock_acquired = CommandTimer.now()
+            if camlogger.is_debug_enabled(log):
+                log.debug("Sending batch of %s commands on %s",
+                          len(encoded_msgs), self.connection_id)
+            try:
+                for start in range(0, len(encoded_msgs),
+                                   Connection.BATCH_CHUNK):
+                    chunk = encoded_msgs[start:start + Connection.BATCH_CHUNK]
+                    self._connection.send(frame_bytes(chunk))
+                    for command in chunk:
+                        ret = self._read_response(command)
+                        if not ret:
+                            raise camelot.CamelotError(
+                                'end of stream reached while reading the '
+                                'response')
+                        responses.append(ret)
+                timer.sent = CommandTimer.now()
+            except Exception as ioe:
+                log.exception('execute_raw_batch failed:')
+                log.error("Unable to send/receive message to Camelot "
+                          "server:[{}]".format(ioe))
+                timer.failed = True
+            timer.received = CommandTimer.now()
+        while len(responses) < len(encoded_msgs):
+            responses.append(self._failed_response())
+        self.transport_stats.record('batch', timer)
+        return responses
+
+    def _pipelined_batch(self, encoded_msgs, timeout=10, timer=None):
+        '''Writes the batch like as many pipelined commands: when all the
+        messages are addressed to endpoints their ACKs are matched by
+        endpoint id and other commands keep flowing. A batch with a message
+        which is not addressed to an endpoint is sent exclusively.
+        '''
+        batch = [PendingCommand(self._command_ep_id(command), command)
+                 for command in encoded_msgs]
+        exclusive = any(pending.ep_id is None for pending in batch)
+        if exclusive:
+            for pending in batch:
+                pending.ep_id = None
+        deadline = time.time() + timeout
+        if not self._send_lock.acquire(timeout=timeout):
+            return self._pipeline_busy(batch, timeout, timer)
+        try:
+            with self._pending_cond:
+                if exclusive:
+                    ready = self._wait_pipeline(
+                        lambda: not (self._inflight or self._exclusive),
+                        deadline)
+                else:
+                    ready = self._wait_pipeline(
+                        lambda: not self._exclusive, deadline)
+                if not ready:
+                    return self._pipeline_busy(batch, timeout, timer)
+                if timer:
+                    timer.lock_acquired = CommandTimer.now()
+                if exclusive:
+                    self._exclusive = True
+                for pending in batch:
+                    self._pending.setdefault(pending.ep_id,
+                                             deque()).append(pending)
+                self._inflight += len(batch)
+                self._pipelined_commands += len(batch)
+                self._max_inflight = max(self._max_inflight, self._inflight)
+            try:
+                self._connection.send(frame_bytes(encoded_msgs))
+            except Exception as ioe:
+                log.exception('_pipelined_batch failed:')
+                log.error("Unable to send message to Camelot server:[{}"
+                          "]".format(ioe))
+                with self._pending_cond:
+                    for pending in batch:
+                        self._complete_pending(pending, None)
+                if timer:
+                    timer.failed = True
+                return [self._failed_response() for pending in batch]
+            if timer:
+                timer.sent = CommandTimer.now()
+        finally:
+            self._send_lock.release()
+
+        for pending in batch:
+            if not pending.done.wait(max(deadline - time.time(), 0)):
+                break
+        with self._pending_cond:
+            missing = [pending for pending in batch
+                       if not pending.done.is_set()]
+            self._timed_out_commands += len(missing)
+            fatal = exclusive or any(pending.skewed for pending in missing)
+            if not fatal:
+                for ep_id in set(pending.ep_id for pending in missing):
+                    self._abandon_endpoint(ep_id)
+        if missing:
+            if timer:
+                timer.timed_out = True
+            reason = '{} of a batch of {} commands got no ACK within ' \
+                '{}s'.format(len(missing), len(batch), timeout)
+            if fatal:
+                self._fail_pipeline(reason)
+            else:
+                log.error(reason)
+        responses = [pending.response or self._failed_response()
+                     for pending in batch]
+        if timer:
+            timer.received = CommandTimer.now()
+        return responses
+
+    def _command_ep_id(self, command):
+        '''Returns the endpoint id a command is addressed to, or None when
+        the ACK can't be matched by endpoint id (endpoint creation, server
+        level requests).
+        '''
+        return frame_ep_id(command)
+
+    def _failed_response(self):
+        ret = CamelotServerResponse()
+        ret.ack = 'N'
+        ret.message = ('Unable to send/receive message to Camelot server,'
+                       ' after retries')
+        return ret
+
+    def _pipelined_send_and_receive(self, command, timeout=10, timer=None):
+        '''Writes the command without waiting for earlier commands to be
+        acknowledged. ACKs are read by the pipeline reader thread and handed
+        back by the endpoint id in the ACK header, in FIFO order per
+        endpoint. Commands which are not addressed to an endpoint are sent
+        exclusively: they wait for the pipeline to drain and hold new
+        commands back until their own ACK is read.
+
+        Waiting for the pipeline and for the ACK are both bounded by
+        timeout. A missing ACK fails the commands of the endpoint, see
+        _abandon_endpoint. It closes the connection instead for an exclusive
+        or a skewed command, whose ACK can't be told apart, see
+        _fail_pipeline.
+        '''
+        ep_id = self._command_ep_id(command)
+        pending = PendingCommand(ep_id, command)
+        deadline = time.time() + timeout
+        if not self._send_lock.acquire(timeout=timeout):
+            return self._pipeline_busy([pending], timeout, timer)[0]
+        try:
+            with self._pending_cond:
+                if ep_id is None:
+                    ready = self._wait_pipeline(
+                        lambda: not (self._inflight or self._exclusive),
+                        deadline)
+                else:
+                    ready = self._wait_pipeline(
+                        lambda: not self._exclusive, deadline)
+                if not ready:
+                    return self._pipeline_busy([pending], timeout, timer)[0]
+                if ep_id is None:
+                    self._exclusive = True
+                if timer:
+                    timer.lock_acquired = CommandTimer.now()
+                self._pending.setdefault(ep_id, deque()).append(pending)
+                self._inflight += 1
+                self._pipelined_commands += 1
+                self._max_inflight = max(self._max_inflight, self._inflight)
+            try:
+                self._connection.send(command)
+            except Exception as ioe:
+                log.exception('_pipelined_send_and_receive failed:')
+                log.error("Unable to send message to Camelot server:[{}"
+                          "]".format(ioe))
+                with self._pending_cond:
+                    self._complete_pending(pending, None)
+                if timer:
+                    timer.failed = True
+                return self._failed_response()
+            if timer:
+                timer.sent = CommandTimer.now()
+        finally:
+            self._send_lock.release()
+
+        if not pending.done.wait(max(deadline - time.time(), 0)):
+            with self._pending_cond:
+                timed_out = not pending.done.is_set()
+                fatal = ep_id is None or pending.skewed
+                if timed_out:
+                    self._timed_out_commands += 1
+                    if not fatal:
+                        self._abandon_endpoint(ep_id)
+            if timed_out:
+                if timer:
+                    timer.timed_out = True
+                reason = 'No ACK received within {}s for the command: ' \
+                    '[{}]'.format(timeout, command)
+                if fatal:
+                    self._fail_pipeline(reason)
+                else:
+                    log.error(reason)
+                return self._failed_response()
+        if timer:
+            timer.received = CommandTimer.now()
+            timer.failed = not pending.response
+        if not pending.response:
+            return self._failed_response()
+        return pending.response
+
+    def _wait_pipeline(self, predicate, deadline):
+        '''Waits on _pending_cond, which the caller holds, until predicate()
+        is true. Returns False if the deadline passes or the pipeline stops
+        first.
+        '''
+        while not predicate():
+            remaining = deadline - time.time()
+            if self._stopped or remaining <= 0:
+                return False
+            self._pending_cond.wait(remaining)
+        return not self._stopped
+
+    def _pipeline_busy(self, commands, timeout, timer=None):
+        '''Fails commands which could not be written within timeout because
+        the pipeline was held by other commands or stopped.
+        '''
+        log.error("Pipeline of {} not available within {}s, {} command(s) "
+                  "not sent".format(self.connection_key, timeout,
+                                    len(commands)))
+        if timer:
+            timer.timed_out = True
+        return [self._failed_response() for pending in commands]
+
+    def _abandon_endpoint(self, ep_id):
+        '''Fails the commands queued for ep_id after one of them got no ACK
+        in time, with _pending_cond held. They stay queued as abandoned, so
+        their ACKs, if they come late, are dropped instead of being handed
+        to the next commands of the endpoint. The other endpoints are not
+        affected and abandoned commands don't hold exclusive commands back.
+        '''
+        for pending in self._pending.get(ep_id, ()):
+            if not pending.abandoned:
+                pending.abandoned = True
+                self._inflight -= 1
+                pending.done.set()
+        self._pending_cond.notify_all()
+
+    def _fail_pipeline(self, reason):
+        '''The ACKs of exclusive commands are matched by their order alone,
+        as are the ACKs of a skewed command, so after a missing one the ACKs
+        which follow can't be trusted. The connection is closed instead: the
+        pending commands fail, and the Camelot server object reconnects on
+        the next command.
+        '''
+        if self._stopped:
+            return
+        log.error("{}, closing the connection to {}".format(
+            reason, self.connection_key))
+        self.close_event_channel()
+
+    def _complete_pending(self, pending, response):
+        queue = self._pending.get(pending.ep_id)
+        if queue and pending in queue:
+            queue.remove(pending)
+            if not queue:
+                del self._pending[pending.ep_id]
+        if pending.ep_id is None and None not in self._pending:
+            self._exclusive = False
+        if not pending.abandoned:
+            self._inflight -= 1
+            pending.response = response
+        pending.done.set()
+        self._pending_cond.notify_all()
+
+    def _pipeline_reader(self):
+        while not self._stopped:
+            try:
+                ret = self._read_response('pipelined')
+                if not ret:
+                    log.error("End of stream reached on the command "
+                              "socket: {}".format(self.connection_key))
+                    break
+            except Exception:
+                if not self._stopped:
+                    log.exception('_pipeline_reader failed:')
+                break
+            self._dispatch_response(ret)
+
+        self._stopped = True
+        with self._pending_cond:
+            for queue in list(self._pending.values()):
+                for pending in list(queue):
+                    self._complete_pending(pending, None)
+            # wake the commands waiting for the pipeline to drain
+            self._pending_cond.notify_all()
+
+    def _dispatch_response(self, response):
+        with self._pending_cond:
+            queue = self._pending.get(response.epAddress)
+            if queue and queue[0].abandoned:
+                self._late_responses += 1
+                log.error("Dropping late ACK of ep: {}, message: {}".format(
+                    response.epAddress, response.message))
+                self._complete_pending(queue[0], response)
+                for pending in queue:
+                    pending.skewed = True
+                return
+            if self._exclusive:
+                queue = self._pending.get(None)
+            else:
+                queue = self._pending.get(response.epAddress)
+            if not queue:
+                self._unmatched_responses += 1
+                log.error("Dropping ACK which matches no pending command, "
+                          "ep: {}, message: {}".format(response.epAddress,
+                                                      response.message))
+                return
+            self._complete_pending(queue[0], response)
+
+    def get_pipeline_stats(self):
+        '''Returns the pipelining counters of this connection.
+
+        :returns: dictionary with following fields:\n
+            * pipelined - whether the connection is in pipelined mode
+            * inflight - commands written and waiting for their ACK
+            * max_inflight - highest inflight depth seen so far
+            * commands - total commands sent through the pipeline
+            * timeouts - commands whose ACK didn't arrive within timeout
+            * late - ACKs dropped because their command had timed out
+            * unmatched - ACKs which matched no pending command
+        '''
+        with self._pending_cond:
+            return {'pipelined': self.pipelined,
+                    'inflight': self._inflight,
+                    'max_inflight': self._max_inflight,
+                    'commands': self._pipelined_commands,
+                    'timeouts': self._timed_out_commands,
+                    'late': self._late_responses,
+                    'unmatched': self._unmatched_responses}
+
+    def get_generic_socket_stats(self):
+        '''Returns per socket counters of the persistent sockets used for
+        the generic (non endpoint) requests.
+
+        :returns: list of dictionaries with socket_id, connected, requests,
+         reconnects and failures.
+        '''
+        return [generic_sock.get_stats()
+                for generic_sock in self._generic_sockets]
+
+    def get_transport_stats(self):
+        '''Returns the per request type latency histograms and error
+        counters, see :py:class:`TransportStats`.
+        '''
+        return self.transport_stats.get_stats()
+
     def _decode_response(self, req_type, request, response, ep_class=None,
                          ep_params=None):
 
-        log.debug("Request for decoding response")
         # Decoder decoder = DecoderFactory.getCamlotDecoder();
         # CamelotMessage retMsg = null;
         kargs = {'ip': self.server_ip,
                  'port': self.server_port,
                  'ep_class': ep_class,
                  'ep_params': ep_params,
-                 'output_format': self.output_format}
+                 'output_format': self.output_format,
+                 'fast_json': self.fast_json}
 
         ret = decoder.decode(
             req_type, request, response, **kargs)
 
-        log.debug("Decoded message: {}".format(ret))
+        if camlogger.is_debug_enabled(log):
+            log.debug("Decoded message: %s", ret)
         return ret
+
+
+class ConnectionPool(object):
+    '''Spreads the endpoints of one Camelot server over several command
+    sockets. Each member is a complete Connection with its own handshake,
+    command lock and event channel, so commands for endpoints on different
+    members don't wait on each other.
+
+    Endpoint commands go to the member which created the endpoint, endpoints
+    which were not created through this pool are assigned by ep_id hash.
+    Endpoint creation and generic requests are spread round robin.
+    '''
+
+    def __init__(self, connections):
+        self._connections = connections
+        self._owner_lock = RLock()
+        self._owners = {}
+        self._next_member = 0
+        self.server_ip = connections[0].server_ip
+        self.server_port = connections[0].server_port
+        self.connection_key = connections[0].connection_key
+
+    @property
+    def pool_size(self):
+        return len(self._connections)
+
+    @property
+    def output_format(self):
+        return self._connections[0].output_format
+
+    @property
+    def _stopped(self):
+        return any(conn._stopped for conn in self._connections)
+
+    def _round_robin(self):
+        with self._owner_lock:
+            index = self._next_member
+            self._next_member = (index + 1) % len(self._connections)
+        return index
+
+    def _member_for(self, command, request_type='ep'):
+        '''Returns the index of the member a command is sent on.'''
+        ep_id = None
+        if request_type == 'ep':
+            ep_id = self._connections[0]._command_ep_id(command)
+        if ep_id is None:
+            return self._round_robin()
+        with self._owner_lock:
+            index = self._owners.get(ep_id)
+        if index is None:
+            try:
+                index = int(ep_id, 16) % len(self._connections)
+            except ValueError:
+                index = hash(ep_id) % len(self._connections)
+        return index
+
+    def execute_camelot_command(
+            self, request, encoded_command, request_type='ep', timeout=10,
+            ep_class=None, ep_params=None):
+        index = self._member_for(encoded_command, request_type)
+        if camlogger.is_debug_enabled(log):
+            log.debug("Processing Command: %s on pool member %s",
+                      encoded_command, index)
+        ret = self._connections[index].execute_camelot_command(
+            request, encoded_command, request_type=request_type,
+            timeout=timeout, ep_class=ep_class, ep_params=ep_params)
+        if request in (camelot.NEW_ENDPOINT, camelot.ATTACH_ENDPOINT):
+            ep_id = getattr(ret, 'ep_id', None)
+            if ep_id:
+                with self._owner_lock:
+                    self._owners[ep_id] = index
+        return ret
+
+    def execute_raw_command(self, encoded_msg, timeout=10):
+        index = self._member_for(encoded_msg)
+        return self._connections[index].execute_raw_command(
+            encoded_msg, timeout)
+
+    def execute_raw_batch(self, encoded_msgs, timeout=None):
+        '''Splits the batch by member, runs the sub batches on the members in
+        parallel and returns the responses in the order of encoded_msgs.
+        Endpoints created by the batch are owned by the member which sent
+        their new_ep.
+        '''
+        groups = {}
+        for position, command in enumerate(encoded_msgs):
+            index = self._member_for(command)
+            groups.setdefault(index, []).append(position)
+        responses = [None] * len(encoded_msgs)
+
+        def run_group(index, positions):
+            group_responses = self._connections[index].execute_raw_batch(
+                [encoded_msgs[position] for position in positions], timeout)
+            for position, response in zip(positions, group_responses):
+                responses[position] = response
+                if (encoded_msgs[position][:2] in ('c:', b'c:') and
+                        response.ack == 'A'):
+                    with self._owner_lock:
+                        self._owners[response.epAddress] = index
+
+        threads = [Thread(target=run_group, args=(index, positions))
+                   for index, positions in groups.items()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return responses
+
+    def _decode_response(self, req_type, request, response, ep_class=None,
+                         ep_params=None):
+        return self._connections[0]._decode_response(
+            req_type, request, response, ep_class=ep_class,
+            ep_params=ep_params)
+
+    def close_event_channel(self):
+        for conn in self._connections:
+            if not conn._stopped:
+                conn.close_event_channel()
+
+    def get_pipeline_stats(self):
+        '''Returns the pipelining counters summed over all the members,
+        max_inflight is the highest depth seen on any one member.
+        '''
+        stats = None
+        for conn in self._connections:
+            conn_stats = conn.get_pipeline_stats()
+            if stats is None:
+                stats = conn_stats
+                continue
+            for key, value in conn_stats.items():
+                if key == 'pipelined':
+                    continue
+                elif key == 'max_inflight':
+                    stats[key] = max(stats[key], value)
+                else:
+                    stats[key] += value
+        return stats
+
+    def get_transport_stats(self):
+        '''The members share one TransportStats, so this covers the
+        commands sent on all of them.
+        '''
+        stats = self._connections[0].transport_stats
+        if all(conn.transport_stats is stats for conn in self._connections):
+            return stats.get_stats()
+        merged = TransportStats()
+        for conn in self._connections:
+            merged.merge(conn.transport_stats)
+        return merged.get_stats()
+
+    def get_generic_socket_stats(self):
+        stats = []
+        for index, conn in enumerate(self._connections):
+            for sock_stats in conn.get_generic_socket_stats():
+                sock_stats['member'] = index
+                stats.append(sock_stats)
+        return stats
+
+    def get_pool_stats(self):
+        '''Returns the number of endpoints owned by every member.
+
+        :returns: list of dictionaries with member, command_socket_stopped
+         and endpoints fields.
+        '''
+        with self._owner_lock:
+            owners = list(self._owners.values())
+        return [{'member': index,
+                 'command_socket_stopped': conn._stopped,
+                 'endpoints': owners.count(index)}
+                for index, conn in enumerate(self._connections)]
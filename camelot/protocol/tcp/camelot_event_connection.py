@@ -3,11 +3,12 @@ Created on 11-Sep-2013
 
 @author: smaturi
 '''
-from threading import Thread
+from threading import Thread, current_thread
 import socket
-from camelot.events import Event, InfoEventType, EventType
+from camelot.events import Event
 import camelot
 from camelot import camlogger
+from camelot.protocol.tcp.frame_reader import FrameReader, FrameError
 
 
 log = camlogger.getLogger(__name__)
@@ -18,65 +19,31 @@ class ConnectionError(Exception):
 
 
 class EventConnection(object):
-    EVENT_MESSAGE_HEADER_TO_READ = 16
     HEX_TO_DIGIT_RADIX = 16
 
-    def __init__(self, event_sock, server_ip, server_port, conn):
+    def __init__(self, event_sock, server_ip, server_port, conn,
+                 reactor=None):
         self.event_socket = event_sock
         self.camelot_server_ip = server_ip
         self.camelot_server_port = server_port
         self.connection = conn
-        self.event_thread = Thread(target=self.run)
+        self.event_reader = FrameReader(event_sock)
+        self.reactor = reactor
+        self.event_thread = None
+        if reactor is None:
+            self.event_thread = Thread(target=self.run)
 
     def start(self):
         self.stopped = False
+        if self.reactor is not None:
+            self.reactor.register(self)
+            return
         self.event_thread.daemon = True
         self.event_thread.start()
 
     def run(self):
-        while not self.stopped:
-            try:
-
-                event = self.event_socket.recv(
-                    EventConnection.EVENT_MESSAGE_HEADER_TO_READ)
-                if self.stopped:
-                    break
-                if not event:
-                    log.error("End of stream reached for the socket, Event "
-                              "channel is closed")
-                    self.connection.close_event_channel()
-                    self.stopped = True
-                else:
-
-                    event_header_msg = event.strip()
-
-                    if event_header_msg:
-
-                        tokens = event_header_msg.split(":")
-
-                        event_msg_len = int(
-                            tokens[2], EventConnection.HEX_TO_DIGIT_RADIX)
-
-                        event_msg = self.event_socket.recv(event_msg_len)
-
-                        log.debug(
-                            "A Event message of %s is read from the event "
-                            "port actual length is %s" % (
-                                event_msg, event_msg_len))
-
-                        self.process_event(tokens[1], event_msg)
-            except socket.timeout as e:
-                # log.debug("Read timed out: %s" % e)
-                pass
-            except socket.error as e:
-                log.exception("Unexpected Error stopping the Connection")
-                self.connection.close_event_channel()
-                self.stopped = True
-            except Exception as e:
-                log.error("Unexpected exception %s" % e)
-
-            if self.stopped:
-                break
+        while self.handle_read(self.event_reader.read_frames):
+            pass
 
         if self.event_socket:
             try:
@@ -84,39 +51,97 @@ class EventConnection(object):
             except Exception as e:
                 log.warning("Could not stop the event thread")
 
+    def handle_read(self, read):
+        '''Reads frames with read and processes them.
+
+        :parameter read: FrameReader method which returns the next frames,
+         None on end of stream
+
+        :returns: False once the event channel is closed
+        '''
+        if self.stopped:
+            return False
+        try:
+            frames = read()
+            if self.stopped:
+                return False
+            if frames is None:
+                log.error("End of stream reached for the socket, Event "
+                          "channel is closed")
+                self.connection.close_event_channel()
+                self.stopped = True
+            else:
+                self.process_frames(frames)
+        except socket.timeout as e:
+            # log.debug("Read timed out: %s" % e)
+            pass
+        except socket.error as e:
+            log.exception("Unexpected Error stopping the Connection")
+            self.connection.close_event_channel()
+            self.stopped = True
+        except FrameError as e:
+            # the reader can't skip the bad bytes, nothing after them can
+            # be read
+            log.error("Invalid frame on the event channel, stopping the "
+                      "Connection: %s" % e)
+            self.connection.close_event_channel()
+            self.stopped = True
+        except Exception as e:
+            log.error("Unexpected exception %s" % e)
+        return not self.stopped
+
+    def stop_reading(self):
+        '''Stops the reader of the event channel. Without a reactor this
+        waits for the reader thread, unless called by that thread.
+        '''
+        self.stopped = True
+        if self.reactor is not None:
+            self.reactor.unregister(self)
+        elif self.event_thread is not current_thread():
+            self.event_thread.join()
+
     def stop_events(self):
         self.stopped = True
-        self.event_socket.close()
+        if self.reactor is not None:
+            self.reactor.unregister(self)
+        else:
+            self.event_socket.close()
+
+    def process_frames(self, frames):
+        '''Processes the events of one read, an event which fails doesn't
+        stop the ones after it. Events nobody subscribed to are dropped
+        before they are built.
+        '''
+        serv = camelot.get_camelot_server(self.camelot_server_ip,
+                                          self.camelot_server_port)
+        wants = serv._subscriptions.wants
+        debug = camlogger.is_debug_enabled(log)
+        for event_type, ep_address, event_msg in frames:
+            if not wants(ep_address, event_msg):
+                continue
+            if debug:
+                log.debug("An Event message is received for EP %s and "
+                          "message :%s", ep_address, event_msg)
+            try:
+                self._dispatch_event(serv, ep_address, event_msg)
+            except Exception as e:
+                log.exception("Processing the event [%s] failed: %s",
+                              event_msg, e)
 
     def process_event(self, ep_address, message):
 
-        log.debug("An Event message is received for EP %s and message :%s" % (
-            ep_address, message))
-        msg_tokens = message.split(" ")
-        event_type = msg_tokens.pop(0)
-
-        event_dict = {'camelot_ip': self.camelot_server_ip,
-                      'camelot_port': self.camelot_server_port,
-                      'endpoint_id': ep_address,
-                      'event_type': event_type,
-                      'event_sub_type': None,
-                      'message': ' '.join(msg_tokens)}
-        event = Event()
-        event._copy_from_dict(event_dict)
-        if event_type in [InfoEventType.STATE,
-                          InfoEventType.CALLS,
-                          InfoEventType.BACKUPCM,
-                          InfoEventType.BCGREADY,
-                          InfoEventType.LOSTCONN,
-                          InfoEventType.PRIMARYCM]:
-            event.event_sub_type = event_type
-            event.event_type = EventType.INFO_EVENT
-        elif event_type in [EventType.STATION_EVENT,
-                            EventType.CALL_EVENT]:
-            event.event_sub_type = msg_tokens[1]
-
+        log.debug("An Event message is received for EP %s and message :%s",
+                  ep_address, message)
         serv = camelot.get_camelot_server(self.camelot_server_ip,
                                           self.camelot_server_port)
+        self._dispatch_event(serv, ep_address, message)
 
-        log.debug("calling default event callback on server")
+    def _dispatch_event(self, serv, ep_address, message):
+        event = build_event(self.camelot_server_ip, self.camelot_server_port,
+                            ep_address, message)
         serv._default_event_callback(event)
+
+
+def build_event(server_ip, server_port, ep_address, message):
+    '''Builds the Event for one message read from the event socket.'''
+    return Event.from_message(server_ip, server_port, ep_address, message)
@@ -0,0 +1,122 @@
+'''
+One selector based thread which reads the event sockets of all the Camelot
+connections of the process.
+'''
+from collections import deque
+from threading import Thread, Lock, current_thread
+import selectors
+import socket
+from camelot import camlogger
+
+
+log = camlogger.getLogger(__name__)
+
+
+class EventReactor(object):
+    '''Multiplexes the event sockets of every connection which uses it on
+    one thread, instead of a blocking reader thread per event socket.
+
+    The reactor reads whatever is available on a readable socket and hands
+    the complete frames to EventConnection.handle_read, so the events go
+    through the same callback path as with a reader thread. Sockets are
+    added and removed through a queue which the reactor thread applies
+    between two selects, it is woken up by a socketpair.
+    '''
+
+    def __init__(self, name='camelot-event-reactor'):
+        self.name = name
+        self._selector = selectors.DefaultSelector()
+        self._ops = deque()
+        self._lock = Lock()
+        self._thread = None
+        self._stopping = False
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ, None)
+
+    def register(self, event_conn):
+        '''Starts reading the event socket of event_conn.'''
+        with self._lock:
+            self._ops.append((True, event_conn))
+            self._stopping = False
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name=self.name)
+                self._thread.daemon = True
+                self._thread.start()
+        self._wakeup()
+
+    def unregister(self, event_conn):
+        '''Stops reading the event socket of event_conn and closes it.'''
+        with self._lock:
+            self._ops.append((False, event_conn))
+        self._wakeup()
+
+    def _wakeup(self):
+        try:
+            self._wakeup_w.send(b'x')
+        except (BlockingIOError, OSError):
+            pass
+
+    def _apply_ops(self):
+        with self._lock:
+            ops = list(self._ops)
+            self._ops.clear()
+        for add, event_conn in ops:
+            sock = event_conn.event_socket
+            if add:
+                try:
+                    self._selector.register(sock, selectors.EVENT_READ,
+                                            event_conn)
+                except (KeyError, ValueError) as e:
+                    log.error("Could not register the event socket: %s" % e)
+            else:
+                self._remove(event_conn)
+
+    def _remove(self, event_conn):
+        sock = event_conn.event_socket
+        try:
+            self._selector.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+        try:
+            sock.close()
+        except Exception:
+            log.warning("Could not close the event socket")
+
+    def _run(self):
+        while True:
+            self._apply_ops()
+            with self._lock:
+                if self._stopping:
+                    self._thread = None
+                    break
+            for key, mask in self._selector.select():
+                event_conn = key.data
+                if event_conn is None:
+                    try:
+                        while self._wakeup_r.recv(4096):
+                            pass
+                    except (BlockingIOError, OSError):
+                        pass
+                    continue
+                if (event_conn.stopped or not event_conn.handle_read(
+                        event_conn.event_reader.read_available)):
+                    self._remove(event_conn)
+
+    def stop(self, timeout=None):
+        '''Stops the reactor thread once the pending registrations are
+        applied. A later register starts it again.
+        '''
+        with self._lock:
+            self._stopping = True
+            thread = self._thread
+        self._wakeup()
+        if thread and thread is not current_thread():
+            thread.join(timeout)
+
+    def get_stats(self):
+        return {'running': self._thread is not None,
+                'sockets': len(self._selector.get_map()) - 1}
+
+
+event_reactor = EventReactor()
@@ -0,0 +1,176 @@
+'''
+Buffered reader for the Camelot ``ack:epid:len:payload`` framing used on
+both the command and the event sockets.
+'''
+from camelot import camlogger
+
+
+log = camlogger.getLogger(__name__)
+
+
+class FrameError(Exception):
+    pass
+
+
+class FrameReader(object):
+    '''Reads frames from a socket in large chunks into a reusable buffer and
+    slices complete frames out of it, instead of issuing one recv per header
+    character.
+
+    Data which is read past the end of a frame stays buffered for the next
+    call, and a socket timeout raised half way through a frame doesn't lose
+    what was already received. Without a socket, data can be pushed in with
+    feed() and the complete frames taken out with pop_frames().
+    '''
+    RECV_SIZE = 65536
+    HEADER_DELIM = b':'
+    HEADER_TOKENS = 3
+    MAX_HEADER_LEN = 64
+    HEX_TO_DIGIT_RADIX = 16
+
+    def __init__(self, sock, recv_size=RECV_SIZE):
+        self._sock = sock
+        self._chunk = bytearray(recv_size)
+        self._view = memoryview(self._chunk)
+        self._buf = bytearray()
+        self._pos = 0
+        self.eof = False
+
+    def buffered(self):
+        return len(self._buf) - self._pos
+
+    def _fill(self):
+        '''Reads one chunk from the socket into the buffer.
+
+        :returns: number of bytes read, 0 on end of stream
+        '''
+        nbytes = self._sock.recv_into(self._view)
+        if not nbytes:
+            self.eof = True
+        else:
+            self.feed(self._view[:nbytes])
+        return nbytes
+
+    def _take(self, nbytes):
+        '''Returns the next nbytes of the buffer decoded, the only copy
+        made of them.
+        '''
+        start = self._pos
+        self._pos += nbytes
+        return self._buf[start:self._pos].decode()
+
+    def read_exact(self, nbytes):
+        '''Returns exactly nbytes of data as string, or what could be read
+        before the end of stream.
+        '''
+        while self.buffered() < nbytes:
+            if not self._fill():
+                break
+        return self._take(min(nbytes, self.buffered()))
+
+    def read_line(self, delim=b'\n'):
+        '''Returns the data up to (excluding) delim as string. On end of
+        stream the remaining data is returned.
+        '''
+        while True:
+            idx = self._buf.find(delim, self._pos)
+            if idx != -1:
+                line = self._take(idx - self._pos)
+                self._pos += len(delim)
+                return line
+            if not self._fill():
+                return self._take(self.buffered())
+
+    def _parse_header(self):
+        '''Returns (ack, ep_id, payload_len, header_len) of the frame at the
+        head of the buffer, or None if the header is not complete yet.
+        '''
+        end = self._pos
+        for _ in range(FrameReader.HEADER_TOKENS):
+            end = self._buf.find(FrameReader.HEADER_DELIM, end)
+            if end == -1:
+                if self.buffered() > FrameReader.MAX_HEADER_LEN:
+                    raise FrameError('Invalid frame header: {!r}'.format(
+                        bytes(self._buf[self._pos:self._pos + 32])))
+                return None
+            end += 1
+        try:
+            tokens = self._buf[self._pos:end].decode().split(':')
+            ack = tokens[0].strip()
+            ep_id = tokens[1]
+            payload_len = int(tokens[2], FrameReader.HEX_TO_DIGIT_RADIX)
+        except ValueError:
+            raise FrameError('Invalid frame header: {!r}'.format(
+                bytes(self._buf[self._pos:end])))
+        return ack, ep_id, payload_len, end - self._pos
+
+    def feed(self, data):
+        '''Appends data received by other means to the buffer, the frames
+        in it are returned by :py:meth:`pop_frames`.
+        '''
+        if self._pos and self._pos >= len(self._buf) // 2:
+            del self._buf[:self._pos]
+            self._pos = 0
+        self._buf += data
+
+    def _next_frame(self):
+        '''Returns the frame at the head of the buffer, or None if it is not
+        complete yet.
+        '''
+        header = self._parse_header()
+        if header is None:
+            return None
+        ack, ep_id, payload_len, header_len = header
+        if self.buffered() < header_len + payload_len:
+            return None
+        self._pos += header_len
+        return ack, ep_id, self._take(payload_len)
+
+    def pop_frames(self):
+        '''Returns all the complete frames in the buffer, a partial frame
+        at the end stays buffered.
+        '''
+        frames = []
+        frame = self._next_frame()
+        while frame is not None:
+            frames.append(frame)
+            frame = self._next_frame()
+        return frames
+
+    def read_frames(self):
+        '''Returns every complete frame which is available after at most
+        one blocking recv, so a burst of events coalesced in one TCP segment
+        costs one call. Returns None on end of stream.
+        '''
+        frames = self.pop_frames()
+        while not frames:
+            if not self._fill():
+                return None
+            frames = self.pop_frames()
+        return frames
+
+    def wait_for_data(self):
+        '''Blocks until some data is buffered. Returns False on end of
+        stream.
+        '''
+        return bool(self.buffered() or self._fill())
+
+    def read_available(self):
+        '''Returns the complete frames after one recv on a socket which is
+        known to be readable, possibly none if only part of a frame came in.
+        Returns None on end of stream.
+        '''
+        if not self._fill():
+            return None
+        return self.pop_frames()
+
+    def read_frame(self):
+        '''Returns the next (ack, ep_id, message) frame, or None on end of
+        stream.
+        '''
+        frame = self._next_frame()
+        while frame is None:
+            if not self._fill():
+                return None
+            frame = self._next_frame()
+        return frame
@@ -0,0 +1,194 @@
+'''
+Latency histograms and error counters of the commands sent to a Camelot
+server.
+'''
+from bisect import bisect_left
+from threading import Lock
+import time
+
+
+class CommandTimer(object):
+    '''Timestamps of one command as it goes through the connection. The
+    send and receive paths fill in what they see, phases which don't apply
+    (e.g. first_byte on a pipelined command) stay None.
+    '''
+    __slots__ = ('start', 'lock_acquired', 'sent', 'first_byte', 'received',
+                 'failed', 'timed_out')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.lock_acquired = None
+        self.sent = None
+        self.first_byte = None
+        self.received = None
+        self.failed = False
+        self.timed_out = False
+
+    @staticmethod
+    def now():
+        return time.perf_counter()
+
+
+class Histogram(object):
+    '''Latency histogram with fixed buckets in milliseconds.'''
+    __slots__ = ('counts', 'count', 'total', 'max')
+    BOUNDS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500,
+                 1000, 2500, 5000, 10000)
+
+    def __init__(self):
+        self.counts = [0] * (len(Histogram.BOUNDS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value_ms):
+        self.counts[bisect_left(Histogram.BOUNDS_MS, value_ms)] += 1
+        self.count += 1
+        self.total += value_ms
+        if value_ms > self.max:
+            self.max = value_ms
+
+    def copy(self):
+        histogram = Histogram()
+        histogram.merge(self)
+        return histogram
+
+    def merge(self, other):
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def snapshot(self):
+        '''Returns count, sum_ms, avg_ms, max_ms and the cumulative bucket
+        counts keyed by their upper bound in ms, the last one being '+Inf'.
+        '''
+        buckets = {}
+        cumulative = 0
+        for bound, count in zip(Histogram.BOUNDS_MS + ('+Inf',), self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {'count': self.count,
+                'sum_ms': round(self.total, 3),
+                'avg_ms': round(self.total / self.count, 3)
+                if self.count else 0.0,
+                'max_ms': round(self.max, 3),
+                'buckets': buckets}
+
+
+class TransportStats(object):
+    '''Per request type latency histograms and error counters.
+
+    Phases measured, in milliseconds:
+        * lock_wait - waiting for the command socket (command_lock, the
+          pipeline or an idle generic socket)
+        * send - writing the command
+        * first_byte - end of the send to the first byte of the answer,
+          only for commands which read their own answer
+        * response - start of the send to the complete answer
+        * decode - decoding the answer
+        * total - the whole execute call
+
+    Errors counted:
+        * failed - no answer, the caller got the 'Unable to send/receive'
+          response
+        * timeout - no ACK within the timeout on a pipelined connection
+        * nack - the server answered with an 'N' ACK
+        * decode_error - decoding the answer raised
+    '''
+    PHASES = ('lock_wait', 'send', 'first_byte', 'response', 'decode',
+              'total')
+    ERRORS = ('failed', 'timeout', 'nack', 'decode_error')
+
+    def __init__(self):
+        self._lock = Lock()
+        self._requests = {}
+
+    def _request_entry(self, request):
+        entry = self._requests.get(request)
+        if entry is None:
+            entry = ({phase: Histogram() for phase in TransportStats.PHASES},
+                     dict.fromkeys(TransportStats.ERRORS, 0))
+            self._requests[request] = entry
+        return entry
+
+    def record(self, request, timer, decode_start=None, decode_end=None,
+               error=None):
+        '''Adds one command.
+
+        :parameter request: request type, e.g. 'getinfo'
+        :parameter timer: CommandTimer of the command
+        :parameter decode_start: time the decoding started, if decoded
+        :parameter decode_end: time the decoding ended
+        :parameter error: one of ERRORS, the failures recorded in the timer
+         are counted without it
+        '''
+        end = decode_end or timer.received or CommandTimer.now()
+        phases = [('total', end - timer.start)]
+        if timer.lock_acquired is not None:
+            phases.append(('lock_wait', timer.lock_acquired - timer.start))
+            if timer.sent is not None:
+                phases.append(('send', timer.sent - timer.lock_acquired))
+            if timer.received is not None:
+                phases.append(('response',
+                               timer.received - timer.lock_acquired))
+        if timer.first_byte is not None and timer.sent is not None:
+            phases.append(('first_byte', timer.first_byte - timer.sent))
+        if decode_start is not None and decode_end is not None:
+            phases.append(('decode', decode_end - decode_start))
+        with self._lock:
+            histograms, errors = self._request_entry(request)
+            for phase, seconds in phases:
+                histograms[phase].observe(seconds * 1000)
+            if timer.timed_out:
+                errors['timeout'] += 1
+            if timer.failed or timer.timed_out:
+                errors['failed'] += 1
+            if error:
+                errors[error] += 1
+
+    def merge(self, other):
+        '''Adds the counters of the TransportStats other to these ones.'''
+        with other._lock:
+            entries = [(request,
+                        {phase: histogram.copy()
+                         for phase, histogram in histograms.items()},
+                        dict(errors))
+                       for request, (histograms, errors)
+                       in other._requests.items()]
+        with self._lock:
+            for request, histograms, errors in entries:
+                own_histograms, own_errors = self._request_entry(request)
+                for phase, histogram in histograms.items():
+                    own_histograms[phase].merge(histogram)
+                for error, value in errors.items():
+                    own_errors[error] += value
+
+    def get_stats(self):
+        '''Returns the counters as a dictionary:\n
+            * commands - commands recorded
+            * errors - totals of the error counters
+            * requests - per request type: count, errors and latency, which
+              maps each phase to a histogram snapshot
+        '''
+        with self._lock:
+            requests = {}
+            totals = dict.fromkeys(TransportStats.ERRORS, 0)
+            commands = 0
+            for request, (histograms, errors) in self._requests.items():
+                count = histograms['total'].count
+                commands += count
+                for error, value in errors.items():
+                    totals[error] += value
+                requests[request] = {
+                    'count': count,
+                    'errors': dict(errors),
+                    'latency': {phase: histogram.snapshot()
+                                for phase, histogram in histograms.items()
+                                if histogram.count}}
+        return {'commands': commands, 'errors': totals, 'requests': requests}
+
+    def reset(self):
+        with self._lock:
+            self._requests = {}
@@ -0,0 +1,130 @@
+'''
+Cache of the read mostly queries of an endpoint (get_info, get_lines,
+get_calls and get_streams), see
+:py:meth:`camelot.endpoint.CamelotEndpoint.enable_query_cache`.
+'''
+import copy
+import time
+from threading import Lock
+
+import camelot
+from camelot.events import EventType, InfoEventType
+
+CACHED_REQUESTS = (camelot.GET_INFO, camelot.GET_LINES, camelot.GET_CALLS,
+                   camelot.GET_STREAMS)
+
+_INFO_LINES = (camelot.GET_INFO, camelot.GET_LINES)
+_INFO_CALLS = (camelot.GET_INFO, camelot.GET_CALLS, camelot.GET_STREAMS)
+_INFO_STREAMS = (camelot.GET_INFO, camelot.GET_STREAMS)
+
+# requests whose results an event changes, by (event_type, event_sub_type),
+# None standing for any sub type
+INVALIDATED_BY = {
+    (EventType.INFO_EVENT, InfoEventType.STATE): _INFO_LINES,
+    (EventType.INFO_EVENT, InfoEventType.CALLS): _INFO_CALLS,
+    (EventType.INFO_EVENT, None): (camelot.GET_INFO,),
+    (EventType.STREAMS, None): _INFO_STREAMS,
+    (EventType.CALL_EVENT, None): _INFO_CALLS,
+    (EventType.CALL_INFO_EVENT, None): _INFO_CALLS,
+    (EventType.STREAM_EVENT, None): (camelot.GET_STREAMS,),
+    (EventType.STREAM_INFO_EVENT, None): (camelot.GET_STREAMS,),
+    ('station', 'ccmreg'): _INFO_LINES,
+}
+
+# the subscriptions which let the events of INVALIDATED_BY through the
+# event reader
+SUBSCRIPTIONS = sorted(set((event_type, None if event_type == 'info'
+                            else event_sub_type)
+                           for event_type, event_sub_type in INVALIDATED_BY))
+
+
+def is_query(request):
+    '''Returns True for the requests which only read the endpoint (the get
+    requests), which leave the cached results valid.
+    '''
+    return request.startswith('get')
+
+
+def invalidated_requests(event_type, event_sub_type):
+    '''Returns the cached requests the event changes the result of.'''
+    requests = INVALIDATED_BY.get((event_type, event_sub_type))
+    if requests is None:
+        requests = INVALIDATED_BY.get((event_type, None), ())
+    return requests
+
+
+class QueryCache(object):
+    '''The results of the cached requests of one endpoint.
+
+    An entry lives until an event of the endpoint changes it (see
+    INVALIDATED_BY) or a request which is not a query (see is_query) is
+    sent for the endpoint, or for ttl seconds as a backstop for lost events.
+    Callers get a copy of the cached result, so they can change it.
+
+    A result read while an event invalidated its request is not stored: it
+    may have been produced before the change.
+    '''
+    DEFAULT_TTL = 5
+
+    def __init__(self, ttl=DEFAULT_TTL):
+        self.ttl = ttl
+        self._lock = Lock()
+        self._entries = {}
+        self._generations = dict((request, 0) for request in CACHED_REQUESTS)
+        self._counts = dict((request, {'hits': 0, 'misses': 0,
+                                       'invalidations': 0, 'expired': 0})
+                            for request in CACHED_REQUESTS)
+
+    def get(self, request):
+        '''Returns (True, result) on a hit, else (False, generation) where
+        generation is passed to :py:meth:`put` with the queried result.
+        '''
+        with self._lock:
+            counts = self._counts[request]
+            entry = self._entries.get(request)
+            if entry is not None:
+                if time.time() < entry[0]:
+                    counts['hits'] += 1
+                    result = entry[1]
+                    hit = True
+                else:
+                    del self._entries[request]
+                    counts['expired'] += 1
+                    hit = False
+            else:
+                hit = False
+            if not hit:
+                counts['misses'] += 1
+                return False, self._generations[request]
+        return True, copy.deepcopy(result)
+
+    def put(self, request, result, generation):
+        '''Caches the result of the request queried at generation.'''
+        if result is None:
+            return
+        result = copy.deepcopy(result)
+        with self._lock:
+            if self._generations[request] == generation:
+                self._entries[request] = (time.time() + self.ttl, result)
+
+    def invalidate(self, requests=CACHED_REQUESTS):
+        with self._lock:
+            for request in requests:
+                self._generations[request] += 1
+                if self._entries.pop(request, None) is not None:
+                    self._counts[request]['invalidations'] += 1
+
+    def invalidate_for(self, event):
+        '''Drops the results the event of the endpoint changes.'''
+        requests = invalidated_requests(event.event_type,
+                                        event.event_sub_type)
+        if requests:
+            self.invalidate(requests)
+
+    def get_stats(self):
+        '''Returns the hits, misses, invalidations and expired entries by
+        request.
+        '''
+        with self._lock:
+            return dict((request, dict(counts))
+                        for request, counts in self._counts.items())
@@ -0,0 +1,134 @@
+'''
+Local mirror of the state, calls and streams of an endpoint, kept up to
+date from its events, see
+:py:meth:`camelot.endpoint.CamelotEndpoint.enable_state_mirror`.
+'''
+from threading import Lock
+
+from camelot.events import EventType, InfoEventType, EndpointState
+
+ENDPOINT_STATES = frozenset(
+    value for key, value in vars(EndpointState).items()
+    if not key.startswith('_'))
+
+# call event states after which the call is gone from the endpoint
+ENDED_CALL_STATES = frozenset(['end', 'cleared', 'idle'])
+
+# call event sub types which report an operation on the call, not its state
+CALL_NOTIFICATIONS = frozenset(['sendreinvitecompleted'])
+
+# the subscriptions which let the mirrored events through the event reader
+SUBSCRIPTIONS = [(EventType.INFO_EVENT, None),
+                 (EventType.STREAMS, None),
+                 (EventType.CALL_EVENT, None)]
+
+_STATE = 'state'
+_CALLS = 'calls'
+_STREAMS = 'streams'
+
+
+def _count(tokens):
+    try:
+        return int(tokens[0])
+    except (IndexError, ValueError):
+        return None
+
+
+class StateMirror(object):
+    '''The state, calls and streams of one endpoint as its events tell.
+
+    The mirror is seeded from get_info and get_calls, then each info,
+    streams and call event of the endpoint is applied to it. A field changed
+    by an event while the seed was queried keeps the value of the event.
+    A field is None when the events don't tell its value, e.g. a state
+    event without the new state.
+    '''
+
+    def __init__(self):
+        self._lock = Lock()
+        self._versions = {_STATE: 0, _CALLS: 0, _STREAMS: 0}
+        self.state = None
+        self.call_count = None
+        self.stream_count = None
+        self._calls = {}
+
+    @property
+    def active_calls(self):
+        '''{call_ref: call state} of the calls of the endpoint.'''
+        with self._lock:
+            return dict(self._calls)
+
+    def versions(self):
+        '''Returns the versions to pass to :py:meth:`seed` with the results
+        queried after this call.
+        '''
+        with self._lock:
+            return dict(self._versions)
+
+    def seed(self, versions, info, calls):
+        '''Takes the fields not changed by an event since versions from the
+        get_info and get_calls results.
+        '''
+        with self._lock:
+            if info and self._versions[_STATE] == versions[_STATE]:
+                self.state = info.get('state')
+            if info and self._versions[_STREAMS] == versions[_STREAMS]:
+                self.stream_count = _count([info.get('streams')])
+            if calls is not None and \
+                    self._versions[_CALLS] == versions[_CALLS]:
+                self._calls = dict(
+                    (call.get('call_ref') or call.get('Ref'),
+                     call.get('state')) for call in calls)
+                self.call_count = len(self._calls)
+
+    def apply(self, event):
+        '''Updates the mirror with an event of the endpoint. A call event
+        which only reports an operation, e.g. sendreinvitecompleted, keeps
+        the last state of the call.
+
+        >>> from camelot.events import Event
+        >>> mirror = StateMirror()
+        >>> for raw in ('callevent 0aef0000 connected',
+        ...             'callevent 0aef0000 sendreinvitecompleted'):
+        ...     mirror.apply(Event.from_message(None, None, '00000001', raw))
+        >>> mirror.active_calls
+        {'0aef0000': 'connected'}
+        >>> mirror.apply(Event.from_message(None, None, '00000001',
+        ...                                 'callevent 0aef0000 end'))
+        >>> mirror.active_calls
+        {}
+        '''
+        event_type = event.event_type
+        if event_type == EventType.INFO_EVENT:
+            sub_type = event.event_sub_type
+            if sub_type == InfoEventType.STATE:
+                tokens = event.message_tokens
+                with self._lock:
+                    self._versions[_STATE] += 1
+                    self.state = (tokens[0] if tokens and
+                                  tokens[0] in ENDPOINT_STATES else None)
+            elif sub_type == InfoEventType.CALLS:
+                count = _count(event.message_tokens)
+                with self._lock:
+                    self._versions[_CALLS] += 1
+                    self.call_count = count
+                    if count == 0:
+                        self._calls = {}
+        elif event_type == EventType.STREAMS:
+            count = _count(event.message_tokens)
+            with self._lock:
+                self._versions[_STREAMS] += 1
+                self.stream_count = count
+        elif event_type == EventType.CALL_EVENT:
+            tokens = event.message_tokens
+            if len(tokens) < 2:
+                return
+            call_ref, state = tokens[0], ' '.join(tokens[1:])
+            if state in CALL_NOTIFICATIONS:
+                return
+            with self._lock:
+                self._versions[_CALLS] += 1
+                if state in ENDED_CALL_STATES:
+                    self._calls.pop(call_ref, None)
+                else:
+                    self._calls[call_ref] = state
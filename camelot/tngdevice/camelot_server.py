@@ -358,17 +358,7 @@ class CamelotServer(ABCDevice):
         if message is None:
             log.warning('No message passed to get Hex length')
             return
-        msg_len = len(message)
-        hex_val_in_str = hex(msg_len)
-        len_hex = len(hex_val_in_str)
-        if len_hex == 3:
-            hex_val_in_str = hex_val_in_str.replace('0x', '000')
-        if len_hex == 4:
-            hex_val_in_str = hex_val_in_str.replace('0x', '00')
-        elif len_hex == 5:
-            hex_val_in_str = hex_val_in_str.replace('0x', '0')
-        len_hex = len(hex_val_in_str)
-        return hex_val_in_str[(len_hex - 4):len_hex]
+        return VAPIEIUtils.get_message_length_hex(message)
 
     def create_message(self, message, msgobj='', media=''):
         '''Creates a SIP message based on the given parameters. msgid and
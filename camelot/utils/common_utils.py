@@ -4,7 +4,10 @@ Created on 08-Oct-2015
 @author: smaturi
 '''
 import time
+import heapq
+import itertools
 from collections import OrderedDict
+from threading import Condition, Thread
 import sys
 try:
     from threading import _get_ident as get_ind
@@ -26,6 +29,50 @@ def wait_until(func, expected_output=True, timeout=30, period=1, params=[]):
         timeout, func))
 
 
+class DeadlineTimer(object):
+    '''Calls functions at their deadline from one shared daemon thread, so
+    that thousands of pending timeouts don't need a Timer thread each.
+    Entries can't be cancelled, the called function should check whether
+    it still has something to do.
+    '''
+
+    def __init__(self):
+        self._cond = Condition()
+        self._heap = []
+        self._seq = itertools.count()
+        self._thread = None
+
+    def schedule(self, delay, func, *args):
+        with self._cond:
+            heapq.heappush(self._heap, (time.time() + delay, next(self._seq),
+                                        func, args))
+            if self._thread is None:
+                self._thread = Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                deadline = self._heap[0][0]
+                now = time.time()
+                if deadline > now:
+                    self._cond.wait(deadline - now)
+                    continue
+                deadline, seq, func, args = heapq.heappop(self._heap)
+            try:
+                func(*args)
+            except Exception:
+                pass
+
+
+deadline_timer = DeadlineTimer()
+
+
 class CamelotOrderedDict(OrderedDict):
     '''Overriding OrderedDict to get our own order displayed.
     '''
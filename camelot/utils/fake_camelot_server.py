@@ -0,0 +1,768 @@
+'''
+A fake Camelot server, to run the camelot package, BcgServer and VmonServer
+against on one box for load and regression benchmarks.
+
+It speaks the protocol of the Camelot server:
+
+* the vcclientversion/user handshake, answered with the event port,
+* the <type>:<epid>:<len>:<message> command frames, answered with
+  A:<epid>:<len>:<answer> (N for a failed command),
+* the event port, where it writes e:<epid>:<len>:<event> frames,
+* the non endpoint requests (os, vr, vv, cv, ex;) of the generic sockets.
+
+The answers are canned: endpoints are created by new_ep, configured by
+config, go through init/inservice/outofservice like a registering phone
+and place calls which connect after answer_time, with the events a
+Camelot server sends on the way. Any other request is answered from the
+responses parameter, or refused with a NACK.
+
+latency delays every answer, and event_storm writes events at a given
+rate to measure the events/sec of a client.
+
+>>> from camelot.utils.fake_camelot_server import FakeCamelotServer
+>>> fake = FakeCamelotServer(('127.0.0.1', 0), latency=0.002).start()
+>>> serv = camelot.create_camelot_server('127.0.0.1', fake.port)
+>>> ep = serv.create_new_endpoint('sipv2', 'SEP000000000001')
+>>> ep.init()
+'outofservice'
+>>> fake.event_storm(100000, rate=20000).join()
+>>> fake.stop()
+
+or standalone:
+
+    python -m camelot.utils.fake_camelot_server --port 5001 --latency 0.002
+'''
+import getopt
+import heapq
+import json
+import random
+import socket
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from camelot import camlogger
+from camelot.protocol.tcp.frame_reader import FrameReader
+from camelot.utils.vapi_ei_utils import VAPIEIUtils
+
+if sys.version_info < (3, 0):
+    import SocketServer as socketserver
+else:
+    import socketserver
+
+log = camlogger.getLogger(__name__)
+
+SERVER_EP_ID = '00000000'
+CALL_REF_BASE = 0xeff5c000
+STREAM_REF_BASE = 0x0a57c000
+
+# the events of the synthetic stream of benchmarks/event_stream_replay.py
+STORM_EVENTS = ('state inservice',
+                'station 17:27:33:314 ccmreg {registration ok} 10.20.1.21',
+                'station 17:27:34:001 ring 1',
+                'callevent 0aef0000 connected',
+                'calls 2',
+                'station 17:27:35:120 prompt {Your current options}')
+
+
+def _tcl_word(value):
+    value = str(value)
+    if not value or ' ' in value:
+        return '{%s}' % value
+    return value
+
+
+def _tcl_pairs(pairs):
+    '''TCL list of the key value pairs, like the getinfo answer
+    "{state inservice} {{primary cm} 10.20.1.21}".
+    '''
+    return ' '.join('{%s %s}' % (_tcl_word(key), _tcl_word(value))
+                    for key, value in pairs.items())
+
+
+def _render(output_format, pairs):
+    if output_format == 'json':
+        return json.dumps(pairs)
+    return _tcl_pairs(pairs)
+
+
+def _render_list(output_format, rows):
+    '''The getcalls/getlines/getstreams answer of the rows, JSON_LIST or a
+    TCL list of the row values.
+    '''
+    if output_format == 'json':
+        return json.dumps({'JSON_LIST': rows})
+    return ' '.join('{%s}' % ' '.join(row.values()) for row in rows)
+
+
+class FakeCall(object):
+
+    def __init__(self, call_ref, called):
+        self.call_ref = call_ref
+        self.called = called
+        self.state = 'proceeding'
+        self.streams = []
+
+
+class FakeEndpoint(object):
+    '''State of an endpoint created on the fake server.'''
+
+    def __init__(self, ep_id, ep_type, args, session):
+        self.ep_id = ep_id
+        self.ep_type = ep_type
+        self.args = args
+        # the session which created the endpoint gets its events
+        self.session = session
+        self.state = 'uninitialized'
+        self.config = {}
+        self.calls = OrderedDict()
+
+    def info(self):
+        streams = sum(len(call.streams) for call in self.calls.values())
+        return OrderedDict([
+            ('state', self.state),
+            ('type', self.ep_type),
+            ('description', self.config.get('description', '')),
+            ('lines', '1'),
+            ('calls', str(len(self.calls))),
+            ('streams', str(streams)),
+            ('primary cm', self.config.get('tftpip', '')),
+            ('id', str(int(self.ep_id, 16))),
+            ('userid', self.config.get('userid', '')),
+            ('mac', self.args[0] if self.args else '')])
+
+    def lines(self):
+        dn = self.config.get('dn', str(7000 + int(self.ep_id, 16)))
+        return [OrderedDict([
+            ('line_num', '1'),
+            ('full_address', '{}@{}:5060'.format(
+                dn, self.config.get('tftpip', '127.0.0.1')))])]
+
+    def call_rows(self):
+        return [OrderedDict([('call_ref', call.call_ref),
+                             ('line_ref', '1'),
+                             ('state', call.state)])
+                for call in self.calls.values()]
+
+    def call_info(self, call):
+        return OrderedDict([
+            ('call reference', call.call_ref),
+            ('line reference', '1'),
+            ('type', 'outbound'),
+            ('state', call.state),
+            ('calling address', self.lines()[0]['full_address'].split('@')[0]),
+            ('called address', call.called)])
+
+    def stream_info(self, call, stream_ref, direction):
+        remote = '127.0.0.1:%d' % (20000 + int(stream_ref, 16) % 10000)
+        return OrderedDict([
+            ('address', remote),
+            ('local_address', '127.0.0.1:22000'),
+            ('remote_address', remote),
+            ('stream reference', stream_ref),
+            ('call reference', call.call_ref),
+            ('type', 'audio'),
+            ('transport', 'rtp'),
+            ('direction', direction),
+            ('state', 'open'),
+            ('codec', 'g711u'),
+            ('mifctype', 'line')])
+
+    def stream_rows(self):
+        return [OrderedDict([('stream_ref', stream_ref),
+                             ('call_ref', call.call_ref),
+                             ('type', 'audio'),
+                             ('direction', direction),
+                             ('state', 'open'),
+                             ('mifctype', 'line')])
+                for call in self.calls.values()
+                for stream_ref, direction in call.streams]
+
+
+class FakeCamelotRequestHandler(socketserver.BaseRequestHandler):
+    '''One client connection: a command session with its event socket after
+    the version handshake, else a generic socket.
+    '''
+
+    def setup(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = FrameReader(self.request)
+        self.send_lock = threading.Lock()
+        self.event_sock = None
+        self.event_lock = threading.Lock()
+        self.output_format = 'tcl'
+        self.commands = 0
+        self.events = 0
+
+    def handle(self):
+        command = self.reader.read_exact(2)
+        if command != 'vc':
+            self.handle_generic(command)
+            return
+        if not self.hand_shake():
+            return
+        self.server._add_session(self)
+        try:
+            frame = self.reader.read_frame()
+            while frame is not None:
+                self.handle_command(*frame)
+                frame = self.reader.read_frame()
+        except Exception as e:
+            log.debug('fake camelot session %s closed: %s',
+                      self.client_address, e)
+        finally:
+            self.server._remove_session(self)
+
+    def finish(self):
+        if self.event_sock:
+            try:
+                self.event_sock.close()
+            except Exception:
+                pass
+
+    def hand_shake(self):
+        '''Reads the client version and the user, answers with the event
+        port and accepts the event connection of the client on it.
+        '''
+        if self.reader.read_exact(len('clientversion:')) != 'clientversion:':
+            return False
+        version = self.reader.read_exact(int(self.reader.read_line(b':')))
+        self.reply_raw('a')
+        user = self.reader.read_exact(int(self.reader.read_exact(4)))
+        log.debug('fake camelot session from %s, version %s, user %s',
+                  self.client_address, version, user)
+
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            listener.bind((self.server.server_address[0], 0))
+            listener.listen(1)
+            listener.settimeout(self.server.SOCKET_TIMEOUT)
+            self.reply_raw('%04x' % listener.getsockname()[1])
+            self.event_sock, addr = listener.accept()
+        except socket.error as e:
+            log.error('fake camelot: no event connection from %s: %s',
+                      self.client_address, e)
+            return False
+        finally:
+            listener.close()
+        self.event_sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return True
+
+    def handle_generic(self, command):
+        '''Answers the non endpoint requests, one line each.'''
+        while command:
+            command += self.reader.read_exact(self.reader.buffered())
+            answer = self.server.generic_answer(command.strip())
+            if answer is None:
+                return
+            self.reply_raw(answer + '\n')
+            command = self.reader.read_exact(1)
+
+    def handle_command(self, msg_type, ep_id, message):
+        self.commands += 1
+        words = message.rstrip('@').split()
+        request = words[0] if words else ''
+        args = words[1:]
+        server = self.server
+        ack = 'A'
+        try:
+            if msg_type == 'c':
+                # new_ep: <ep type> <mac or arguments>@
+                if not request:
+                    raise FakeCommandError('endpoint type is not specified')
+                ep_id = server.create_endpoint(request, args, self).ep_id
+                answer = ''
+            else:
+                answer = server.canned_answer(self, request, ep_id, args)
+        except FakeCommandError as e:
+            ack, answer = 'N', str(e)
+        server.schedule_reply(self, ack, ep_id, answer)
+
+    def reply(self, ack, ep_id, answer):
+        payload = answer.encode()
+        data = b'%s:%s:%04x:' % (ack.encode(), ep_id.encode(),
+                                 len(payload) & 0xFFFF)
+        self.reply_raw(data + payload)
+
+    def reply_raw(self, data):
+        if not isinstance(data, bytes):
+            data = data.encode()
+        with self.send_lock:
+            self.request.sendall(data)
+
+    def send_events(self, data, count=1):
+        '''Writes the e:<epid>:<len>:<event> frames of data on the event
+        socket.
+        '''
+        if not self.event_sock:
+            return
+        with self.event_lock:
+            try:
+                self.event_sock.sendall(data)
+            except socket.error:
+                return
+            self.events += count
+
+    def send_event(self, ep_id, event):
+        payload = event.encode()
+        self.send_events(b'e:%s:%04x:' % (ep_id.encode(), len(payload)) +
+                         payload)
+
+
+class FakeCommandError(Exception):
+    '''A command the fake server answers with a NACK.'''
+
+
+class FakeCamelotServer(socketserver.ThreadingTCPServer, object):
+    '''The fake Camelot server.
+
+    :parameter server_address: (ip, port), port 0 picks a free one
+    :parameter latency: seconds every answer is delayed by, or a
+                        (min, max) tuple for a random delay. The answers of
+                        one endpoint keep their order.
+    :parameter output_format: 'json' to take the setjson of the client,
+                              'tcl' to refuse it
+    :parameter register_time: seconds from inservice to the inservice state
+    :parameter answer_time: seconds from placecall to the connected call
+    :parameter responses: answer of other requests, a string or a function
+                          called with the FakeEndpoint (None for a server
+                          level request) and the request arguments
+
+    An endpoint request is answered by the do_<request> method, which
+    returns the answer or raises FakeCommandError for a NACK.
+
+    >>> fake = FakeCamelotServer(('127.0.0.1', 5001),
+    ...                          responses={'getcallstats': '{jitter 2}'})
+    >>> fake.start()
+    '''
+    allow_reuse_address = True
+    daemon_threads = True
+    block_on_close = False
+    SOCKET_TIMEOUT = 10
+    SERVER_OS = 'Linux'
+    SERVER_VERSION = '14.0.37.0.0.0'
+
+    def __init__(self, server_address, latency=0, output_format='json',
+                 register_time=0.05, answer_time=0.05, responses=None,
+                 handler_class=FakeCamelotRequestHandler):
+        super(FakeCamelotServer, self).__init__(server_address, handler_class)
+        self.latency = latency
+        self.output_format = output_format
+        self.register_time = register_time
+        self.answer_time = answer_time
+        self.responses = dict(responses or {})
+        self.endpoints = {}
+        self.sessions = []
+        self._lock = threading.Lock()
+        self._next_ep = 0
+        self._next_call = 0
+        self._timers = []
+        self._timer_seq = 0
+        self._timer_cond = threading.Condition(self._lock)
+        # answers of an endpoint are not sent before the earlier ones
+        self._last_due = {}
+        self._thread = None
+        self._stopped = False
+        timer_thread = threading.Thread(target=self._run_timers,
+                                        name='fake-camelot-timers')
+        timer_thread.daemon = True
+        timer_thread.start()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        '''Serves from a daemon thread, returns the server.'''
+        self._thread = threading.Thread(
+            target=self.serve_forever, name='fake-camelot-{}'.format(
+                self.port))
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        '''Stops serving and closes the sessions, the clients see the server
+        going down.
+        '''
+        if self._thread:
+            self.shutdown()
+        with self._lock:
+            self._stopped = True
+            sessions = list(self.sessions)
+            self._timer_cond.notify()
+        for session in sessions:
+            for sock in (session.request, session.event_sock):
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except Exception:
+                    pass
+        self.server_close()
+
+    def get_stats(self):
+        '''Returns the sessions, endpoints, commands answered and events
+        sent.
+        '''
+        with self._lock:
+            sessions = list(self.sessions)
+            endpoints = len(self.endpoints)
+        return {'sessions': len(sessions),
+                'endpoints': endpoints,
+                'commands': sum(session.commands for session in sessions),
+                'events': sum(session.events for session in sessions)}
+
+    def _add_session(self, session):
+        with self._lock:
+            self.sessions.append(session)
+
+    def _remove_session(self, session):
+        with self._lock:
+            if session in self.sessions:
+                self.sessions.remove(session)
+            for ep_id in [ep.ep_id for ep in self.endpoints.values()
+                          if ep.session is session]:
+                del self.endpoints[ep_id]
+
+    def _run_timers(self):
+        with self._lock:
+            while not self._stopped:
+                if not self._timers:
+                    self._timer_cond.wait()
+                    continue
+                due, seq, fn, args = self._timers[0]
+                delay = due - time.time()
+                if delay > 0:
+                    self._timer_cond.wait(delay)
+                    continue
+                heapq.heappop(self._timers)
+                self._lock.release()
+                try:
+                    fn(*args)
+                except Exception as e:
+                    log.debug('fake camelot timer failed: %s', e)
+                finally:
+                    self._lock.acquire()
+
+    def call_later(self, delay, fn, *args):
+        '''Calls fn(*args) from the timer thread after delay seconds.'''
+        due = time.time() + delay
+        with self._lock:
+            self._timer_seq += 1
+            heapq.heappush(self._timers, (due, self._timer_seq, fn, args))
+            self._timer_cond.notify()
+
+    def _delay(self):
+        if isinstance(self.latency, (tuple, list)):
+            return random.uniform(*self.latency)
+        return self.latency
+
+    def schedule_reply(self, session, ack, ep_id, answer):
+        delay = self._delay()
+        if not delay:
+            session.reply(ack, ep_id, answer)
+            return
+        key = (id(session), ep_id)
+        with self._lock:
+            due = max(time.time() + delay, self._last_due.get(key, 0))
+            self._last_due[key] = due
+            self._timer_seq += 1
+            heapq.heappush(self._timers, (due, self._timer_seq,
+                                          session.reply, (ack, ep_id, answer)))
+            self._timer_cond.notify()
+
+    def create_endpoint(self, ep_type, args, session):
+        with self._lock:
+            self._next_ep += 1
+            ep = FakeEndpoint('%08x' % self._next_ep, ep_type, args, session)
+            self.endpoints[ep.ep_id] = ep
+        return ep
+
+    def generic_answer(self, command):
+        '''Answer of a generic socket request, None to close the socket.'''
+        answers = {'os': self.SERVER_OS,
+                   'vr': self.SERVER_VERSION,
+                   'vv': VAPIEIUtils.CLIENT_VERSION}
+        if command == 'ex;':
+            return None
+        if command == 'cv':
+            versions = OrderedDict([('VAPIEI', VAPIEIUtils.CLIENT_VERSION),
+                                    ('CUCM', '14.0.1')])
+            return _render(self.output_format, versions)
+        answer = answers.get(command, '')
+        if self.output_format == 'json':
+            return json.dumps(answer)
+        return answer
+
+    def canned_answer(self, session, request, ep_id, args):
+        '''Answer of the request, raises FakeCommandError for a NACK.'''
+        ep = self.endpoints.get(ep_id)
+        if request in self.responses:
+            answer = self.responses[request]
+            if callable(answer):
+                return answer(ep, args)
+            return answer
+        if request == 'outputformat':
+            if args and args[0] == 'setjson' and self.output_format == 'json':
+                session.output_format = 'json'
+            return session.output_format
+        if ep is None:
+            if ep_id == SERVER_EP_ID:
+                raise FakeCommandError(
+                    'unsupported request: {}'.format(request))
+            raise FakeCommandError('invalid endpoint: {}'.format(ep_id))
+        handler = getattr(self, 'do_' + request, None)
+        if handler is None:
+            raise FakeCommandError('unsupported request: {}'.format(request))
+        return handler(session, ep, args)
+
+    def set_state(self, ep, state):
+        ep.state = state
+        ep.session.send_event(ep.ep_id, 'state ' + state)
+
+    def do_config(self, session, ep, args):
+        if not args:
+            raise FakeCommandError('config parameter is not specified')
+        # config <param> [value <value>]
+        if len(args) > 2 and args[1] == 'value':
+            ep.config[args[0]] = ' '.join(args[2:])
+        return ep.config.get(args[0], '')
+
+    def do_init(self, session, ep, args):
+        if ep.state == 'uninitialized':
+            self.set_state(ep, 'outofservice')
+        return ep.state
+
+    def do_uninit(self, session, ep, args):
+        self.set_state(ep, 'uninitialized')
+        return ep.state
+
+    def do_inservice(self, session, ep, args):
+        if ep.state == 'outofservice':
+            self.set_state(ep, 'inservicepending')
+            self.call_later(self.register_time, self._registered, ep)
+        return ep.state
+
+    def _registered(self, ep):
+        if ep.state == 'inservicepending':
+            self.set_state(ep, 'inservice')
+
+    def do_outofservice(self, session, ep, args):
+        for call_ref in list(ep.calls):
+            self._end_call(ep, call_ref)
+        self.set_state(ep, 'outofservice')
+        return ep.state
+
+    def do_releaseep(self, session, ep, args):
+        with self._lock:
+            self.endpoints.pop(ep.ep_id, None)
+        return 'success'
+
+    def do_infoevent(self, session, ep, args):
+        # the events are sent whether they were turned on or not
+        return '1'
+
+    do_callevent = do_streamevent = do_infoevent
+    do_startstationevents = do_stopstationevents = do_infoevent
+
+    def do_getinfo(self, session, ep, args):
+        return _render(session.output_format, ep.info())
+
+    def do_getlines(self, session, ep, args):
+        return _render_list(session.output_format, ep.lines())
+
+    def do_getcalls(self, session, ep, args):
+        return _render_list(session.output_format, ep.call_rows())
+
+    def do_getstreams(self, session, ep, args):
+        return _render_list(session.output_format, ep.stream_rows())
+
+    def _call(self, ep, args):
+        call = ep.calls.get(args[0]) if args else None
+        if call is None:
+            raise FakeCommandError('invalid call reference')
+        return call
+
+    def do_getcallinfo(self, session, ep, args):
+        return _render(session.output_format,
+                       ep.call_info(self._call(ep, args)))
+
+    def do_getstreaminfo(self, session, ep, args):
+        for call in ep.calls.values():
+            for stream_ref, direction in call.streams:
+                if args and stream_ref == args[0]:
+                    return _render(session.output_format,
+                                   ep.stream_info(call, stream_ref,
+                                                  direction))
+        raise FakeCommandError('invalid stream reference')
+
+    def do_placecall(self, session, ep, args):
+        if ep.state != 'inservice':
+            raise FakeCommandError('endpoint {} is {}'.format(ep.ep_id,
+                                                              ep.state))
+        with self._lock:
+            self._next_call += 1
+            call_ref = '0x%08x' % (CALL_REF_BASE + self._next_call)
+        called = args[1].rstrip('^') if len(args) > 1 else ''
+        ep.calls[call_ref] = FakeCall(call_ref, called)
+        ep.session.send_event(ep.ep_id, 'calls %s' % len(ep.calls))
+        ep.session.send_event(ep.ep_id, 'callevent %s proceeding' % call_ref)
+        self.call_later(self.answer_time, self._connected, ep, call_ref)
+        return call_ref
+
+    def _connected(self, ep, call_ref):
+        call = ep.calls.get(call_ref)
+        if call is None or call.state != 'proceeding':
+            return
+        call.state = 'connected'
+        with self._lock:
+            refs = [STREAM_REF_BASE + self._next_call * 2 + i
+                    for i in range(2)]
+        call.streams = [('0x%08x' % refs[0], 'inbound'),
+                        ('0x%08x' % refs[1], 'outbound')]
+        ep.session.send_event(ep.ep_id, 'callevent %s connected' % call_ref)
+        ep.session.send_event(ep.ep_id, 'streams %s' % len(ep.stream_rows()))
+
+    def _end_call(self, ep, call_ref):
+        call = ep.calls.pop(call_ref, None)
+        if call is None:
+            raise FakeCommandError('invalid call reference: {}'.format(
+                call_ref))
+        ep.session.send_event(ep.ep_id, 'callevent %s cleared' % call_ref)
+        ep.session.send_event(ep.ep_id, 'calls %s' % len(ep.calls))
+        if call.streams:
+            ep.session.send_event(ep.ep_id,
+                                  'streams %s' % len(ep.stream_rows()))
+
+    def do_endcall(self, session, ep, args):
+        if not args:
+            raise FakeCommandError('call reference is not specified')
+        self._end_call(ep, args[0])
+        return '1'
+
+    def _set_call_state(self, ep, args, state):
+        call = self._call(ep, args)
+        call.state = state
+        ep.session.send_event(ep.ep_id, 'callevent %s %s' % (call.call_ref,
+                                                             state))
+        return '1'
+
+    def do_hold(self, session, ep, args):
+        return self._set_call_state(ep, args, 'hold')
+
+    def do_resume(self, session, ep, args):
+        return self._set_call_state(ep, args, 'connected')
+
+    def event_storm(self, count, rate=None, events=STORM_EVENTS,
+                    ep_ids=None, batch=256):
+        '''Sends count events from a new thread, round robin over ep_ids
+        and events.
+
+        :parameter count: number of events
+        :parameter rate: events per second, None to send them as fast as
+                         the clients read them
+        :parameter events: the event messages, e.g. 'state inservice'
+        :parameter ep_ids: endpoints of the events, default the endpoints
+                           created on the server. The events of an endpoint
+                           go to the session which created it, the ones of
+                           an id the server doesn't know to every session.
+        :parameter batch: events written together at full speed
+
+        :returns: the started thread, join() waits for the last event
+
+        >>> fake.event_storm(100000, rate=20000).join()
+        '''
+        with self._lock:
+            if ep_ids is None:
+                ep_ids = sorted(self.endpoints) or [SERVER_EP_ID]
+            owners = dict((ep_id, [self.endpoints[ep_id].session])
+                          for ep_id in ep_ids if ep_id in self.endpoints)
+            sessions = list(self.sessions)
+        targets = [owners.get(ep_id, sessions) for ep_id in ep_ids]
+        frames = []
+        for event in events:
+            payload = event.encode()
+            frames.append([b'e:%s:%04x:' % (ep_id.encode(), len(payload)) +
+                           payload for ep_id in ep_ids])
+
+        def storm():
+            started = time.time()
+            sent = 0
+            while sent < count:
+                size = min(batch, count - sent)
+                if rate:
+                    # at most 10ms worth of events per write
+                    size = min(size, max(1, int(rate / 100)))
+                    delay = started + float(sent) / rate - time.time()
+                    if delay > 0:
+                        time.sleep(delay)
+                out = {}
+                for i in range(sent, sent + size):
+                    index = i % len(ep_ids)
+                    frame = frames[i % len(frames)][index]
+                    for session in targets[index]:
+                        out.setdefault(session, []).append(frame)
+                for session, session_frames in out.items():
+                    session.send_events(b''.join(session_frames),
+                                        len(session_frames))
+                sent += size
+        thread = threading.Thread(target=storm, name='fake-camelot-storm')
+        thread.daemon = True
+        thread.start()
+        return thread
+
+
+def start_server(ip=None, port=None, *args, **kwargs):
+    ''' start_server
+    starts the fake Camelot server in the given ip and port and serves
+    until interrupted. kwargs are the parameters of FakeCamelotServer.
+    example: camelot.utils.fake_camelot_server.start_server('0.0.0.0', 5001)
+    '''
+    if ip is None:
+        ip = '0.0.0.0'
+    if port is None:
+        port = 5001
+    fake_server = FakeCamelotServer((ip, port), **kwargs)
+    msg = 'fake camelot server listening on {}'.format(fake_server.port)
+    if __name__ == '__main__':
+        print(msg)
+    else:
+        log.info(msg)
+    try:
+        fake_server.serve_forever()
+    except KeyboardInterrupt:
+        log.debug('fake camelot server is stopped by the user')
+    finally:
+        fake_server.server_close()
+
+
+def main(argv):
+    opts, arg = getopt.getopt(
+        argv, "h:p:l:", ['port=', 'help', 'host=', 'loglevel=', 'latency=',
+                         'tcl'])
+
+    ip = None
+    port = None
+    kwargs = {}
+    for opt, arg in opts:
+        if opt == '--help':
+            print('fake_camelot_server.py --host <ip> --port <port> '
+                  '--latency <seconds> [--tcl] --loglevel <LEVEL>')
+            sys.exit()
+        if opt in ('-p', '--port'):
+            port = int(arg)
+        if opt in ('-h', '--host'):
+            ip = str(arg)
+        if opt == '--latency':
+            kwargs['latency'] = float(arg)
+        if opt == '--tcl':
+            kwargs['output_format'] = 'tcl'
+        if opt in ('-l', '--loglevel'):
+            camlogger.setLevel(arg)
+
+    start_server(ip, port, **kwargs)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
+    sys.exit()
@@ -178,14 +178,12 @@ class VAPIEIUtils(object):
 
     @staticmethod
     def get_message_length_hex(message):
-        msg_len = len(message)
-        hex_val_in_str = hex(msg_len)
-        len_hex = len(hex_val_in_str)
-        if len_hex == 3:
-            hex_val_in_str = hex_val_in_str.replace('0x', '000')
-        if len_hex == 4:
-            hex_val_in_str = hex_val_in_str.replace('0x', '00')
-        elif len_hex == 5:
-            hex_val_in_str = hex_val_in_str.replace('0x', '0')
-        len_hex = len(hex_val_in_str)
-        return hex_val_in_str[(len_hex - 4):len_hex]
+        '''
+        Returns the length field of a Camelot frame: the message length as
+        exactly 4 lower case hexadecimal digits, the low 16 bits of it for
+        longer messages.
+
+        >>> VAPIEIUtils.get_message_length_hex('getinfo@')
+        '0008'
+        '''
+        return '%04x' % (len(message) & 0xFFFF)
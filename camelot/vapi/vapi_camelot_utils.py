@@ -42,7 +42,7 @@ class CamelotVapiUtils(object):
 
     def _query_camelot(self, request, *args, **kwargs):
         self._is_valid_object()
-        encoded_msg = encoder.encode(
+        encoded_msg = encoder.encode_frame(
             request, self.ep_id, *args, **kwargs)
         res = self._get_server_conn().execute_camelot_command(
             request, encoded_msg, request_type='ep')